@@ -54,25 +54,36 @@ def udev_get_device(sysfs_path):
 
 def udev_get_devices(deviceClass="block"):
     udev_settle()
+    return udev_get_devices_bulk(deviceClass)
+
+def udev_get_devices_bulk(deviceClass="block"):
+    """ Return the udev db entries of all devices of a class.
+
+        The entries are the same as udev_get_device would return, but they
+        are all read while walking a single udev enumeration.
+    """
     entries = []
-    for path in udev_enumerate_devices(deviceClass):
-        entry = udev_get_device(path)
-        if entry:
-            entries.append(entry)
+    for dev in global_udev.scan_devices_bulk(subsystem=deviceClass):
+        dev["name"] = dev.sysname
+        dev["sysfs_path"] = dev.syspath[4:]
+        entries.append(udev_parse_uevent_file(dev))
+
     return entries
 
 def udev_parse_uevent_file(dev):
     path = os.path.normpath("/sys/%s/uevent" % dev['sysfs_path'])
-    if not os.access(path, os.R_OK):
+    try:
+        f = open(path)
+    except IOError:
         return dev
 
-    with open(path) as f:
-        for line in f.readlines():
+    with f:
+        for line in f:
             (key, equals, value) = line.strip().partition("=")
             if not equals:
                 continue
 
-            dev[key] = value
+            dev[intern(key)] = value
 
     return dev
 
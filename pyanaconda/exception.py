@@ -106,6 +106,7 @@ def initExceptionHandling(anaconda):
                   programVersion=isys.getAnacondaVersion(),
                   attrSkipList=[ "backend.ayum",
                                  "backend.dlpkgs",
+                                 "backend.pkgSizes",
                                  "accounts",
                                  "bootloader.password",
                                  "comps",
@@ -117,6 +118,7 @@ def initExceptionHandling(anaconda):
                                  "instLanguage.info",
                                  "instLanguage.localeInfo",
                                  "instLanguage.nativeLangNames",
+                                 "instLanguage._index",
                                  "instLanguage.tz",
                                  "keyboard._mods._modelDict",
                                  "keyboard.modelDict",
@@ -0,0 +1,259 @@
+#
+# fastcopy.py - copy large amounts of data between file descriptors
+#
+# Copyright (C) 2010  Red Hat, Inc.  All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import ctypes
+import fcntl
+import io
+import os
+import struct
+import time
+from errno import *
+
+import logging
+log = logging.getLogger("anaconda")
+
+# how much data to move with a single system call
+COPY_CHUNK = 8 * 1024 * 1024
+
+# minimum number of seconds between two progress updates
+PROGRESS_INTERVAL = 0.25
+
+# lseek whence values for finding the data in sparse files
+SEEK_DATA = 3
+SEEK_HOLE = 4
+
+# ioctl for zeroing a range of a block device, from linux/fs.h
+BLKZEROOUT = 0x127f
+
+# errors that mean a copy method can't be used for these descriptors
+_UNSUPPORTED = (ENOSYS, EXDEV, EINVAL, EOPNOTSUPP, ENOTSUP, EBADF)
+
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+except OSError:
+    _libc = None
+
+def _bind(name, argtypes):
+    func = getattr(_libc, name, None)
+    if func is not None:
+        func.restype = ctypes.c_ssize_t
+        func.argtypes = argtypes
+    return func
+
+_loff_p = ctypes.POINTER(ctypes.c_longlong)
+_copy_file_range = _bind("copy_file_range",
+                         [ctypes.c_int, _loff_p, ctypes.c_int, _loff_p,
+                          ctypes.c_size_t, ctypes.c_uint])
+_sendfile = _bind("sendfile64",
+                  [ctypes.c_int, ctypes.c_int, _loff_p, ctypes.c_size_t])
+
+def _extents(fd, size):
+    """ Generate (start, end, isData) tuples covering the first size bytes
+        of fd, using SEEK_DATA and SEEK_HOLE to find the holes in it.
+    """
+    offset = 0
+    while offset < size:
+        try:
+            data = os.lseek(fd, offset, SEEK_DATA)
+        except OSError as e:
+            # ENXIO means there is no more data, anything else means we
+            # can't tell so all of it has to be treated as data
+            yield (offset, size, e.errno != ENXIO)
+            return
+
+        data = min(data, size)
+        if data > offset:
+            yield (offset, data, False)
+        if data == size:
+            return
+
+        try:
+            hole = min(os.lseek(fd, data, SEEK_HOLE), size)
+        except OSError:
+            hole = size
+
+        yield (data, hole, True)
+        offset = hole
+
+class _Copier(object):
+    def __init__(self, srcfd, dstfd, size, progress=None, sparse=False):
+        self.srcfd = srcfd
+        self.dstfd = dstfd
+        self.chunk = max(min(size, COPY_CHUNK), 1)
+        self.progress = progress
+        self.sparse = sparse
+        self.copied = 0
+        self.lastUpdate = 0
+
+        self.methods = []
+        if _copy_file_range:
+            self.methods.append(self._copyFileRange)
+        if _sendfile:
+            self.methods.append(self._sendfile)
+        self.methods.append(self._readWrite)
+        self.worked = set()
+
+        self.zeroout = True
+        self._buf = None
+        self._zeros = None
+
+    def _buffers(self):
+        if self._buf is None:
+            self._buf = bytearray(self.chunk)
+            self._zeros = bytearray(self.chunk)
+        return (self._buf, self._zeros)
+
+    def _advance(self, count):
+        self.copied += count
+        now = time.time()
+        if self.progress and now - self.lastUpdate >= PROGRESS_INTERVAL:
+            self.progress(self.copied)
+            self.lastUpdate = now
+
+    def _write(self, buf):
+        view = memoryview(buf)
+        while len(view):
+            written = os.write(self.dstfd, view)
+            if not written:
+                raise RuntimeError, "error copying filesystem!"
+            view = view[written:]
+
+    def copy(self, start, end):
+        """ Copy the bytes from start to end with the best method that works. """
+        while start < end:
+            method = self.methods[0]
+            try:
+                done = method(start, end)
+            except OSError as e:
+                # only give up on a method if it hasn't copied anything yet
+                if e.errno not in _UNSUPPORTED or len(self.methods) == 1 or \
+                   method.__name__ in self.worked:
+                    raise
+                log.debug("fastcopy: %s not usable: %s" % (method.__name__, e))
+                self.methods.pop(0)
+                continue
+
+            self.worked.add(method.__name__)
+            if not done:
+                # the source ended before we expected it to
+                raise IOError(EIO, "unexpected end of data at %d" % start)
+
+            start += done
+
+    def _checkCall(self, ret):
+        if ret < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._advance(ret)
+        return ret
+
+    def _copyFileRange(self, start, end):
+        src = ctypes.c_longlong(start)
+        dst = ctypes.c_longlong(start)
+        ret = _copy_file_range(self.srcfd, ctypes.byref(src),
+                               self.dstfd, ctypes.byref(dst),
+                               min(end - start, COPY_CHUNK), 0)
+        return self._checkCall(ret)
+
+    def _sendfile(self, start, end):
+        # sendfile writes at the destination's file position
+        os.lseek(self.dstfd, start, 0)
+        src = ctypes.c_longlong(start)
+        ret = _sendfile(self.dstfd, self.srcfd, ctypes.byref(src),
+                        min(end - start, COPY_CHUNK))
+        return self._checkCall(ret)
+
+    def _readWrite(self, start, end):
+        (buf, zeros) = self._buffers()
+        os.lseek(self.srcfd, start, 0)
+        count = min(end - start, self.chunk)
+        if count < self.chunk:
+            buf = memoryview(buf)[:count]
+
+        got = io.FileIO(self.srcfd, closefd=False).readinto(buf)
+        if not got:
+            return 0
+
+        if got == self.chunk and buf == zeros:
+            # don't bother writing out blocks of zeros if we can avoid it
+            self.zero(start, start + got)
+            return got
+
+        os.lseek(self.dstfd, start, 0)
+        self._write(memoryview(buf)[:got])
+        self._advance(got)
+        return got
+
+    def zero(self, start, end):
+        """ Make the bytes from start to end of the destination zero. """
+        length = end - start
+        if self.sparse:
+            # the destination is empty, so leave a hole in it
+            self._advance(length)
+            return
+
+        if self.zeroout and not start % 512 and not length % 512:
+            try:
+                fcntl.ioctl(self.dstfd, BLKZEROOUT,
+                            struct.pack("QQ", start, length))
+                self._advance(length)
+                return
+            except IOError as e:
+                # not a block device, or one that can't do it
+                log.debug("fastcopy: BLKZEROOUT not usable: %s" % e)
+                self.zeroout = False
+
+        (buf, zeros) = self._buffers()
+        os.lseek(self.dstfd, start, 0)
+        while start < end:
+            count = min(end - start, self.chunk)
+            self._write(memoryview(zeros)[:count])
+            self._advance(count)
+            start += count
+
+## Copy the first size bytes of one file descriptor to another.
+# Data is moved by the kernel with copy_file_range or sendfile when they
+# work for the two descriptors, and with a single reused buffer otherwise.
+# Holes in the source are found with SEEK_DATA and SEEK_HOLE and zeroed on
+# the destination with BLKZEROOUT where possible instead of being copied.
+# The destination is only synced once, at the end.
+# @param srcfd The file descriptor to copy from.
+# @param dstfd The file descriptor to copy to.
+# @param size The number of bytes to copy.
+# @param progress A function called with the number of bytes copied so
+#                 far, at most every PROGRESS_INTERVAL seconds.
+# @param sparse True if dstfd is an empty regular file, in which case holes
+#               in the source are left as holes in it.
+# @param sync False to leave syncing the destination to the caller.
+def copyData(srcfd, dstfd, size, progress=None, sparse=False, sync=True):
+    # sizes computed from filesystem sizes in MB can be floats
+    size = long(size)
+    copier = _Copier(srcfd, dstfd, size, progress=progress, sparse=sparse)
+    for (start, end, isData) in _extents(srcfd, size):
+        if isData:
+            copier.copy(start, end)
+        else:
+            copier.zero(start, end)
+
+    if sparse:
+        os.ftruncate(dstfd, size)
+    if sync:
+        os.fdatasync(dstfd)
+    if progress:
+        progress(copier.copied)
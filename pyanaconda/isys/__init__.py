@@ -43,6 +43,7 @@ import re
 import struct
 import dbus
 import selinux
+import threading
 
 import logging
 log = logging.getLogger("anaconda")
@@ -53,6 +54,8 @@ NM_MANAGER_IFACE = "org.freedesktop.NetworkManager"
 NM_ACTIVE_CONNECTION_IFACE = "org.freedesktop.NetworkManager.Connection.Active"
 NM_CONNECTION_IFACE = "org.freedesktop.NetworkManager.Settings.Connection"
 NM_DEVICE_IFACE = "org.freedesktop.NetworkManager.Device"
+NM_DEVICE_WIRED_IFACE = "org.freedesktop.NetworkManager.Device.Wired"
+NM_DEVICE_WIRELESS_IFACE = "org.freedesktop.NetworkManager.Device.Wireless"
 NM_IP4CONFIG_IFACE = "org.freedesktop.NetworkManager.IP4Config"
 NM_IP6CONFIG_IFACE = "org.freedesktop.NetworkManager.IP6Config"
 NM_ACCESS_POINT_IFACE = "org.freedesktop.NetworkManager.AccessPoint"
@@ -67,6 +70,14 @@ NM_STATE_CONNECTED_SITE = 60
 NM_STATE_CONNECTED_GLOBAL = 70
 NM_DEVICE_STATE_ACTIVATED = 100
 
+NM_DEVICE_TYPE_ETHERNET = 1
+NM_DEVICE_TYPE_WIFI = 2
+
+# the interfaces with the properties specific to a type of device, which
+# is where HwAddress lives
+NM_DEVICE_TYPE_IFACES = {NM_DEVICE_TYPE_ETHERNET: NM_DEVICE_WIRED_IFACE,
+                         NM_DEVICE_TYPE_WIFI: NM_DEVICE_WIRELESS_IFACE}
+
 DBUS_PROPS_IFACE = "org.freedesktop.DBus.Properties"
 
 mountCount = {}
@@ -290,36 +301,201 @@ def sync ():
 def isIsoImage(file):
     return _isys.isisoimage(file)
 
+## A snapshot of the properties of all the devices NetworkManager knows
+# about.  A device's properties are fetched with a GetAll of the Device
+# interface, plus one of its type's interface for wired and wireless
+# devices, the first time any of them is needed and kept until
+# NetworkManager says they changed.  Looking at every device costs one or
+# two D-Bus round trips per device instead of one per device per property
+# per call.
+class NMDeviceCache(object):
+    def __init__(self, bus=None):
+        """ Create the cache.  bus is the D-Bus connection to use, by
+            default a private system bus connection whose signals are
+            dispatched from the default glib main context.
+
+            The cache never runs that context itself: a getter called from
+            a handler of the GUI's main loop would otherwise run GUI events
+            inside that handler.  Signals are handled by whatever main loop
+            is running once its current handler returns, so with none
+            running nothing is kept between calls.
+        """
+        self._bus = bus
+        self._mainDepth = None
+        self._connected = False
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self, *args, **kwargs):
+        """ Forget everything, it will be fetched again when needed. """
+        self._devices = None    # object path -> properties
+        self._interfaces = None # interface name -> object path
+        self._ipConfigs = {}    # config object path -> properties
+
+    def _connect(self):
+        if self._connected:
+            return
+
+        if self._bus is None:
+            import dbus.mainloop.glib
+            import gobject
+            loop = dbus.mainloop.glib.DBusGMainLoop()
+            self._bus = dbus.SystemBus(private=True, mainloop=loop)
+            self._mainDepth = gobject.main_depth
+
+        self._bus.add_signal_receiver(self.reset, "DeviceAdded",
+                                      dbus_interface=NM_MANAGER_IFACE,
+                                      path=NM_MANAGER_PATH)
+        self._bus.add_signal_receiver(self.reset, "DeviceRemoved",
+                                      dbus_interface=NM_MANAGER_IFACE,
+                                      path=NM_MANAGER_PATH)
+        self._bus.add_signal_receiver(self._propertiesChanged,
+                                      "PropertiesChanged",
+                                      bus_name=NM_SERVICE,
+                                      path_keyword="path")
+        # all the object paths change if NetworkManager is restarted
+        self._bus.add_signal_receiver(self.reset, "NameOwnerChanged",
+                                      dbus_interface="org.freedesktop.DBus",
+                                      arg0=NM_SERVICE)
+        self._connected = True
+
+    @property
+    def bus(self):
+        """ The D-Bus connection the cache uses, for anything else that
+            wants signals from NetworkManager.
+        """
+        with self._lock:
+            self._connect()
+        return self._bus
+
+    def _propertiesChanged(self, *args, **kwargs):
+        # NetworkManager's own signal sends a dict of the changed
+        # properties, the standard one also sends the interface and the
+        # names of the properties that changed without saying how
+        path = kwargs.get("path")
+        if len(args) == 3:
+            (iface, changed, invalidated) = args
+            if invalidated:
+                self.reset()
+                return
+        else:
+            changed = args[0]
+
+        if self._devices is not None and path in self._devices:
+            self._devices[path].update(changed)
+        self._ipConfigs.pop(path, None)
+
+    def _expire(self):
+        # with no main loop running in this thread, nothing will tell us
+        # about changes before the next call
+        if self._mainDepth is not None and self._mainDepth() == 0:
+            self.reset()
+
+    def _getAll(self, path, iface):
+        obj = self._bus.get_object(NM_SERVICE, path)
+        return dict(obj.get_dbus_method("GetAll", DBUS_PROPS_IFACE)(iface))
+
+    def _update(self):
+        with self._lock:
+            self._connect()
+            self._expire()
+            if self._devices is not None:
+                return
+
+            nm = self._bus.get_object(NM_SERVICE, NM_MANAGER_PATH)
+            devices = {}
+            interfaces = {}
+            for path in nm.get_dbus_method("GetDevices", NM_MANAGER_IFACE)():
+                props = self._getAll(path, NM_DEVICE_IFACE)
+                # GetAll only returns the properties of the interface it is
+                # asked about, unlike Get which looks in all of them
+                type_iface = NM_DEVICE_TYPE_IFACES.get(props.get("DeviceType"))
+                if type_iface is not None:
+                    props.update(self._getAll(path, type_iface))
+                devices[path] = props
+                interfaces[str(props["Interface"])] = path
+
+            (self._devices, self._interfaces) = (devices, interfaces)
+
+    def interfaces(self):
+        """ Return the names of all the devices, e.g. eth0. """
+        self._update()
+        return self._interfaces.keys()
+
+    def path(self, dev):
+        """ Return the object path of device dev, or None. """
+        self._update()
+        return self._interfaces.get(dev)
+
+    def properties(self, dev):
+        """ Return a dict of the properties of device dev, or None. """
+        self._update()
+        path = self._interfaces.get(dev)
+        if path is None:
+            return None
+        return self._devices[path]
+
+    def ipConfig(self, path, iface):
+        """ Return a dict of the properties of an IP4Config or IP6Config. """
+        with self._lock:
+            self._connect()
+            self._expire()
+            if path not in self._ipConfigs:
+                self._ipConfigs[path] = self._getAll(path, iface)
+            return self._ipConfigs[path]
+
+nmDevices = NMDeviceCache()
+
+class _DeviceProperties(object):
+    """ Stands in for a device's org.freedesktop.DBus.Properties interface,
+        answering from nmDevices what it can.
+    """
+    def __init__(self, cache, dev):
+        self._cache = cache
+        self._dev = dev
+
+    def _iface(self):
+        bus = self._cache._bus
+        return dbus.Interface(bus.get_object(NM_SERVICE, self._cache.path(self._dev)),
+                              DBUS_PROPS_IFACE)
+
+    def _cached(self, iface):
+        props = self._cache.properties(self._dev)
+        if props is None:
+            return None
+        if iface == NM_DEVICE_IFACE or \
+           iface == NM_DEVICE_TYPE_IFACES.get(props.get("DeviceType")):
+            return props
+        return None
+
+    def Get(self, iface, name):
+        props = self._cached(iface)
+        if props is not None and name in props:
+            return props[name]
+        return self._iface().Get(iface, name)
+
+    def GetAll(self, iface):
+        props = self._cached(iface)
+        if props is not None:
+            return dict(props)
+        return self._iface().GetAll(iface)
+
 # Return number of network devices
 def getNetworkDeviceCount():
-    bus = dbus.SystemBus()
-    nm = bus.get_object(NM_SERVICE, NM_MANAGER_PATH)
-    devlist = nm.get_dbus_method("GetDevices")()
-    return len(devlist)
+    return len(nmDevices.interfaces())
 
 # Get a D-Bus interface for the specified device's (e.g., eth0) properties.
 # If dev=None, return a hash of the form 'hash[dev] = props_iface' that
 # contains all device properties for all interfaces that NetworkManager knows
-# about.
+# about.  The device's properties are answered from nmDevices.
 def getDeviceProperties(dev=None):
-    bus = dbus.SystemBus()
-    nm = bus.get_object(NM_SERVICE, NM_MANAGER_PATH)
-    devlist = nm.get_dbus_method("GetDevices")()
-    all = {}
-
-    for path in devlist:
-        device = bus.get_object(NM_SERVICE, path)
-        device_props_iface = dbus.Interface(device, DBUS_PROPS_IFACE)
-
-        device_interface = str(device_props_iface.Get(NM_DEVICE_IFACE, "Interface"))
-
-        if dev is None:
-            all[device_interface] = device_props_iface
-        elif device_interface == dev:
-            return device_props_iface
-
     if dev is None:
+        all = {}
+        for iface in nmDevices.interfaces():
+            all[iface] = _DeviceProperties(nmDevices, iface)
         return all
+    elif nmDevices.path(dev) is not None:
+        return _DeviceProperties(nmDevices, dev)
     else:
         return None
 
@@ -328,16 +504,13 @@ def getMacAddress(dev):
     if dev == '' or dev is None:
         return False
 
-    device_props_iface = getDeviceProperties(dev=dev)
-    if device_props_iface is None:
+    device_props = nmDevices.properties(dev)
+    if device_props is None:
         return None
 
-    device_macaddr = None
-    try:
-        device_macaddr = device_props_iface.Get(NM_DEVICE_IFACE, "HwAddress").upper()
-    except dbus.exceptions.DBusException as e:
-        if e.get_dbus_name() != 'org.freedesktop.DBus.Error.InvalidArgs':
-            raise
+    device_macaddr = device_props.get("HwAddress")
+    if device_macaddr is not None:
+        device_macaddr = device_macaddr.upper()
     return device_macaddr
 
 # Get a description string for a network device (e.g., eth0)
@@ -348,28 +521,18 @@ def getNetDevDesc(dev):
     if dev == '' or dev is None:
         return desc
 
-    bus = dbus.SystemBus()
-    nm = bus.get_object(NM_SERVICE, NM_MANAGER_PATH)
-    devlist = nm.get_dbus_method("GetDevices")()
-
-    for path in devlist:
-        device = bus.get_object(NM_SERVICE, path)
-        device_iface = dbus.Interface(device, DBUS_PROPS_IFACE)
-        device_props = device_iface.get_dbus_method("GetAll")(NM_DEVICE_IFACE)
+    device_props = nmDevices.properties(dev)
+    if device_props is not None:
+        # This is the sysfs path (for now).
+        udev_path = device_props['Udi']
+        dev = udev_get_device(udev_path[4:])
 
-        if dev == device_props['Interface']:
-            # This is the sysfs path (for now).
-            udev_path = device_props['Udi']
-            dev = udev_get_device(udev_path[4:])
-
-            if dev is None:
-                log.debug("weird, we have a None dev with path %s" % path)
-            elif dev.has_key("ID_VENDOR_ENC") and dev.has_key("ID_MODEL_ENC"):
-                desc = "%s %s" % (dev["ID_VENDOR_ENC"], dev["ID_MODEL_ENC"])
-            elif dev.has_key("ID_VENDOR_FROM_DATABASE") and dev.has_key("ID_MODEL_FROM_DATABASE"):
-                desc = "%s %s" % (dev["ID_VENDOR_FROM_DATABASE"], dev["ID_MODEL_FROM_DATABASE"])
-
-            return desc
+        if dev is None:
+            log.debug("weird, we have a None dev with path %s" % udev_path)
+        elif dev.has_key("ID_VENDOR_ENC") and dev.has_key("ID_MODEL_ENC"):
+            desc = "%s %s" % (dev["ID_VENDOR_ENC"], dev["ID_MODEL_ENC"])
+        elif dev.has_key("ID_VENDOR_FROM_DATABASE") and dev.has_key("ID_MODEL_FROM_DATABASE"):
+            desc = "%s %s" % (dev["ID_VENDOR_FROM_DATABASE"], dev["ID_MODEL_FROM_DATABASE"])
 
     return desc
 
@@ -384,22 +547,20 @@ def getIPAddresses(dev, version=4):
     if dev == '' or dev is None:
        return None
 
-    device_props_iface = getDeviceProperties(dev=dev)
-    if device_props_iface is None:
+    device_props = nmDevices.properties(dev)
+    if device_props is None:
         return None
 
-    bus = dbus.SystemBus()
-
     addresses = []
 
     if version == 4:
-        ip4_config_path = device_props_iface.Get(NM_DEVICE_IFACE, 'Ip4Config')
+        ip4_config_path = device_props['Ip4Config']
         if ip4_config_path != '/':
-            ip4_config_obj = bus.get_object(NM_SERVICE, ip4_config_path)
-            ip4_config_props = dbus.Interface(ip4_config_obj, DBUS_PROPS_IFACE)
+            ip4_config_props = nmDevices.ipConfig(ip4_config_path,
+                                                  NM_IP4CONFIG_IFACE)
 
             # addresses (3-element list:  ipaddr, netmask, gateway)
-            addrs = ip4_config_props.Get(NM_IP4CONFIG_IFACE, "Addresses")
+            addrs = ip4_config_props["Addresses"]
             for addr in addrs:
                 try:
                     tmp = struct.pack('I', addr[0])
@@ -409,12 +570,12 @@ def getIPAddresses(dev, version=4):
                     log.debug("Exception caught trying to convert IP address %s: %s" %
                     (addr, e))
     elif version == 6:
-        ip6_config_path = device_props_iface.Get(NM_DEVICE_IFACE, 'Ip6Config')
+        ip6_config_path = device_props['Ip6Config']
         if ip6_config_path != '/':
-            ip6_config_obj = bus.get_object(NM_SERVICE, ip6_config_path)
-            ip6_config_props = dbus.Interface(ip6_config_obj, DBUS_PROPS_IFACE)
+            ip6_config_props = nmDevices.ipConfig(ip6_config_path,
+                                                  NM_IP6CONFIG_IFACE)
 
-            addrs = ip6_config_props.Get(NM_IP6CONFIG_IFACE, "Addresses")
+            addrs = ip6_config_props["Addresses"]
             for addr in addrs:
                 try:
                     addrstr = "".join(str(byte) for byte in addr[0])
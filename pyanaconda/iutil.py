@@ -20,6 +20,8 @@
 # Author(s): Erik Troan <ewt@redhat.com>
 #
 
+import atexit
+import fcntl
 import glob
 import os, string, stat, sys
 import signal
@@ -30,7 +32,9 @@ import subprocess
 from flags import flags
 from constants import *
 import re
+import select
 import threading
+import time
 
 import gettext
 _ = lambda x: gettext.ldgettext("anaconda", x)
@@ -45,28 +49,114 @@ class ExecProduct(object):
         self.stdout = stdout
         self.stderr = stderr
 
-#Python reimplementation of the shell tee process, so we can
-#feed the pipe output into two places at the same time
-class tee(threading.Thread):
-    def __init__(self, inputdesc, outputdesc, logmethod):
-        threading.Thread.__init__(self)
-        self.inputdesc = os.fdopen(inputdesc, "r")
-        self.outputdesc = outputdesc
-        self.logmethod = logmethod
-        self.running = True
-
-    def run(self):
-        while self.running:
-            data = self.inputdesc.readline()
-            if data == "":
-                self.running = False
-            else:
-                self.logmethod(data.rstrip('\n'))
-                os.write(self.outputdesc, data)
+# the environment external programs get run with, rebuilt when os.environ
+# changes instead of being copied for every command
+_execEnv = None
+_execEnvSource = None
+
+def _getExecEnv():
+    global _execEnv, _execEnvSource
+
+    if _execEnvSource != os.environ.data:
+        _execEnvSource = os.environ.data.copy()
+        _execEnv = os.environ.data.copy()
+        _execEnv["LC_ALL"] = "C"
+
+    return _execEnv
+
+# wall-clock time spent in each external program, written to program.log
+# when anaconda exits
+EXEC_TIME_BUCKETS = (0.01, 0.1, 1, 10, 60)
+_execTimes = {}
+_execTimesLock = threading.Lock()
+
+def _recordExecTime(command, elapsed):
+    _execTimesLock.acquire()
+    try:
+        if command not in _execTimes:
+            _execTimes[command] = [0, 0.0, 0.0] + [0] * (len(EXEC_TIME_BUCKETS) + 1)
+
+        times = _execTimes[command]
+        times[0] += 1
+        times[1] += elapsed
+        times[2] = max(times[2], elapsed)
+        bucket = 0
+        while bucket < len(EXEC_TIME_BUCKETS) and \
+              elapsed >= EXEC_TIME_BUCKETS[bucket]:
+            bucket += 1
+        times[3 + bucket] += 1
+    finally:
+        _execTimesLock.release()
+
+## Write a histogram of the time spent in each external program to program.log.
+def logExecTimes():
+    _execTimesLock.acquire()
+    try:
+        times = _execTimes.items()
+    finally:
+        _execTimesLock.release()
+
+    if not times:
+        return
+
+    # most expensive commands first
+    times.sort(key=lambda t: t[1][1], reverse=True)
+    labels = ["<%gs" % b for b in EXEC_TIME_BUCKETS]
+    labels.append(">=%gs" % EXEC_TIME_BUCKETS[-1])
+
+    program_log.info("Time spent in external programs:")
+    program_log.info("%-20s %6s %9s %8s  %s" % ("command", "calls", "total",
+                                                "max", " ".join(["%6s" % l for l in labels])))
+    for (command, t) in times:
+        program_log.info("%-20s %6d %8.2fs %7.2fs  %s" %
+                         (os.path.basename(command), t[0], t[1], t[2],
+                          " ".join(["%6d" % n for n in t[3:]])))
+
+atexit.register(logExecTimes)
+
+# how much of a child's output is read at a time
+EXEC_READ_SIZE = 65536
+
+## Copy what a child writes to its pipes to the log and to other descriptors.
+# The pipes are multiplexed with poll in the calling thread and each
+# complete line is logged as it arrives.
+# @param pipes A dict mapping the read end of each pipe to a tuple of the
+#              descriptor to copy the output to and the logging method.
+def _teeOutput(pipes):
+    partial = dict([(fd, "") for fd in pipes])
+    poller = select.poll()
+    for fd in pipes:
+        poller.register(fd, select.POLLIN | select.POLLPRI)
+
+    open_fds = len(pipes)
+    while open_fds:
+        try:
+            events = poller.poll()
+        except select.error as e:
+            if e.args[0] == EINTR:
+                continue
+            raise
+
+        for (fd, event) in events:
+            try:
+                data = os.read(fd, EXEC_READ_SIZE)
+            except OSError as e:
+                if e.errno == EINTR:
+                    continue
+                raise
+
+            (outfd, logmethod) = pipes[fd]
+            if not data:
+                poller.unregister(fd)
+                open_fds -= 1
+                if partial[fd]:
+                    logmethod(partial[fd])
+                continue
 
-    def stop(self):
-        self.running = False
-        return self
+            os.write(outfd, data)
+            lines = (partial[fd] + data).split("\n")
+            partial[fd] = lines.pop()
+            map(logmethod, lines)
 
 ## Run an external program and redirect the output to a file.
 # @param command The command to run.
@@ -113,60 +203,60 @@ def execWithRedirect(command, argv, stdin = None, stdout = None,
 
     program_log.info("Running... %s" % (" ".join([command] + argv),))
 
-    #prepare os pipes for feeding tee proceses
+    #prepare os pipes for feeding the output to the log
     pstdout, pstdin = os.pipe()
     perrout, perrin = os.pipe()
-   
-    env = os.environ.copy()
-    env.update({"LC_ALL": "C"})
-
+    pipes = [pstdout, perrout]
+    for fd in pipes:
+        # only we read them, the child must not keep them open
+        fcntl.fcntl(fd, fcntl.F_SETFD,
+                    fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+    def closePipes():
+        while pipes:
+            os.close(pipes.pop())
+
+    start = time.time()
     try:
-        #prepare tee proceses
-        proc_std = tee(pstdout, stdout, program_log.info)
-        proc_err = tee(perrout, stderr, program_log.error)
-
-        #start monitoring the outputs
-        proc_std.start()
-        proc_err.start()
-
-        proc = subprocess.Popen([command] + argv, stdin=stdin,
-                                stdout=pstdin,
-                                stderr=perrin,
-                                preexec_fn=chroot, cwd=root,
-                                env=env)
+        try:
+            proc = subprocess.Popen([command] + argv, stdin=stdin,
+                                    stdout=pstdin,
+                                    stderr=perrin,
+                                    preexec_fn=chroot, cwd=root,
+                                    env=_getExecEnv())
+        finally:
+            #close the input ends of pipes so we get EOF once the child exits
+            os.close(pstdin)
+            os.close(perrin)
 
+        try:
+            _teeOutput({pstdout: (stdout, program_log.info),
+                        perrout: (stderr, program_log.error)})
+        except:
+            # nobody reads the pipes anymore, so close them rather than
+            # wait for a child that may be blocked writing to a full one
+            closePipes()
+            proc.wait()
+            raise
         proc.wait()
         ret = proc.returncode
-
-        #close the input ends of pipes so we get EOF in the tee processes
-        os.close(pstdin)
-        os.close(perrin)
-
-        #wait for the output to be written and destroy them
-        proc_std.join()
-        del proc_std
-
-        proc_err.join()
-        del proc_err
-
-        stdinclose()
-        stdoutclose()
-        stderrclose()
     except OSError as e:
         errstr = "Error running %s: %s" % (command, e.strerror)
         log.error(errstr)
         program_log.error(errstr)
-        #close the input ends of pipes so we get EOF in the tee processes
-        os.close(pstdin)
-        os.close(perrin)
-        proc_std.join()
-        proc_err.join()
+        closePipes()
 
         stdinclose()
         stdoutclose()
         stderrclose()
         raise RuntimeError, errstr
 
+    _recordExecTime(command, time.time() - start)
+    closePipes()
+
+    stdinclose()
+    stdoutclose()
+    stderrclose()
+
     return ret
 
 ## Run an external program and capture standard out.
@@ -209,15 +299,13 @@ def execWithCapture(command, argv, stdin = None, stderr = None, root='/'):
 
     program_log.info("Running... %s" % (" ".join([command] + argv),))
 
-    env = os.environ.copy()
-    env.update({"LC_ALL": "C"})
-
+    start = time.time()
     try:
         proc = subprocess.Popen([command] + argv, stdin=stdin,
                                 stdout=subprocess.PIPE,
                                 stderr=subprocess.PIPE,
                                 preexec_fn=chroot, cwd=root,
-                                env=env)
+                                env=_getExecEnv())
 
         while True:
             (outStr, errStr) = proc.communicate()
@@ -235,9 +323,13 @@ def execWithCapture(command, argv, stdin = None, stderr = None, root='/'):
         closefds()
         raise RuntimeError, "Error running " + command + ": " + e.strerror
 
+    _recordExecTime(command, time.time() - start)
     closefds()
     return rc
 
+# minimum number of seconds between two calls to an execWithCallback callback
+EXEC_CALLBACK_INTERVAL = 0.1
+
 def execWithCallback(command, argv, stdin = None, stdout = None,
                      stderr = None, echo = True, callback = None,
                      callback_data = None, root = '/'):
@@ -281,6 +373,7 @@ def execWithCallback(command, argv, stdin = None, stdout = None,
 
     program_log.info("Running... %s" % (" ".join([command] + argv),))
 
+    start = time.time()
     p = os.pipe()
     p_stderr = os.pipe()
     childpid = os.fork()
@@ -300,61 +393,82 @@ def execWithCallback(command, argv, stdin = None, stdout = None,
     os.close(p[1])
     os.close(p_stderr[1])
 
-    log_output = ''
-    while 1:
+    # Read whatever the child writes to either pipe in large chunks as it
+    # becomes available, instead of a byte at a time.  Reading both pipes
+    # at once also keeps the child from blocking on a full stderr pipe.
+    output = []
+    errors = []
+    pending = []
+    last_callback = 0
+    buffers = {p[0]: output, p_stderr[0]: errors}
+    poller = select.poll()
+    for fd in buffers:
+        poller.register(fd, select.POLLIN | select.POLLPRI)
+
+    while buffers:
         try:
-            s = os.read(p[0], 1)
-        except OSError as e:
-            if e.errno != 4:
-                map(program_log.info, log_output.splitlines())
+            events = poller.poll()
+        except select.error as e:
+            if e.args[0] == EINTR:
+                continue
+            map(program_log.info, "".join(output).splitlines())
+            raise IOError, e.args
+
+        for (fd, event) in events:
+            try:
+                s = os.read(fd, EXEC_READ_SIZE)
+            except OSError as e:
+                if e.errno == EINTR:
+                    continue
+                map(program_log.info, "".join(output).splitlines())
                 raise IOError, e.args
 
-        if echo:
-            os.write(stdout, s)
-        log_output += s
+            if not s:
+                poller.unregister(fd)
+                del buffers[fd]
+                continue
 
-        if callback:
-            callback(s, callback_data=callback_data)
+            buffers[fd].append(s)
+            if fd != p[0]:
+                continue
 
-        # break out early if the sub-process changes status.
-        # no need to flush the stream if the process has exited
-        try:
-            (pid, status) = os.waitpid(childpid,os.WNOHANG)
-            if pid != 0:
-                break
-        except OSError as e:
-            log.critical("exception from waitpid: %s %s" %(e.errno, e.strerror))
+            if echo:
+                os.write(stdout, s)
 
-        if len(s) < 1:
-            break
+            if callback:
+                # hand the callback everything read since it last ran, but
+                # don't run it more often than every EXEC_CALLBACK_INTERVAL
+                pending.append(s)
+                now = time.time()
+                if now - last_callback >= EXEC_CALLBACK_INTERVAL:
+                    callback("".join(pending), callback_data=callback_data)
+                    pending = []
+                    last_callback = now
 
-    map(program_log.info, log_output.splitlines())
+    if pending:
+        callback("".join(pending), callback_data=callback_data)
 
-    log_errors = ''
-    while 1:
-        try:
-            err = os.read(p_stderr[0], 128)
-        except OSError as e:
-            if e.errno != 4:
-                map(program_log.error, log_errors.splitlines())
-                raise IOError, e.args
-            break
-        log_errors += err
-        if len(err) < 1:
-            break
+    log_output = "".join(output)
+    map(program_log.info, log_output.splitlines())
 
+    log_errors = "".join(errors)
     os.write(stderr, log_errors)
     map(program_log.error, log_errors.splitlines())
     os.close(p[0])
     os.close(p_stderr[0])
 
-    try:
-        #if we didn't already get our child's exit status above, do so now.
-        if not pid:
+    status = 0
+    while True:
+        try:
             (pid, status) = os.waitpid(childpid, 0)
-    except OSError as e:
-        log.critical("exception from waitpid: %s %s" %(e.errno, e.strerror))
+            break
+        except OSError as e:
+            if e.errno == EINTR:
+                continue
+            log.critical("exception from waitpid: %s %s" %(e.errno, e.strerror))
+            break
 
+    _recordExecTime(command, time.time() - start)
     closefds()
 
     rc = 1
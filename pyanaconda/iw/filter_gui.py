@@ -450,9 +450,9 @@ class FilterWindow(InstallWindow):
         cfg = mcw.write()
         open("/etc/multipath.conf", "w+").write(cfg)
         del cfg
-        del mcw
 
-        topology = MultipathTopology(new_disks)
+        topology = MultipathTopology(new_disks, config=mcw)
+        del mcw
         (new_raids, new_nonraids) = self.split_list(lambda d: isRAID(d) and not isCCISS(d),
                                                     topology.singlepaths_iter())
 
@@ -601,9 +601,9 @@ class FilterWindow(InstallWindow):
         cfg = mcw.write()
         open("/etc/multipath.conf", "w+").write(cfg)
         del cfg
-        del mcw
 
-        topology = MultipathTopology(disks)
+        topology = MultipathTopology(disks, config=mcw)
+        del mcw
         # The device list could be really long, so we really only want to
         # iterate over it the bare minimum of times.  Dividing this list up
         # now means fewer elements to iterate over later.
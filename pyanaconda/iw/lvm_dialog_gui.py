@@ -715,6 +715,7 @@ class VolumeGroupEditor:
             origname = templv.lvname
             if not templv.exists:
                 templv._name = lvname
+                templv._updateIndexes()
                 try:
                     templv.size = size
                 except ValueError:
@@ -23,6 +23,8 @@
 import os
 import string
 import locale
+import hashlib
+import marshal
 
 import gettext
 from simpleconfig import SimpleConfigFile
@@ -57,6 +59,75 @@ def expandLangs(astring):
 
     return langs
 
+# bump this whenever the layout of the lang-index file changes
+LANG_INDEX_VERSION = 1
+
+def buildLangIndex(localeInfo):
+    """Build the lookup tables for the locales in localeInfo.
+
+       Returns a dict mapping every short form of every locale, as given by
+       expandLangs, to the locale and a dict mapping English language names
+       to their locale.  Where more than one locale has the same short form
+       or name, the one found first while iterating over localeInfo wins,
+       just as it would for a scan of it.
+    """
+    canon = {}
+    for key in localeInfo.keys():
+        for lang in expandLangs(key):
+            canon.setdefault(lang, key)
+
+    byName = {}
+    for (key, val) in localeInfo.iteritems():
+        byName.setdefault(val[0], key)
+
+    return (canon, byName)
+
+def writeLangIndex(path, language, nativeLangNames):
+    """Write the lookup tables of a Language instance to path, along with
+       its locales and the given English name -> native name mapping, so
+       later instances can load them instead of parsing lang-table.
+    """
+    (canon, byName) = buildLangIndex(language.localeInfo)
+    index = {"version": LANG_INDEX_VERSION,
+             "digest": language._tableDigest,
+             "localeInfo": language.localeInfo,
+             "nativeLangNames": nativeLangNames,
+             "canon": canon,
+             "byName": byName}
+
+    f = open(path, "wb")
+    marshal.dump(index, f)
+    f.close()
+
+def _readLangIndex(digest):
+    """Return the index written by writeLangIndex if there is one for the
+       lang-table with the given digest, or None.
+    """
+    search = ('lang-index', '/usr/share/anaconda/lang-index')
+    for path in search:
+        if not os.access(path, os.R_OK):
+            continue
+
+        try:
+            f = open(path, "rb")
+            try:
+                index = marshal.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, ValueError, TypeError) as e:
+            log.warning("Error reading %s: %s" % (path, e))
+            return None
+
+        if not isinstance(index, dict) or \
+           index.get("version") != LANG_INDEX_VERSION or \
+           index.get("digest") != digest:
+            # built from some other lang-table, like one from an updates.img
+            return None
+
+        return index
+
+    return None
+
 class Language(object):
     def _setInstLang(self, value):
         # Always store in its full form so we know what we're comparing with.
@@ -71,11 +142,10 @@ class Language(object):
         # If we're running in text mode, value may not be a supported language
         # to display.  We need to default to en_US.UTF-8 for now.
         if self.displayMode == 't':
-            for (lang, info) in self.localeInfo.iteritems():
-                # If there's no font, it's not a supported language.
-                if lang == self._instLang and info[2] == "none":
-                    self._instLang = self._default
-                    break
+            # If there's no font, it's not a supported language.
+            info = self.localeInfo.get(self._instLang)
+            if info and info[2] == "none":
+                self._instLang = self._default
 
         # Now set some things to make sure the language setting takes effect
         # right now.
@@ -97,7 +167,7 @@ class Language(object):
         # we're using the default.  This prevents us from having to check all
         # over the place.  Unfortunately, it also means anaconda will be
         # running with the wrong font and keyboard in these cases.
-        if self._instLang in self.localeInfo.keys():
+        if self.localeInfo.has_key(self._instLang):
             return self._instLang
         else:
             return self._default
@@ -143,6 +213,41 @@ class Language(object):
         self.localeInfo = {}
         self.nativeLangNames = {}
 
+        # (short form -> locale, English name -> locale) lookup tables,
+        # built from localeInfo the first time they're needed
+        self._index = None
+
+        table = ""
+        search = ('lang-table', '/tmp/updates/lang-table', '/etc/lang-table',
+                  '/usr/share/anaconda/lang-table')
+        for path in search:
+            if os.access(path, os.R_OK):
+                f = open(path, "r")
+                table = f.read()
+                f.close()
+                break
+
+        self._tableDigest = hashlib.md5(table).hexdigest()
+
+        # scripts/getlangnames.py precompiles everything below into an
+        # index at build time, so only parse the text files without one
+        index = _readLangIndex(self._tableDigest)
+        if index:
+            self.localeInfo = index["localeInfo"]
+            self.nativeLangNames = index["nativeLangNames"]
+            self._index = (index["canon"], index["byName"])
+        else:
+            self._parseTables(table)
+
+        # Hard code this to prevent errors in the build environment.
+        self.localeInfo['C'] = self.localeInfo[self._default]
+
+        # instLang must be set after localeInfo is populated, in case the
+        # current setting is unsupported by anaconda..
+        self.instLang = os.environ.get("LANG", self._default)
+        self.systemLang = os.environ.get("LANG", self._default)
+
+    def _parseTables(self, table):
         # English name -> native name mapping
         search = ('lang-names', '/usr/share/anaconda/lang-names')
         for path in search:
@@ -157,31 +262,19 @@ class Language(object):
                 break
 
         # nick -> (name, short name, font, keyboard, timezone) mapping
-        search = ('lang-table', '/tmp/updates/lang-table', '/etc/lang-table',
-                  '/usr/share/anaconda/lang-table')
-        for path in search:
-            if os.access(path, os.R_OK):
-                f = open(path, "r")
-                for line in f.readlines():
-                    string.strip(line)
-                    l = string.split(line, '\t')
+        for line in table.splitlines():
+            l = string.split(line, '\t')
 
-                    # throw out invalid lines
-                    if len(l) < 6:
-                        continue
+            # throw out invalid lines
+            if len(l) < 6:
+                continue
 
-                    self.localeInfo[l[3]] = (l[0], l[1], l[2], l[4], string.strip(l[5]))
+            self.localeInfo[l[3]] = (l[0], l[1], l[2], l[4], string.strip(l[5]))
 
-                f.close()
-                break
-
-        # Hard code this to prevent errors in the build environment.
-        self.localeInfo['C'] = self.localeInfo[self._default]
-
-        # instLang must be set after localeInfo is populated, in case the
-        # current setting is unsupported by anaconda..
-        self.instLang = os.environ.get("LANG", self._default)
-        self.systemLang = os.environ.get("LANG", self._default)
+    def _getIndex(self):
+        if self._index is None:
+            self._index = buildLangIndex(self.localeInfo)
+        return self._index
 
     def _canonLang(self, lang):
         """Convert the shortened form of a language name into the full
@@ -191,11 +284,10 @@ class Language(object):
                      fr_FR -> fr_FR.UTF-8
                      fr_CA -> ValueError
         """
-        for key in self.localeInfo.keys():
-            if lang in expandLangs(key):
-                return key
-
-        raise ValueError
+        try:
+            return self._getIndex()[0][lang]
+        except KeyError:
+            raise ValueError
 
     def available(self):
         return self.nativeLangNames.keys()
@@ -260,9 +352,7 @@ class Language(object):
         return self.localeInfo[l][0]
 
     def getLangByName(self, name):
-        for (key, val) in self.localeInfo.iteritems():
-            if val[0] == name:
-                return key
+        return self._getIndex()[1].get(name)
 
     def getNativeLangName(self, lang):
         return self.nativeLangNames[lang]
@@ -29,6 +29,8 @@ import stat
 import shutil
 import time
 import subprocess
+import threading
+import Queue
 import storage
 
 import selinux
@@ -40,6 +42,7 @@ import gettext
 _ = lambda x: gettext.ldgettext("anaconda", x)
 
 import backend
+import fastcopy
 import isys
 import iutil
 
@@ -50,61 +53,138 @@ log = logging.getLogger("anaconda")
 
 class Error(EnvironmentError):
     pass
+
+# number of threads copying file data in copytree
+COPYTREE_WORKERS = 4
+
+# number of files handed to a copytree worker at a time
+COPYTREE_BATCH = 64
+
 def copytree(src, dst, symlinks=False, preserveOwner=False,
              preserveSelinux=False):
-    def tryChown(src, dest):
-        try:
-            os.chown(dest, os.stat(src)[stat.ST_UID], os.stat(src)[stat.ST_GID])
-        except OverflowError:
-            log.error("Could not set owner and group on file %s" % dest)
+    """ Copy the tree at src to dst, which may already exist.
+
+        Like shutil.copytree, but with options to preserve the owner and
+        selinux contexts.  The tree is walked with a single lstat for
+        every entry, then the files are copied and have their ownership,
+        modes and contexts set by a pool of threads, a batch at a time.
+        Directories get theirs last, deepest first, so that creating
+        their contents doesn't change their times again.
+
+        Raises Error with a list of (src, dst, why) tuples if anything
+        could not be copied.
+    """
+    def setMetadata(srcname, dstname, st):
+        if preserveOwner:
+            try:
+                os.chown(dstname, st.st_uid, st.st_gid)
+            except OverflowError:
+                log.error("Could not set owner and group on file %s" % dstname)
+
+        if preserveSelinux:
+            setfilecon(srcname, dstname)
 
-    def trySetfilecon(src, dest):
+        os.chmod(dstname, stat.S_IMODE(st.st_mode))
+        os.utime(dstname, (st.st_atime, st.st_mtime))
+
+    def setfilecon(srcname, dstname):
         try:
-            selinux.lsetfilecon(dest, selinux.lgetfilecon(src)[1])
+            selinux.lsetfilecon(dstname, selinux.lgetfilecon(srcname)[1])
         except:
-            log.error("Could not set selinux context on file %s" % dest)
+            log.error("Could not set selinux context on file %s" % dstname)
 
-    # copy of shutil.copytree which doesn't require dst to not exist
-    # and which also has options to preserve the owner and selinux contexts
-    names = os.listdir(src)
-    if not os.path.isdir(dst):
-        os.makedirs(dst)
-    errors = []
-    for name in names:
-        srcname = os.path.join(src, name)
-        dstname = os.path.join(dst, name)
+    def copyFile(srcname, dstname, st):
+        if not stat.S_ISREG(st.st_mode):
+            shutil.copyfile(srcname, dstname)
+            return
+
+        srcfd = os.open(srcname, os.O_RDONLY)
         try:
-            if symlinks and os.path.islink(srcname):
-                linkto = os.readlink(srcname)
-                os.symlink(linkto, dstname)
-                if preserveSelinux:
-                    trySetfilecon(srcname, dstname)
-            elif os.path.isdir(srcname):
-                copytree(srcname, dstname, symlinks, preserveOwner, preserveSelinux)
-            else:
-                shutil.copyfile(srcname, dstname)
-                if preserveOwner:
-                    tryChown(srcname, dstname)
+            dstfd = os.open(dstname, os.O_WRONLY|os.O_CREAT|os.O_TRUNC, 0600)
+            try:
+                fastcopy.copyData(srcfd, dstfd, st.st_size,
+                                  sparse=True, sync=False)
+            finally:
+                os.close(dstfd)
+        finally:
+            os.close(srcfd)
+
+    def worker(queue, errors):
+        while True:
+            try:
+                batch = queue.get_nowait()
+            except Queue.Empty:
+                return
+
+            for (srcname, dstname, st) in batch:
+                try:
+                    copyFile(srcname, dstname, st)
+                    setMetadata(srcname, dstname, st)
+                except Exception, why:
+                    # an exception can't cross threads, so everything
+                    # goes into the list raised at the end
+                    errors.append((srcname, dstname, str(why)))
 
-                if preserveSelinux:
-                    trySetfilecon(srcname, dstname)
+    errors = []
+    files = []
+    dirs = []
 
-                shutil.copystat(srcname, dstname)
+    # walk the source tree, creating directories and symlinks as we go
+    pending = [(src, dst, os.stat(src))]
+    while pending:
+        (srcdir, dstdir, st) = pending.pop()
+        try:
+            names = os.listdir(srcdir)
+            if not os.path.isdir(dstdir):
+                os.makedirs(dstdir)
         except (IOError, os.error), why:
-            errors.append((srcname, dstname, str(why)))
-        # catch the Error from the recursive copytree so that we can
-        # continue with other files
-        except Error, err:
-            errors.extend(err.args[0])
-    try:
-        if preserveOwner:
-            tryChown(src, dst)
-        if preserveSelinux:
-            trySetfilecon(src, dst)
+            errors.append((srcdir, dstdir, str(why)))
+            continue
+
+        dirs.append((srcdir, dstdir, st))
+        for name in names:
+            srcname = os.path.join(srcdir, name)
+            dstname = os.path.join(dstdir, name)
+            try:
+                st = os.lstat(srcname)
+                if stat.S_ISLNK(st.st_mode):
+                    if symlinks:
+                        os.symlink(os.readlink(srcname), dstname)
+                        if preserveSelinux:
+                            setfilecon(srcname, dstname)
+                        continue
+
+                    st = os.stat(srcname)
+
+                if stat.S_ISDIR(st.st_mode):
+                    pending.append((srcname, dstname, st))
+                else:
+                    files.append((srcname, dstname, st))
+            except (IOError, os.error), why:
+                errors.append((srcname, dstname, str(why)))
+
+    # copy the files and set their metadata in parallel
+    queue = Queue.Queue()
+    for i in range(0, len(files), COPYTREE_BATCH):
+        queue.put(files[i:i + COPYTREE_BATCH])
+
+    threads = []
+    for i in range(min(COPYTREE_WORKERS, queue.qsize())):
+        thread = threading.Thread(target=worker, args=(queue, errors))
+        thread.setDaemon(True)
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+
+    # directories were walked parents first, so finish them in reverse
+    for (srcdir, dstdir, st) in reversed(dirs):
+        try:
+            setMetadata(srcdir, dstdir, st)
+        except OSError as e:
+            errors.append((srcdir, dstdir, e.strerror))
 
-        shutil.copystat(src, dst)
-    except OSError as e:
-        errors.extend((src, dst, e.strerror))
     if errors:
         raise Error, errors
 
@@ -149,14 +229,19 @@ class LiveCDCopyBackend(backend.AnacondaBackend):
         rootDevice.setup()
         rootfd = os.open(rootDevice.path, os.O_WRONLY)
 
-        readamt = 1024 * 1024 * 8 # 8 megs at a time
-        size = self.anaconda.storage.liveImage.format.currentSize * 1024 * 1024
-        copied = 0
-        while copied < size:
+        size = long(self.anaconda.storage.liveImage.format.currentSize *
+                    1024 * 1024)
+
+        def updateProgress(copied):
+            progress.set_fraction(pct = copied / float(size))
+            progress.processEvents()
+
+        while True:
             try:
-                buf = os.read(osfd, readamt)
-                written = os.write(rootfd, buf)
-            except:
+                fastcopy.copyData(osfd, rootfd, size, progress=updateProgress)
+                break
+            except (IOError, OSError) as e:
+                log.error("error copying live image: %s" % (e,))
                 rc = anaconda.intf.messageWindow(_("Error"),
                         _("There was an error installing the live image to "
                           "your hard drive.  This could be due to bad media.  "
@@ -168,17 +253,6 @@ class LiveCDCopyBackend(backend.AnacondaBackend):
 
                 if rc == 0:
                     sys.exit(0)
-                else:
-                    os.lseek(osfd, 0, 0)
-                    os.lseek(rootfd, 0, 0)
-                    copied = 0
-                    continue
-
-            if (written < readamt) and (written < len(buf)):
-                raise RuntimeError, "error copying filesystem!"
-            copied += written
-            progress.set_fraction(pct = copied / float(size))
-            progress.processEvents()
 
         os.close(osfd)
         os.close(rootfd)
@@ -49,6 +49,9 @@ netscriptsDir = "%s/network-scripts" % (sysconfigDir)
 networkConfFile = "%s/network" % (sysconfigDir)
 ifcfgLogFile = "/tmp/ifcfg.log"
 CONNECTION_TIMEOUT = 45
+# how often to look at NetworkManager's state when its signals can't be
+# handled while waiting for it
+POLL_INTERVAL = 0.25
 
 # Setup special logging for ifcfg NM interface
 from pyanaconda import anaconda_log
@@ -193,6 +196,148 @@ def getActiveNetDevs():
     ret.sort()
     return ret
 
+class _MainContext(object):
+    """ The default glib main context, which isys.nmDevices' D-Bus
+        connection delivers its signals to.
+
+        Waiting only runs the context when no main loop is running in this
+        thread.  Then everything attached to it may run: the handlers of
+        our signals, anything else waiting for D-Bus, timeouts and idle
+        callbacks, and GTK's events if it is up.  None of them can be in
+        the middle of running already.  Called from a handler of a running
+        main loop, such as the GUI's, running the context would run GUI
+        events inside that handler, so it only sleeps and leaves the
+        caller to look at the states again.
+    """
+    def __init__(self):
+        import gobject
+        self._gobject = gobject
+        self._context = gobject.main_context_default()
+
+    def iterate(self, timeout):
+        """ Run the handlers of whatever arrives in the next timeout
+            seconds, returning as soon as there were any.  Returns False
+            if nothing was run, and things should be looked at again.
+        """
+        if self._gobject.main_depth():
+            time.sleep(min(timeout, POLL_INTERVAL))
+            return False
+
+        expired = []
+        source = self._gobject.timeout_add(max(int(timeout * 1000), 1),
+                                           lambda: expired.append(True))
+        if not self._context.iteration(True):
+            # some other thread is running the main loop, and our
+            # handlers with it
+            time.sleep(min(timeout, 0.1))
+        if not expired:
+            self._gobject.source_remove(source)
+        return True
+
+## Wait for NetworkManager or some of its devices to get to a state.
+# Instead of polling the state, this listens for NetworkManager's
+# StateChanged signals and returns as soon as the state is right.  See
+# _MainContext for what may run while waiting.
+class NMStateWaiter(object):
+    def __init__(self, bus=None, context=None):
+        """ Create a waiter.  bus is the D-Bus connection to listen on and
+            context the main context its signals are dispatched from, by
+            default those of isys.nmDevices.
+        """
+        self._bus = bus or isys.nmDevices.bus
+        self._context = context or _MainContext()
+        self._managerState = None
+        self._deviceStates = {}
+
+    def _wait(self, done, refresh, timeout):
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        while not done():
+            remaining = 1
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+            if not self._context.iterate(remaining):
+                # our handlers can't run until we return
+                refresh()
+
+    def _get(self, path, iface, name):
+        obj = self._bus.get_object(isys.NM_SERVICE, path)
+        return obj.get_dbus_method("Get", isys.DBUS_PROPS_IFACE)(iface, name)
+
+    def _deviceStateChanged(self, new_state, old_state=None, reason=None,
+                            path=None):
+        if path in self._deviceStates:
+            self._deviceStates[path] = new_state
+
+    def _managerStateChanged(self, state):
+        self._managerState = state
+
+    ## Wait for devices to get to one of some states.
+    # @param devices The interface names of the devices, e.g. eth0.  Any
+    #                NetworkManager doesn't know about are not waited for.
+    # @param states The device states to wait for.
+    # @param timeout The most seconds to wait for, or None to wait forever.
+    # @return The list of devices that didn't get to one of the states.
+    def waitForDevices(self, devices, states=(isys.NM_DEVICE_STATE_ACTIVATED,),
+                       timeout=None):
+        paths = {}
+        for dev in devices:
+            path = isys.nmDevices.path(dev)
+            if path is not None:
+                paths[path] = dev
+                self._deviceStates[path] = None
+
+        match = self._bus.add_signal_receiver(self._deviceStateChanged,
+                                              "StateChanged",
+                                              dbus_interface=isys.NM_DEVICE_IFACE,
+                                              bus_name=isys.NM_SERVICE,
+                                              path_keyword="path")
+        try:
+            # only look at the states once we're told about changes to them
+            for path in paths:
+                if self._deviceStates[path] is None:
+                    self._deviceStates[path] = self._get(path,
+                                                         isys.NM_DEVICE_IFACE,
+                                                         "State")
+
+            def pending():
+                return [path for (path, state) in self._deviceStates.items()
+                        if state not in states]
+            def refresh():
+                for path in pending():
+                    self._deviceStates[path] = self._get(path,
+                                                         isys.NM_DEVICE_IFACE,
+                                                         "State")
+            self._wait(lambda: not pending(), refresh, timeout)
+            return [paths[path] for path in pending()]
+        finally:
+            match.remove()
+
+    ## Wait for NetworkManager's state to be right.
+    # @param test A function returning True for the states to wait for.
+    # @param timeout The most seconds to wait for, or None to wait forever.
+    # @return True if the state was right before the timeout.
+    def waitForManager(self, test, timeout=None):
+        match = self._bus.add_signal_receiver(self._managerStateChanged,
+                                              "StateChanged",
+                                              dbus_interface=isys.NM_MANAGER_IFACE,
+                                              path=isys.NM_MANAGER_PATH)
+        try:
+            if self._managerState is None:
+                self._managerState = self._get(isys.NM_MANAGER_PATH,
+                                               isys.NM_MANAGER_IFACE, "State")
+            def refresh():
+                self._managerState = self._get(isys.NM_MANAGER_PATH,
+                                               isys.NM_MANAGER_IFACE, "State")
+            self._wait(lambda: test(self._managerState), refresh, timeout)
+            return test(self._managerState)
+        finally:
+            match.remove()
+
 def logIfcfgFile(path, message=""):
     content = ""
     if os.access(path, os.R_OK):
@@ -760,52 +905,13 @@ class Network:
         # /etc/resolv.conf is managed by NM
 
     def waitForDevicesActivation(self, devices):
-        waited_devs_props = {}
-
-        bus = dbus.SystemBus()
-        nm = bus.get_object(isys.NM_SERVICE, isys.NM_MANAGER_PATH)
-        device_paths = nm.get_dbus_method("GetDevices")()
-        for device_path in device_paths:
-            device = bus.get_object(isys.NM_SERVICE, device_path)
-            device_props_iface = dbus.Interface(device, isys.DBUS_PROPS_IFACE)
-            iface = str(device_props_iface.Get(isys.NM_DEVICE_IFACE, "Interface"))
-            if iface in devices:
-                waited_devs_props[iface] = device_props_iface
-
-        i = 0
-        while True:
-            for dev, device_props_iface in waited_devs_props.items():
-                state = device_props_iface.Get(isys.NM_DEVICE_IFACE, "State")
-                if state == isys.NM_DEVICE_STATE_ACTIVATED:
-                    waited_devs_props.pop(dev)
-            if len(waited_devs_props) == 0 or i >= CONNECTION_TIMEOUT:
-                break
-            i += 1
-            time.sleep(1)
-
-        return waited_devs_props.keys()
+        return NMStateWaiter().waitForDevices(devices,
+                                              timeout=CONNECTION_TIMEOUT)
 
-    # write out current configuration state and wait for NetworkManager
-    # to bring the device up, watch NM state and return to the caller
-    # once we have a state
+    # wait for NetworkManager to be connected
     def waitForConnection(self):
-        bus = dbus.SystemBus()
-        nm = bus.get_object(isys.NM_SERVICE, isys.NM_MANAGER_PATH)
-        props = dbus.Interface(nm, isys.DBUS_PROPS_IFACE)
-
-        i = 0
-        while i < CONNECTION_TIMEOUT:
-            state = props.Get(isys.NM_SERVICE, "State")
-            if nmIsConnected(state):
-                return True
-            i += 1
-            time.sleep(1)
-
-        state = props.Get(isys.NM_SERVICE, "State")
-        if nmIsConnected(state):
-            return True
-
-        return False
+        return NMStateWaiter().waitForManager(nmIsConnected,
+                                              timeout=CONNECTION_TIMEOUT)
 
     # write out current configuration state and wait for NetworkManager
     # to bring the device up, watch NM state and return to the caller
@@ -26,7 +26,6 @@
 import itertools
 import glob
 import iutil
-import isys
 import os
 import time
 import sys
@@ -38,6 +37,7 @@ from flags import flags
 from product import *
 from constants import *
 from upgrade import bindMountDevDirectory
+from relabel import Relabeler
 from storage.errors import *
 
 import logging
@@ -193,41 +193,26 @@ def setupTimezone(anaconda):
 # FIXME: this is a huge gross hack.  hard coded list of files
 # created by anaconda so that we can not be killed by selinux
 def setFileCons(anaconda):
-    def contextCB(arg, directory, files):
-        for file in files:
-            path = os.path.join(directory, file)
-
-            if not os.access(path, os.R_OK):
-                log.warning("%s doesn't exist" % path)
-                continue
-
-            # If the path begins with rootPath, matchPathCon will never match
-            # anything because policy doesn't contain that path.
-            if path.startswith(anaconda.rootPath):
-                path = path.replace(anaconda.rootPath, "")
-
-            ret = isys.resetFileContext(path, anaconda.rootPath)
-            log.info("set fc of %s to %s" % (path, ret))
-
     if flags.selinux:
         log.info("setting SELinux contexts for anaconda created files")
 
-        # Add "/mnt/sysimage" to the front of every path so the glob works.
-        # Then run glob on each element of the list and flatten it into a
-        # single list we can run contextCB across.
-        files = itertools.chain(*map(lambda f: glob.glob("%s/%s" % (anaconda.rootPath, f)),
-                                     relabelFiles))
-        contextCB(None, "", files)
-
-        for dir in relabelDirs + ["/dev/%s" % vg.name for vg in anaconda.storage.vgs]:
-            # Add "/mnt/sysimage" for similar reasons to above.
-            dir = "%s/%s" % (anaconda.rootPath, dir)
-
-            os.path.walk(dir, contextCB, None)
+        try:
+            relabeler = Relabeler(anaconda.rootPath)
+        except OSError as e:
+            log.error("can't load the SELinux file contexts: %s" % e)
+            return
 
-            # os.path.walk won't include the directory we start walking at,
-            # so that needs its context set separtely.
-            contextCB(None, "", [dir])
+        try:
+            # Add "/mnt/sysimage" to the front of every path so the glob
+            # works, then make the matches relative to it again.
+            files = itertools.chain(*map(lambda f: glob.glob("%s/%s" % (anaconda.rootPath, f)),
+                                         relabelFiles))
+            relabeler.relabelFiles([f[len(anaconda.rootPath):] for f in files])
+
+            relabeler.relabelTrees(relabelDirs +
+                                   ["/dev/%s" % vg.name for vg in anaconda.storage.vgs])
+        finally:
+            relabeler.close()
 
     return
 
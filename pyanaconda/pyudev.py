@@ -3,6 +3,7 @@ from __future__ import print_function
 import sys
 import os
 import fnmatch
+import time
 from ctypes import *
 
 
@@ -142,7 +143,8 @@ class UdevDevice(dict):
         property_entry = libudev_udev_device_get_properties_list_entry(udev_device)
 
         while property_entry:
-            name = libudev_udev_list_entry_get_name(property_entry)
+            # the same few dozen keys show up on every device
+            name = intern(libudev_udev_list_entry_get_name(property_entry))
             value = libudev_udev_list_entry_get_value(property_entry)
 
             # lvm outputs values for multiple lvs in one line
@@ -215,6 +217,42 @@ class Udev(object):
 
         return sysfs_paths
 
+    def scan_devices_bulk(self, subsystem=None):
+        """ Return a list of UdevDevice instances for a whole subsystem.
+
+            The devices are created while walking a single enumerate
+            handle, instead of building a list of sysfs paths first and
+            then looking each one of them up separately.
+        """
+        enumerate = libudev_udev_enumerate_new(self.udev)
+
+        if subsystem is not None:
+            rc = libudev_udev_enumerate_add_match_subsystem(enumerate, subsystem)
+            if not rc == 0:
+                print("error: unable to add the match subsystem", file=sys.stderr)
+                libudev_udev_enumerate_unref(enumerate)
+                return []
+
+        rc = libudev_udev_enumerate_scan_devices(enumerate)
+        if not rc == 0:
+            print("error: unable to enumerate the devices", file=sys.stderr)
+            libudev_udev_enumerate_unref(enumerate)
+            return []
+
+        devices = []
+        list_entry = libudev_udev_enumerate_get_list_entry(enumerate)
+        while list_entry:
+            sysfs_path = libudev_udev_list_entry_get_name(list_entry)
+            device = UdevDevice(self.udev, sysfs_path)
+            if device:
+                devices.append(device)
+
+            list_entry = libudev_udev_list_entry_get_next(list_entry)
+
+        libudev_udev_enumerate_unref(enumerate)
+
+        return devices
+
     def scan_devices(self, sysfs_paths=None):
         if sysfs_paths is None:
             sysfs_paths = self.enumerate_devices()
@@ -228,3 +266,27 @@ class Udev(object):
     def unref(self):
         libudev_udev_unref(self.udev)
         self.udev = None
+
+
+if __name__ == "__main__":
+    # compare per-device lookups with a bulk scan of a subsystem
+    subsystem = "block"
+    if len(sys.argv) > 1:
+        subsystem = sys.argv[1]
+
+    udev = Udev()
+
+    start = time.time()
+    per_device = [udev.create_device(path)
+                    for path in udev.enumerate_devices(subsystem=subsystem)]
+    per_device_time = time.time() - start
+
+    start = time.time()
+    bulk = udev.scan_devices_bulk(subsystem=subsystem)
+    bulk_time = time.time() - start
+
+    print("%d %s devices" % (len(bulk), subsystem))
+    print("per-device: %.4fs" % per_device_time)
+    print("bulk:       %.4fs" % bulk_time)
+
+    udev.unref()
@@ -0,0 +1,212 @@
+#
+# relabel.py - reset the SELinux contexts of whole trees of files
+#
+# Copyright (C) 2010  Red Hat, Inc.  All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import errno
+import os
+import stat
+import threading
+import Queue
+
+import logging
+log = logging.getLogger("anaconda")
+
+# number of threads relabeling directories in Relabeler.relabelTrees
+RELABEL_WORKERS = 4
+
+class _SELinux(object):
+    """ The file contexts from the loaded policy, looked up through a single
+        selabel handle instead of matchpathcon.
+    """
+    def __init__(self):
+        import selinux
+        self._selinux = selinux
+        self._handle = selinux.selabel_open(selinux.SELABEL_CTX_FILE, None, 0)
+        # the handle isn't safe to share between threads
+        self._lock = threading.Lock()
+
+    def lookup(self, path, mode):
+        with self._lock:
+            return self._selinux.selabel_lookup(self._handle, path, mode)[1]
+
+    def getfilecon(self, path):
+        return self._selinux.lgetfilecon(path)[1]
+
+    def setfilecon(self, path, con):
+        return self._selinux.lsetfilecon(path, con) == 0
+
+    def close(self):
+        if self._handle is not None:
+            self._selinux.selabel_close(self._handle)
+            self._handle = None
+
+class Relabeler(object):
+    """ Reset files under instroot to the contexts the policy says they
+        should have.
+
+        The file context spec is loaded once, every entry is lstat'ed once
+        and a file's context is only set if it isn't right already.  Rather
+        than one line per file, one line is logged for each tree or list of
+        files relabeled.
+    """
+    def __init__(self, instroot="/", backend=None):
+        self.instroot = instroot
+        self.backend = backend or _SELinux()
+
+    def close(self):
+        self.backend.close()
+
+    def _fullPath(self, path):
+        return os.path.normpath("%s/%s" % (self.instroot, path))
+
+    def relabel(self, path, st):
+        """ Relabel the file at path, relative to instroot, whose lstat
+            result is st.
+
+            Returns True if the context was changed.  Raises OSError if
+            it can't be set.
+        """
+        full_path = self._fullPath(path)
+        try:
+            # the policy has no idea about instroot, or about paths with
+            # two leading slashes
+            con = self.backend.lookup(os.path.normpath("/" + path.lstrip("/")),
+                                      st.st_mode)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                # the policy says to leave it alone
+                return False
+            raise
+        try:
+            if self.backend.getfilecon(full_path) == con:
+                return False
+        except OSError:
+            # no context at all yet
+            pass
+
+        if not self.backend.setfilecon(full_path, con):
+            raise OSError("failed to set context %s" % con)
+        return True
+
+    def _relabelPaths(self, paths, counts):
+        """ Relabel (path, st) tuples, adding to counts of
+            [entries, changed, failed].
+        """
+        for (path, st) in paths:
+            counts[0] += 1
+            try:
+                if self.relabel(path, st):
+                    counts[1] += 1
+            except OSError as e:
+                counts[2] += 1
+                log.warning("failed to set SELinux context of %s: %s" %
+                            (path, e))
+
+    def _log(self, what, counts):
+        log.info("set SELinux contexts of %s: %d changed, %d failed, %d "
+                 "checked" % (what, counts[1], counts[2], counts[0]))
+
+    def relabelFiles(self, paths, what="files"):
+        """ Relabel a list of files relative to instroot. """
+        counts = [0, 0, 0]
+        entries = []
+        for path in paths:
+            try:
+                entries.append((path, os.lstat(self._fullPath(path))))
+            except OSError:
+                log.warning("%s doesn't exist" % path)
+
+        self._relabelPaths(entries, counts)
+        self._log(what, counts)
+        return counts
+
+    def relabelTree(self, top):
+        """ Relabel top, relative to instroot, and everything under it
+            without following symlinks.
+
+            Returns a list of the number of entries checked, changed and
+            the number that couldn't be relabeled.
+        """
+        counts = [0, 0, 0]
+        try:
+            st = os.lstat(self._fullPath(top))
+        except OSError:
+            log.warning("%s doesn't exist" % top)
+            return counts
+
+        dirs = [(top, st)]
+        while dirs:
+            (path, st) = dirs.pop()
+            self._relabelPaths([(path, st)], counts)
+            if not stat.S_ISDIR(st.st_mode):
+                continue
+
+            try:
+                names = os.listdir(self._fullPath(path))
+            except OSError as e:
+                log.warning("can't read %s: %s" % (path, e))
+                continue
+
+            entries = []
+            for name in names:
+                child = os.path.join(path, name)
+                try:
+                    child_st = os.lstat(self._fullPath(child))
+                except OSError:
+                    # removed since we listed it
+                    continue
+                if stat.S_ISDIR(child_st.st_mode):
+                    dirs.append((child, child_st))
+                else:
+                    entries.append((child, child_st))
+            self._relabelPaths(entries, counts)
+
+        self._log(top, counts)
+        return counts
+
+    def relabelTrees(self, tops, workers=RELABEL_WORKERS):
+        """ Relabel several trees, in parallel.
+
+            Returns a dict of relabelTree's counts for each of them.
+        """
+        queue = Queue.Queue()
+        for top in tops:
+            queue.put(top)
+
+        results = {}
+        def worker():
+            while True:
+                try:
+                    top = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    results[top] = self.relabelTree(top)
+                except Exception as e:
+                    # an exception can't cross threads
+                    log.error("failed to relabel %s: %s" % (top, e))
+
+        threads = []
+        for i in range(max(min(workers, len(tops)), 1)):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        return results
@@ -338,6 +338,11 @@ class Storage(object):
         self.dasd = dasd.DASD()
 
         self._nextID = 0
+
+        # sorted views of the device tree, rebuilt when the tree changes
+        self._views = {}
+        self._viewsStamp = None
+
         self.defaultFSType = get_default_filesystem_type()
         self.defaultBootFSType = get_default_filesystem_type(boot=True)
         self._dumpFile = "/tmp/storage.state"
@@ -441,12 +446,52 @@ class Storage(object):
         self.dumpState("initial")
         w.pop()
 
+    def _view(self, name, build):
+        """ Return a copy of the view of the device tree called name.
+
+            Views are built by calling build and kept until the device tree
+            is replaced or its generation changes. Disk ordering also
+            depends on the EDD data, so a new eddDict invalidates them too.
+        """
+        tree = self.devicetree
+        stamp = self._viewsStamp
+        if stamp is None or stamp[0] is not tree or \
+           stamp[1] != tree.generation or stamp[2] is not self.eddDict:
+            self._views = {}
+            self._viewsStamp = (tree, tree.generation, self.eddDict)
+
+        if name not in self._views:
+            self._views[name] = build()
+
+        return self._views[name][:]
+
+    def _withMedia(self, devices, what):
+        """ Return the devices from a view that have media present.
+
+            Whether media is present can change without the device tree
+            hearing about it, like when an md array is started or a disc is
+            inserted, so it is checked on every call instead of being kept
+            in the view.
+        """
+        present = []
+        for device in devices:
+            if not device.mediaPresent:
+                log.info("Skipping %s: %s: No media present" % (what,
+                                                                device.name))
+                continue
+            present.append(device)
+
+        return present
+
     @property
     def devices(self):
         """ A list of all the devices in the device tree. """
-        devices = self.devicetree.devices
-        devices.sort(key=lambda d: d.name)
-        return devices
+        def build():
+            devices = self.devicetree.devices
+            devices.sort(key=lambda d: d.name)
+            return devices
+
+        return self._view("devices", build)
 
     @property
     def disks(self):
@@ -458,15 +503,12 @@ class Storage(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        disks = []
-        for device in self.devicetree.devices:
-            if device.isDisk:
-                if not device.mediaPresent:
-                    log.info("Skipping disk: %s: No media present" % device.name)
-                    continue
-                disks.append(device)
-        disks.sort(key=lambda d: d.name, cmp=self.compareDisks)
-        return disks
+        def build():
+            disks = [d for d in self.devicetree.devices if d.isDisk]
+            disks.sort(key=lambda d: d.name, cmp=self.compareDisks)
+            return disks
+
+        return self._withMedia(self._view("disks", build), "disk")
 
     @property
     def partitioned(self):
@@ -481,19 +523,13 @@ class Storage(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        partitioned = []
-        for device in self.devicetree.devices:
-            if not device.partitioned:
-                continue
+        def build():
+            partitioned = [d for d in self.devicetree.devices
+                             if d.partitioned]
+            partitioned.sort(key=lambda d: d.name)
+            return partitioned
 
-            if not device.mediaPresent:
-                log.info("Skipping device: %s: No media present" % device.name)
-                continue
-
-            partitioned.append(device)
-
-        partitioned.sort(key=lambda d: d.name)
-        return partitioned
+        return self._withMedia(self._view("partitioned", build), "device")
 
     @property
     def partitions(self):
@@ -503,9 +539,12 @@ class Storage(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        partitions = self.devicetree.getDevicesByInstance(PartitionDevice)
-        partitions.sort(key=lambda d: d.name)
-        return partitions
+        def build():
+            partitions = self.devicetree.getDevicesByInstance(PartitionDevice)
+            partitions.sort(key=lambda d: d.name)
+            return partitions
+
+        return self._view("partitions", build)
 
     @property
     def vgs(self):
@@ -515,9 +554,12 @@ class Storage(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        vgs = self.devicetree.getDevicesByType("lvmvg")
-        vgs.sort(key=lambda d: d.name)
-        return vgs
+        def build():
+            vgs = self.devicetree.getDevicesByType("lvmvg")
+            vgs.sort(key=lambda d: d.name)
+            return vgs
+
+        return self._view("vgs", build)
 
     @property
     def lvs(self):
@@ -527,9 +569,12 @@ class Storage(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        lvs = self.devicetree.getDevicesByType("lvmlv")
-        lvs.sort(key=lambda d: d.name)
-        return lvs
+        def build():
+            lvs = self.devicetree.getDevicesByType("lvmlv")
+            lvs.sort(key=lambda d: d.name)
+            return lvs
+
+        return self._view("lvs", build)
 
     @property
     def pvs(self):
@@ -539,10 +584,13 @@ class Storage(object):
             does not necessarily reflect the actual on-disk state of the
             system's disks.
         """
-        devices = self.devicetree.devices
-        pvs = [d for d in devices if d.format.type == "lvmpv"]
-        pvs.sort(key=lambda d: d.name)
-        return pvs
+        def build():
+            devices = self.devicetree.devices
+            pvs = [d for d in devices if d.format.type == "lvmpv"]
+            pvs.sort(key=lambda d: d.name)
+            return pvs
+
+        return self._view("pvs", build)
 
     def unusedPVs(self, vg=None):
         unused = []
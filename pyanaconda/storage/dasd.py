@@ -216,9 +216,10 @@ class DASD:
         if not callback_data:
             return
 
-        if data == '\n':
-            # each newline we see in this output means one more cylinder done
-            self._completedCylinders += 1.0
+        # each newline we see in this output means one more cylinder done
+        done = data.count('\n')
+        if done:
+            self._completedCylinders += done
             callback_data.set(self._completedCylinders / self.totalCylinders)
 
 # Create DASD singleton
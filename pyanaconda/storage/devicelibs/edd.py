@@ -23,66 +23,109 @@
 import os
 import struct
 
+from ..probe import ProbeCache
+
 import logging
 log = logging.getLogger("storage")
 
-def get_edd_dict(devices):
-    """Given an array of devices return a dict with the BIOS ID for them."""
-    edd_dict = {}
+# where the kernel exports the BIOS EDD data and the block device sizes
+EDD_PATH = "/sys/firmware/edd"
+SYSFS_PATH = "/sys"
+
+def _read_sysfs(path):
+    file = open(path, "r")
+    try:
+        return file.read()
+    finally:
+        file.close()
 
+def _get_bios_devices():
+    """ Return a list of (biosdev, mbr signature, sectors) for the BIOS
+        int13 devices. The signature and sector count are in the format
+        used by sysfs, and the sector count is None if it isn't known.
+    """
+    biosdevs = []
     for biosdev in range(80, 80 + 15):
-        sysfspath = "/sys/firmware/edd/int13_dev%d" % biosdev
+        sysfspath = "%s/int13_dev%d" % (EDD_PATH, biosdev)
         if not os.path.exists(sysfspath):
             break # We are done
 
-        sysfspath = "/sys/firmware/edd/int13_dev%d/mbr_signature" % biosdev
+        sysfspath = "%s/int13_dev%d/mbr_signature" % (EDD_PATH, biosdev)
         if not os.path.exists(sysfspath):
             log.warning("No mbrsig for biosdev: %d" % biosdev)
             continue
 
         try:
-            file = open(sysfspath, "r")
-            eddsig = file.read()
-            file.close()
+            eddsig = _read_sysfs(sysfspath)
         except (IOError, OSError) as e:
             log.warning("Error reading EDD mbrsig for %d: %s" %
                         (biosdev, str(e)))
             continue
 
-        sysfspath = "/sys/firmware/edd/int13_dev%d/sectors" % biosdev
+        sysfspath = "%s/int13_dev%d/sectors" % (EDD_PATH, biosdev)
         try:
-            file = open(sysfspath, "r")
-            eddsize = file.read()
-            file.close()
+            eddsize = _read_sysfs(sysfspath)
         except (IOError, OSError) as e:
             eddsize = None
 
+        biosdevs.append((biosdev, eddsig, eddsize))
+
+    return biosdevs
+
+def _read_disk_info(dev):
+    """ Return the mbr signature and sysfs size of dev, in the same format
+        as the EDD data. Either is None if it couldn't be read.
+    """
+    mbrsig = None
+    try:
+        fd = os.open(dev.path, os.O_RDONLY)
+        try:
+            os.lseek(fd, 440, 0)
+            mbrsig = "0x%08x\n" % struct.unpack('I', os.read(fd, 4))
+        finally:
+            os.close(fd)
+    except (OSError, struct.error) as e:
+        log.warning("Error reading mbrsig from disk %s: %s" %
+                    (dev.name, str(e)))
+
+    try:
+        size = _read_sysfs("%s%s/size" % (SYSFS_PATH, dev.sysfsPath))
+    except (IOError, OSError) as e:
+        size = None
+
+    return (mbrsig, size)
+
+def get_edd_dict(devices):
+    """Given an array of devices return a dict with the BIOS ID for them."""
+    edd_dict = {}
+
+    biosdevs = _get_bios_devices()
+    if not biosdevs:
+        return edd_dict
+
+    # read every disk's signature and size once, in parallel, and file
+    # them by signature so each biosdev is matched against a table
+    probes = ProbeCache()
+    for (i, dev) in enumerate(devices):
+        probes.add(i, _read_disk_info, dev)
+    probes.run()
+
+    signatures = {}
+    for (i, dev) in enumerate(devices):
+        (mbrsig, size) = probes.pop(i, (None, None))
+        if mbrsig is not None:
+            signatures.setdefault(mbrsig, []).append((dev, size))
+
+    for (biosdev, eddsig, eddsize) in biosdevs:
         found = []
-        for dev in devices:
-            try:
-                fd = os.open(dev.path, os.O_RDONLY)
-                os.lseek(fd, 440, 0) 
-                mbrsig = struct.unpack('I', os.read(fd, 4))
-                os.close(fd)
-            except OSError as e:
-                log.warning("Error reading mbrsig from disk %s: %s" %
-                            (dev.name, str(e)))
-                continue
-
-            mbrsigStr = "0x%08x\n" % mbrsig
-            if mbrsigStr == eddsig:
-                if eddsize:
-                    sysfspath = "/sys%s/size" % dev.sysfsPath
-                    try:
-                        file = open(sysfspath, "r")
-                        size = file.read()
-                        file.close()
-                    except (IOError, OSError) as e:
-                        log.warning("Error getting size for: %s" % dev.name)
-                        continue
-                    if eddsize != size:
-                        continue
-                found.append(dev.name)
+        for (dev, size) in signatures.get(eddsig, []):
+            if eddsize:
+                if size is None:
+                    log.warning("Error getting size for: %s" % dev.name)
+                    continue
+                if eddsize != size:
+                    continue
+            found.append(dev.name)
 
         if not found:
             log.error("No matching mbr signature found for biosdev %d" %
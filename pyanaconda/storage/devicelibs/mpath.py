@@ -1,4 +1,5 @@
 
+import os
 import re
 
 from ..udev import *
@@ -84,13 +85,88 @@ def parseMultipathOutput(output):
 
     return mpaths
 
+# multipath's built-in blacklist, plus the entries anaconda adds to it.
+# MultipathTopology applies these itself and MultipathConfigWriter writes
+# them out, so if you add anything here it ends up in both.
+BLACKLIST_DEVNODES = ["^(ram|raw|loop|fd|md|dm-|sr|scd|st)[0-9]*",
+                      "^hd[a-z]",
+                      "^dcssblk[0-9]*"]
+
+# (vendor, product, comment) -- a product of None matches any product
+BLACKLIST_DEVICES = [("DGC", "LUNZ", None),
+                     ("IBM", "S/390.*", None),
+                     ("ATA", None,
+                      "don't count normal SATA devices as multipaths"),
+                     ("3ware", None, "don't count 3ware devices as multipaths"),
+                     ("AMCC", None, None),
+                     ("HPT", None, "nor highpoint devices")]
+
+BINDINGS_PATH = "/etc/multipath/bindings"
+SYSFS_PATH = "/sys"
+
+def _sysfs_attr(info, attr):
+    try:
+        f = open("%s%s/%s" % (SYSFS_PATH, info['sysfs_path'], attr))
+        try:
+            return f.read().strip()
+        finally:
+            f.close()
+    except (IOError, KeyError):
+        return None
+
+def _device_wwid(info):
+    """ The wwid multipath would find for a device, as far as udev knows. """
+    return info.get("ID_SERIAL", udev_device_get_serial(info))
+
+def _device_vendor(info):
+    return _sysfs_attr(info, "device/vendor") or info.get("ID_VENDOR", "")
+
+def _device_model(info):
+    return _sysfs_attr(info, "device/model") or info.get("ID_MODEL", "")
+
+def _alias(index):
+    """ The user_friendly_name multipath gives the index-th map: mpatha,
+        ..., mpathz, mpathaa, ...
+    """
+    suffix = ""
+    index += 1
+    while index:
+        (index, rem) = divmod(index - 1, 26)
+        suffix = chr(ord('a') + rem) + suffix
+    return "mpath" + suffix
+
+def _read_bindings(path):
+    """ Return a dict of the alias of each wwid in a bindings file. """
+    bindings = {}
+    try:
+        f = open(path)
+    except IOError:
+        return bindings
+
+    for line in f:
+        fields = line.split("#")[0].split()
+        if len(fields) == 2:
+            bindings[fields[1]] = fields[0]
+    f.close()
+    return bindings
+
 class MultipathTopology(object):
-    def __init__(self, devices_list):
+    """ Work out which disks are paths to the same multipath device.
+
+        Paths are grouped by the wwid in the udev records of devices_list,
+        applying the same blacklist multipath does.  The multipath tool
+        itself is only run for groups whose paths don't look alike, to
+        confirm them.  config is the MultipathConfigWriter whose
+        multipath.conf is in use, if there is one.
+    """
+    def __init__(self, devices_list, config=None):
         self._devices = devices_list
+        self._config = config
         self._nondisks = []
         self._singlepaths = []
         self._multipaths = [] # mpath members
         self._devmap = {}
+        self._logged_config = False
 
         self._build_topology()
 
@@ -99,22 +175,145 @@ class MultipathTopology(object):
         for dev in self._devices:
             self._devmap[dev['name']] = dev
 
+    def _blacklisted(self, info):
+        name = info['name']
+        for devnode in BLACKLIST_DEVNODES:
+            if re.match(devnode, name):
+                return True
+
+        vendor = _device_vendor(info)
+        model = _device_model(info)
+        for (bl_vendor, bl_model, comment) in BLACKLIST_DEVICES:
+            if re.match(bl_vendor, vendor) and \
+               (bl_model is None or re.match(bl_model, model)):
+                return True
+
+        if not self._config:
+            return False
+
+        wwids = (_device_wwid(info), udev_device_get_serial(info))
+        for device in self._config.blacklist_devices:
+            if device.serial:
+                if device.serial in wwids:
+                    return True
+            elif device.vendor and device.model:
+                if re.match(device.vendor, vendor) and \
+                   re.match(device.model, model):
+                    return True
+
+        if self._config.mpaths:
+            # everything but the configured mpaths is blacklisted
+            exceptions = [mp.config.get('wwid') for mp in self._config.mpaths]
+            return not [w for w in wwids if w in exceptions]
+
+        return False
+
+    def _ambiguous(self, disks):
+        """ Paths to one device all look the same; if these don't, their
+            common wwid is not to be trusted.
+        """
+        seen = set()
+        for name in disks:
+            info = self._devmap[name]
+            seen.add((_device_vendor(info), _device_model(info),
+                      _sysfs_attr(info, "size"), info.get("ID_BUS")))
+        return len(seen) > 1
+
+    def _log_config(self):
+        if self._logged_config:
+            return
+        self._logged_config = True
+        try:
+            with open("/etc/multipath.conf") as conf:
+                log.debug("/etc/multipath.conf contents:")
+                map(lambda line: log.debug(line.rstrip()), conf)
+                log.debug("(end of /etc/multipath.conf)")
+        except IOError as e:
+            log.debug("can't read /etc/multipath.conf: %s" % e)
+
+    def _confirm(self, disks):
+        """ Ask multipath which of disks it would put together.
+
+            Returns a dict like parseMultipathOutput, limited to disks.
+        """
+        self._log_config()
+        dev = "/dev/%s" % disks[0]
+        topology = parseMultipathOutput(
+            iutil.execWithCapture("multipath", ["-d", dev]))
+        if not topology:
+            # already set up
+            topology = parseMultipathOutput(
+                iutil.execWithCapture("multipath", ["-ll", dev]))
+
+        confirmed = {}
+        for (mp, members) in topology.items():
+            members = [d for d in members if d in disks]
+            if members:
+                confirmed[mp] = members
+        return confirmed
+
+    def _name_groups(self, groups, reserved=[]):
+        """ Give each wwid in groups the name multipath would use for it.
+
+            Names come from the multipaths section of the config, then the
+            bindings file, and new ones are added to the bindings file so
+            multipath agrees with us later on.  New names are never taken
+            from reserved, the names multipath already gave other groups.
+        """
+        aliases = _read_bindings(BINDINGS_PATH)
+        if self._config:
+            for mp in self._config.mpaths:
+                if 'alias' in mp.config and 'wwid' in mp.config:
+                    aliases[mp.config['wwid']] = mp.config['alias']
+
+        taken = set(aliases.values())
+        taken.update(reserved)
+        names = {}
+        new = []
+        index = 0
+        for (wwid, disks) in groups:
+            name = aliases.get(wwid)
+            if not name:
+                while _alias(index) in taken:
+                    index += 1
+                name = _alias(index)
+                taken.add(name)
+                new.append("%s %s\n" % (name, wwid))
+            names[name] = disks
+
+        if new:
+            try:
+                iutil.mkdirChain(os.path.dirname(BINDINGS_PATH))
+                f = open(BINDINGS_PATH, "a")
+                f.writelines(new)
+                f.close()
+            except (IOError, OSError) as e:
+                log.error("MultipathTopology: can't update %s: %s" %
+                          (BINDINGS_PATH, e))
+
+        return names
+
     def _build_mpath_topology(self):
-        with open("/etc/multipath.conf") as conf:
-            log.debug("/etc/multipath.conf contents:")
-            map(lambda line: log.debug(line.rstrip()), conf)
-            log.debug("(end of /etc/multipath.conf)")
-        self._mpath_topology = parseMultipathOutput(
-            iutil.execWithCapture("multipath", ["-d",]))
-        self._mpath_topology.update(parseMultipathOutput(
-                iutil.execWithCapture("multipath", ["-ll",])))
-
-        delete_keys = []
-        for (mp, disks) in self._mpath_topology.items():
+        # group the paths by wwid, in the order the disks were found
+        groups = {}
+        order = []
+        for dev in self._devices:
+            if not udev_device_is_disk(dev) or self._blacklisted(dev):
+                continue
+            wwid = _device_wwid(dev)
+            if not wwid:
+                continue
+            if wwid not in groups:
+                groups[wwid] = []
+                order.append(wwid)
+            groups[wwid].append(dev['name'])
+
+        named = []
+        confirmed = {}
+        for wwid in order:
+            disks = groups[wwid]
             # single device mpath is not really an mpath, eliminate them:
             if len(disks) < 2:
-                log.info("MultipathTopology: not a multipath: %s" % disks)
-                delete_keys.append(mp)
                 continue
             # some usb cardreaders use multiple lun's (for different slots) and
             # report a fake disk serial which is the same for all the lun's
@@ -124,8 +323,26 @@ class MultipathTopology(object):
             if len(only_non_usbs) == 0:
                 log.info("DeviceToppology: found multi lun usb "
                          "mass storage device: %s" % disks)
-                delete_keys.append(mp)
-        map(lambda key: self._mpath_topology.pop(key), delete_keys)
+                continue
+            if self._ambiguous(disks):
+                log.info("MultipathTopology: confirming multipath %s: %s" %
+                         (wwid, disks))
+                confirmed.update(self._confirm(disks))
+                continue
+            named.append((wwid, disks))
+
+        for (mp, disks) in confirmed.items():
+            if len(disks) < 2:
+                log.info("MultipathTopology: not a multipath: %s" % disks)
+                del confirmed[mp]
+
+        self._mpath_topology = self._name_groups(named, confirmed.keys())
+        self._mpath_topology.update(confirmed)
+
+        self._member_names = {}
+        for (mp, disks) in self._mpath_topology.items():
+            for disk in disks:
+                self._member_names[disk] = mp
 
     def _build_topology(self):
         log_method_call(self)
@@ -172,10 +389,7 @@ class MultipathTopology(object):
 
             Else return None.
         """
-        for (name, members) in self._mpath_topology.items():
-            if mpath_member_name in members:
-                return name
-        return None
+        return self._member_names.get(mpath_member_name)
 
     def multipaths_iter(self):
         """Generator. Yields all the multipath members, in a topology.
@@ -209,33 +423,19 @@ defaults {
 	user_friendly_names yes
 }
 blacklist {
-	devnode "^(ram|raw|loop|fd|md|dm-|sr|scd|st)[0-9]*"
-	devnode "^hd[a-z]"
-	devnode "^dcssblk[0-9]*"
-	device {
-		vendor "DGC"
-		product "LUNZ"
-	}
-	device {
-		vendor "IBM"
-		product "S/390.*"
-	}
-	# don't count normal SATA devices as multipaths
-	device {
-		vendor  "ATA"
-	}
-	# don't count 3ware devices as multipaths
-	device {
-		vendor  "3ware"
-	}
-	device {
-		vendor  "AMCC"
-	}
-	# nor highpoint devices
-	device {
-		vendor  "HPT"
-	}
 """
+        for devnode in BLACKLIST_DEVNODES:
+            ret += '\tdevnode "%s"\n' % devnode
+        for (vendor, product, comment) in BLACKLIST_DEVICES:
+            if comment:
+                ret += '\t# %s\n' % comment
+            ret += '\tdevice {\n'
+            if product is None:
+                ret += '\t\tvendor  "%s"\n' % vendor
+            else:
+                ret += '\t\tvendor "%s"\n' % vendor
+                ret += '\t\tproduct "%s"\n' % product
+            ret += '\t}\n'
         for device in self.blacklist_devices:
             if device.serial:
                 ret += '\twwid "%s"\n' % device.serial
@@ -223,6 +223,9 @@ class Device(object):
         self.parents = parents
         self.kids = 0
 
+        # weak reference to the DeviceTree this device is in, if any
+        self._treeRef = None
+
         # Set this instance's id and increment the counter.
         self.id = Device._id
         Device._id += 1
@@ -335,6 +338,12 @@ class Device(object):
         """ This device's name. """
         return self._name
 
+    def _updateIndexes(self):
+        """ Tell our DeviceTree that our name, path or sysfs path changed. """
+        tree = self._treeRef and self._treeRef()
+        if tree is not None:
+            tree._reindexDevice(self)
+
     @property
     def isleaf(self):
         """ True if this device has no children. """
@@ -576,6 +585,14 @@ class StorageDevice(Device):
         self.sysfsPath = os.path.realpath(path)[4:]
         log.debug("%s sysfsPath set to %s" % (self.name, self.sysfsPath))
 
+    def _setSysfsPath(self, path):
+        self._sysfsPath = path
+        self._updateIndexes()
+
+    sysfsPath = property(lambda d: d._sysfsPath,
+                         lambda d,p: d._setSysfsPath(p),
+                         doc="This device's sysfs path")
+
     @property
     def formatArgs(self):
         """ Device-specific arguments to format creation program. """
@@ -876,6 +893,7 @@ class StorageDevice(Device):
             raise DeviceError("cannot replace active format", self.name)
 
         self._format = format
+        self._updateIndexes()
 
     def _getFormat(self):
         return self._format
@@ -1329,6 +1347,8 @@ class PartitionDevice(StorageDevice):
             self._name = \
                 devicePathToName(self.partedPartition.getDeviceNodeName())
 
+        self._updateIndexes()
+
     def dependsOn(self, dep):
         """ Return True if this device depends on dep. """
         if isinstance(dep, PartitionDevice) and dep.isExtended and \
@@ -1569,6 +1589,9 @@ class PartitionDevice(StorageDevice):
         else:
             self.parents = []
 
+        # our path depends on the disk's device directory
+        self._updateIndexes()
+
     disk = property(lambda p: p._getDisk(), lambda p,d: p._setDisk(d))
 
     @property
@@ -1708,6 +1731,7 @@ class DMDevice(StorageDevice):
             raise DeviceError("cannot rename active device", self.name)
 
         self._name = name
+        self._updateIndexes()
         #self.sysfsPath = "/dev/disk/by-id/dm-name-%s" % self.name
 
     name = property(lambda d: d._name,
@@ -1852,6 +1876,7 @@ class LUKSDevice(DMCryptDevice):
 
     def _postCreate(self):
         self._name = self.slave.format.mapName
+        self._updateIndexes()
         StorageDevice._postCreate(self)
 
     def _postTeardown(self, recursive=False):
@@ -2261,6 +2286,12 @@ class LVMVolumeGroupDevice(DMDevice):
         """ A list of this VG's LVs """
         return self._lvs[:]     # we don't want folks changing our list
 
+    def _updateIndexes(self):
+        """ Our LVs' names and paths are derived from ours. """
+        DMDevice._updateIndexes(self)
+        for lv in getattr(self, "_lvs", []):
+            lv._updateIndexes()
+
     @property
     def complete(self):
         """Check if the vg has all its pvs in the system
@@ -3444,6 +3475,7 @@ class LoopDevice(StorageDevice):
         name = loop.get_loop_name(self.slave.path)
         if name.startswith("loop"):
             self._name = name
+            self._updateIndexes()
 
         return self.name
 
@@ -3478,6 +3510,7 @@ class LoopDevice(StorageDevice):
         StorageDevice._postTeardown(self, recursive=recursive)
         self._name = "tmploop%d" % self.id
         self.sysfsPath = ''
+        self._updateIndexes()
 
     @property
     def slave(self):
@@ -25,11 +25,13 @@ import stat
 import block
 import re
 import shutil
+import weakref
 
 from errors import *
 from devices import *
 from deviceaction import *
 from partitioning import shouldClear
+from probe import ProbeCache
 from pykickstart.constants import *
 import formats
 import devicelibs.mdraid
@@ -154,12 +156,31 @@ class DeviceTree(object):
         except for resize actions.
     """
 
+    # indexes used for device lookups. name, path, sysfs and majorminor are
+    # authoritative since devices notify the tree when those change; uuid
+    # and label live on the devices' formats, which can change without the
+    # tree's knowledge, so those are only used as hints.
+    _indexNames = ("name", "path", "sysfs", "majorminor", "uuid", "label")
+
     def __init__(self, intf=None, conf=None, passphrase=None, luksDict=None,
                  iscsi=None, dasd=None):
         # internal data members
         self._devices = []
         self._actions = []
 
+        # lookup indexes, keyed by index name and then by identifier. each
+        # value is a list of devices in the order they were added. the
+        # identifiers a device is filed under are kept in self._indexed,
+        # keyed by id(device), so they can be dropped on removal/rename.
+        self._indexes = dict((k, {}) for k in self._indexNames)
+        self._indexed = {}
+        self._indexSeq = 0
+
+        # bumped whenever a device is added, removed or changes its name,
+        # path or format, so views of the tree can tell when they're stale
+        self._generation = 0
+        self._devicesCache = None
+
         # indicates whether or not the tree has been fully populated
         self.populated = False
 
@@ -200,6 +221,9 @@ class DeviceTree(object):
 
         self._cleanup = False
 
+        # results of format probes run in parallel during populate
+        self._probes = ProbeCache()
+
     def setDiskImages(self, images):
         """ Set the disk images and reflect them in exclusiveDisks. """
         self.diskImages = images
@@ -224,31 +248,105 @@ class DeviceTree(object):
                     log.debug("  removing obsolete action '%s'" % obsolete)
                     self._actions.remove(obsolete)
 
+    def _actionDeviceAncestors(self, device, extended):
+        """ Return a list of the devices device depends on.
+
+            This mirrors Device.dependsOn, including the dependency of
+            logical partitions on the extended partition of their disk.
+            extended is a dict of extended partition lists hashed by disk id.
+        """
+        ancestors = []
+        seen = set()
+        stack = [device]
+        while stack:
+            dev = stack.pop()
+            deps = list(dev.parents)
+            if isinstance(dev, PartitionDevice) and dev.isLogical and \
+               dev.disk is not None:
+                deps.extend(extended.get(dev.disk.id, []))
+
+            for dep in deps:
+                if dep.id not in seen:
+                    seen.add(dep.id)
+                    ancestors.append(dep)
+                    stack.append(dep)
+
+        return ancestors
+
     def sortActions(self):
         """ Sort actions based on dependencies. """
         if not self._actions:
             return
 
-        edges = []
+        # Bucket the actions so we only have to ask actions that could
+        # possibly be related whether they require each other. An action
+        # can only require actions on the same device, on devices it
+        # depends on or that depend on it, on other partitions of the same
+        # disk, or on other lvs of the same vg.
+        by_device = {}          # action indices hashed by device id
+        dependents = {}         # action indices hashed by ancestor id
+        by_disk = {}            # partition action indices hashed by disk id
+        by_vg = {}              # lv action indices hashed by vg id
+        extended = {}           # extended partitions hashed by disk id
+        by_type = {}            # action indices hashed by action type
+        for (idx, action) in enumerate(self._actions):
+            device = action.device
+            by_device.setdefault(device.id, []).append(idx)
+            by_type.setdefault(action.type, []).append(idx)
+            if isinstance(device, PartitionDevice) and device.disk is not None:
+                by_disk.setdefault(device.disk.id, []).append(idx)
+                if device.isExtended and \
+                   device not in extended.get(device.disk.id, []):
+                    extended.setdefault(device.disk.id, []).append(device)
+            elif isinstance(device, LVMLogicalVolumeDevice):
+                by_vg.setdefault(device.vg.id, []).append(idx)
+
+        ancestors = {}
+        for (idx, action) in enumerate(self._actions):
+            device = action.device
+            if device.id not in ancestors:
+                ancestors[device.id] = self._actionDeviceAncestors(device,
+                                                                   extended)
+            for dep in ancestors[device.id]:
+                dependents.setdefault(dep.id, []).append(idx)
+
+        edges = set()
 
         # collect all ordering requirements for the actions
-        for action in self._actions:
-            action_idx = self._actions.index(action)
-            children = []
-            for _action in self._actions:
-                if _action == action:
-                    continue
-
-                # create edges based on both action type and dependencies.
-                if action.type > _action.type or _action.requires(action):
-                    children.append(_action)
-
-            for child in children:
-                child_idx = self._actions.index(child)
-                edges.append((action_idx, child_idx))
+        for (idx, action) in enumerate(self._actions):
+            device = action.device
+            candidates = set(by_device[device.id])
+            candidates.update(dependents.get(device.id, []))
+            for dep in ancestors[device.id]:
+                candidates.update(by_device.get(dep.id, []))
+            if isinstance(device, PartitionDevice) and device.disk is not None:
+                candidates.update(by_disk[device.disk.id])
+            elif isinstance(device, LVMLogicalVolumeDevice):
+                candidates.update(by_vg[device.vg.id])
+
+            candidates.discard(idx)
+            for _idx in candidates:
+                if action.requires(self._actions[_idx]):
+                    edges.add((_idx, idx))
+
+        # Actions of a higher type come before all actions of a lower type.
+        # Rather than adding an edge for every such pair we put a marker
+        # item between consecutive types and link each type's actions to
+        # the markers on either side of it.
+        items = range(len(self._actions))
+        types = sorted(by_type.keys(), reverse=True)
+        for (i, _type) in enumerate(types[:-1]):
+            marker = ("after", _type)
+            items.append(marker)
+            for idx in by_type[_type]:
+                edges.add((idx, marker))
+            for idx in by_type[types[i + 1]]:
+                edges.add((marker, idx))
+            if i:
+                edges.add((("after", types[i - 1]), marker))
 
         # create a graph reflecting the ordering information we have
-        graph = tsort.create_graph(range(len(self._actions)), edges)
+        graph = tsort.create_graph(items, sorted(edges))
 
         # perform a topological sort based on the graph's contents
         order = tsort.tsort(graph)
@@ -256,7 +354,8 @@ class DeviceTree(object):
         # now replace self._actions with a sorted version of the same list
         actions = []
         for idx in order:
-            actions.append(self._actions[idx])
+            if isinstance(idx, int):
+                actions.append(self._actions[idx])
         self._actions = actions
 
     def processActions(self, dryRun=None):
@@ -324,22 +423,126 @@ class DeviceTree(object):
                         device.updateName()
                         device.format.device = device.path
 
+    def _deviceIndexKeys(self, device):
+        """ Return a dict of index name -> list of keys for device. """
+        keys = {"name": [device.name],
+                "path": [device.path],
+                "sysfs": [],
+                "majorminor": [],
+                "uuid": [],
+                "label": []}
+
+        sysfsPath = getattr(device, "sysfsPath", None)
+        if sysfsPath:
+            keys["sysfs"].append(sysfsPath)
+
+        major = getattr(device, "major", None)
+        minor = getattr(device, "minor", None)
+        if major is not None and minor is not None:
+            keys["majorminor"].append((major, minor))
+
+        format = getattr(device, "format", None)
+        for uuid in (getattr(device, "uuid", None),
+                     getattr(format, "uuid", None)):
+            if uuid and uuid not in keys["uuid"]:
+                keys["uuid"].append(uuid)
+
+        label = getattr(format, "label", None)
+        if label:
+            keys["label"].append(label)
+
+        return keys
+
+    def _indexDevice(self, device, seq=None):
+        """ File device in the lookup indexes. """
+        if seq is None:
+            seq = self._indexSeq
+            self._indexSeq += 1
+
+        keys = self._deviceIndexKeys(device)
+        for (index, values) in keys.items():
+            for key in values:
+                self._indexes[index].setdefault(key, []).append(device)
+
+        self._indexed[id(device)] = (device, seq, keys)
+        device._treeRef = weakref.ref(self)
+
+    def _unindexDevice(self, device):
+        """ Remove device from the lookup indexes. Return its sequence. """
+        (_device, seq, keys) = self._indexed.pop(id(device))
+        for (index, values) in keys.items():
+            for key in values:
+                bucket = self._indexes[index].get(key, [])
+                for (i, d) in enumerate(bucket):
+                    if d is device:
+                        del bucket[i]
+                        break
+
+                if not bucket:
+                    self._indexes[index].pop(key, None)
+
+        if device._treeRef is not None and \
+           device._treeRef() is self:
+            device._treeRef = None
+
+        return seq
+
+    def _reindexDevice(self, device):
+        """ Refresh the lookup indexes after device's identifiers changed.
+
+            This is called by the devices themselves when they are renamed
+            or otherwise change one of the identifiers we index on.
+        """
+        entry = self._indexed.get(id(device))
+        if entry is None or entry[0] is not device:
+            # a copy of one of our devices, or something we don't hold
+            return
+
+        seq = self._unindexDevice(device)
+        self._indexDevice(device, seq=seq)
+        self._generation += 1
+
+    def _isInTree(self, device):
+        """ Return True if this exact device instance is in the tree. """
+        entry = self._indexed.get(id(device))
+        return entry is not None and entry[0] is device
+
+    def _lookup(self, index, key, match):
+        """ Return the first device in the tree indexed under key.
+
+            match is a function that verifies a candidate still matches,
+            which protects against stale index entries. When more than one
+            device matches, the one that was added to the tree first wins,
+            as it would for a linear scan of the device list.
+        """
+        found = None
+        found_seq = None
+        for device in self._indexes[index].get(key, []):
+            seq = self._indexed[id(device)][1]
+            if (found is None or seq < found_seq) and match(device):
+                found = device
+                found_seq = seq
+
+        return found
+
     def _addDevice(self, newdev):
         """ Add a device to the tree.
 
             Raise ValueError if the device's identifier is already
             in the list.
         """
-        if newdev.path in [d.path for d in self._devices] and \
+        if self._indexes["path"].get(newdev.path) and \
            not isinstance(newdev, NoDevice):
             raise ValueError("device is already in tree")
 
         # make sure this device's parent devices are in the tree already
         for parent in newdev.parents:
-            if parent not in self._devices:
+            if not self._isInTree(parent):
                 raise DeviceTreeError("parent device not in tree")
 
         self._devices.append(newdev)
+        self._indexDevice(newdev)
+        self._generation += 1
         log.debug("added %s %s (id %d) to device tree" % (newdev.type,
                                                           newdev.name,
                                                           newdev.id))
@@ -349,7 +552,7 @@ class DeviceTree(object):
 
             Only leaves may be removed.
         """
-        if dev not in self._devices:
+        if not self._isInTree(dev):
             raise ValueError("Device '%s' not in tree" % dev.name)
 
         if not dev.isleaf and not force:
@@ -377,6 +580,8 @@ class DeviceTree(object):
                     device.updateName()
 
         self._devices.remove(dev)
+        self._unindexDevice(dev)
+        self._generation += 1
         log.debug("removed %s %s (id %d) from device tree" % (dev.type,
                                                               dev.name,
                                                               dev.id))
@@ -393,15 +598,15 @@ class DeviceTree(object):
             get here.
         """
         if not (action.isCreate and action.isDevice) and \
-           action.device not in self._devices:
+           not self._isInTree(action.device):
             raise DeviceTreeError("device is not in the tree")
         elif (action.isCreate and action.isDevice):
             # this allows multiple create actions w/o destroy in between;
             # we will clean it up before processing actions
             #raise DeviceTreeError("device is already in the tree")
-            if action.device in self._devices:
+            if self._isInTree(action.device):
                 self._removeDevice(action.device)
-            for d in self._devices:
+            for d in self._indexes["path"].get(action.device.path, [])[:]:
                 if d.path == action.device.path:
                     self._removeDevice(d)
 
@@ -1359,7 +1564,10 @@ class DeviceTree(object):
 
             if not md_name:
                 # try to name the array based on the preferred minor
-                md_info = devicelibs.mdraid.mdexamine(device.path)
+                md_info = self._probes.pop(("mdexamine",
+                                            udev_device_get_sysfs_path(info)))
+                if md_info is None:
+                    md_info = devicelibs.mdraid.mdexamine(device.path)
                 md_path = md_info.get("device", "")
                 md_name = devicePathToName(md_info.get("device", ""))
                 if md_name:
@@ -1508,11 +1716,7 @@ class DeviceTree(object):
 
         # set up the common arguments for the format constructor
         args = [format_type]
-        kwargs = {"uuid": uuid,
-                  "label": label,
-                  "device": device.path,
-                  "serial": serial,
-                  "exists": True}
+        kwargs = self._udevFormatKwargs(info, device.path)
 
         # set up type-specific arguments for the format constructor
         if format_type == "multipath_member":
@@ -1557,7 +1761,14 @@ class DeviceTree(object):
 
         try:
             log.debug("type detected on '%s' is '%s'" % (name, format_type,))
-            device.format = formats.getFormat(*args, **kwargs)
+            format = self._probes.pop(self._formatProbeKey(info, args,
+                                                           kwargs))
+            if format is None:
+                format = formats.getFormat(*args, **kwargs)
+            else:
+                # it was probed through the node udev named
+                format.device = device.path
+            device.format = format
         except FSError:
             log.debug("type '%s' on '%s' invalid, assuming no format" %
                       (format_type, name,))
@@ -1584,6 +1795,130 @@ class DeviceTree(object):
         elif device.format.type == "multipath_member":
             self.handleMultipathMemberFormat(info, device)
 
+    def _udevFormatKwargs(self, info, path):
+        """ Return the common format constructor arguments for a device. """
+        return {"uuid": udev_device_get_uuid(info),
+                "label": udev_device_get_label(info),
+                "device": path,
+                "serial": udev_device_get_serial(info),
+                "exists": True}
+
+    def _formatProbeKey(self, info, args, kwargs):
+        """ Return the ProbeCache key for a format probe.
+
+            The key uses the device's sysfs path rather than its node, since
+            the node udev names isn't always the device's path (md arrays).
+        """
+        items = [(k, v) for (k, v) in kwargs.items() if k != "device"]
+        items.sort()
+        return ("format", udev_device_get_sysfs_path(info), tuple(args),
+                tuple(items))
+
+    def _mayProbe(self, info, known):
+        """ Return True if info is a device it is safe to probe early.
+
+            This is a side-effect free and more conservative version of
+            isIgnored, used to avoid reading devices that will be ignored.
+            known is a dict of sysfs path -> udev info of all the devices
+            udev knows about, which is where the slaves of dm and md
+            devices are looked up.
+        """
+        name = udev_device_get_name(info)
+        if name.startswith("ram") or name.startswith("loop"):
+            return False
+
+        if udev_device_is_multipath_member(info) or \
+           udev_device_is_biosraid_member(info):
+            return False
+
+        return self._mayUse(info, known)
+
+    def _mayUse(self, info, known):
+        """ Return True if info isn't on an ignored or non-exclusive disk.
+
+            Probing happens before addUdevDevice has decided anything, so
+            dm and md devices are only used if all of their slaves are.
+        """
+        name = udev_device_get_name(info)
+        sysfs_path = udev_device_get_sysfs_path(info)
+        if not sysfs_path or name in self._ignoredDisks:
+            return False
+
+        if udev_device_is_dm(info) or udev_device_is_md(info):
+            slaves_dir = "/sys%s/slaves" % sysfs_path
+            try:
+                slaves = [os.path.normpath("%s/slaves/%s" % (sysfs_path,
+                                os.readlink("%s/%s" % (slaves_dir, slave))))
+                          for slave in os.listdir(slaves_dir)]
+            except OSError:
+                return False
+
+            for slave in slaves:
+                if slave not in known or \
+                   not self._mayUse(known[slave], known):
+                    return False
+            return bool(slaves)
+
+        if udev_device_is_partition(info):
+            disk = os.path.basename(os.path.dirname(sysfs_path))
+        elif udev_device_is_disk(info):
+            disk = name
+        else:
+            return False
+
+        return disk not in self._ignoredDisks and \
+               (not self.exclusiveDisks or disk in self.exclusiveDisks)
+
+    def _probeFormats(self, devices):
+        """ Probe the formats of devices in parallel before adding them.
+
+            Instantiating the format of an existing filesystem runs tools
+            like dumpe2fs and resize2fs to find its size and minimum size,
+            and naming an inactive md array runs mdadm --examine on one of
+            its members. Those only read the device itself, so they are run
+            here in a pool of threads. handleUdevDeviceFormat and
+            handleUdevMDMemberFormat then pick up the results while the
+            tree itself is still built serially.
+        """
+        active_md_uuids = set()
+        known = {}
+        for dev in self.topology.devices_iter():
+            if udev_device_is_md(dev) and dev.get("MD_UUID"):
+                active_md_uuids.add(dev["MD_UUID"])
+            known[udev_device_get_sysfs_path(dev)] = dev
+
+        devices = list(devices)
+        for info in devices:
+            known.setdefault(udev_device_get_sysfs_path(info), info)
+
+        for info in devices:
+            format_type = udev_device_get_format(info)
+            if not format_type or not self._mayProbe(info, known):
+                continue
+
+            name = udev_device_get_name(info)
+            if udev_device_is_dm(info):
+                path = "/dev/mapper/%s" % name
+            else:
+                path = "/dev/%s" % name
+
+            fmt_class = formats.get_device_format_class(format_type)
+            if fmt_class and issubclass(fmt_class, formats.fs.FS):
+                args = [format_type]
+                kwargs = self._udevFormatKwargs(info, path)
+                self._probes.add(self._formatProbeKey(info, args, kwargs),
+                                 formats.getFormat, *args, **kwargs)
+            elif format_type in formats.mdraid.MDRaidMember._udevTypes and \
+                 not udev_device_is_md(info) and info.get("MD_UUID") and \
+                 info["MD_UUID"] not in active_md_uuids:
+                # only the first member of an inactive array gets examined
+                active_md_uuids.add(info["MD_UUID"])
+                self._probes.add(("mdexamine",
+                                  udev_device_get_sysfs_path(info)),
+                                 devicelibs.mdraid.mdexamine, path)
+
+        self._probes.run()
+
     def updateDeviceFormat(self, device):
         log.debug("updating format of device: %s" % device)
         iutil.notify_kernel("/sys%s" % device.sysfsPath)
@@ -1788,12 +2123,16 @@ class DeviceTree(object):
         open("/etc/multipath.conf", "w+").write(cfg)
         del cfg
 
-        self.topology = devicelibs.mpath.MultipathTopology(udev_get_block_devices())
+        self.topology = devicelibs.mpath.MultipathTopology(
+                            udev_get_block_devices(),
+                            config=self.__multipathConfigWriter)
         log.info("devices to scan: %s" %
                  [d['name'] for d in self.topology.devices_iter()])
+        self._probeFormats(self.topology.devices_iter())
+        # udev db entries of the devices we have scanned, hashed by sysfs path
         old_devices = {}
         for dev in self.topology.devices_iter():
-            old_devices[dev['name']] = dev
+            old_devices[dev['sysfs_path']] = dev
             self.addUdevDevice(dev)
 
         # Having found all the disks, we can now find all the multipaths built
@@ -1824,15 +2163,10 @@ class DeviceTree(object):
         del cfg
 
         # Now, loop and scan for devices that have appeared since the two above
-        # blocks or since previous iterations.
+        # blocks or since previous iterations. Only the udev db entries of
+        # new devices get read.
         while True:
-            devices = []
-            new_devices = udev_get_block_devices()
-
-            for new_device in new_devices:
-                if not old_devices.has_key(new_device['name']):
-                    old_devices[new_device['name']] = new_device
-                    devices.append(new_device)
+            devices = udev_get_new_block_devices(old_devices)
 
             if len(devices) == 0:
                 # nothing is changing -- time to setup lvm lvs and scan them
@@ -1842,17 +2176,19 @@ class DeviceTree(object):
                 if self._setupLvs():
                     # remove any logical volume devices from old_devices so
                     # they will be re-scanned to get their formatting handled
-                    for (old_name, old_device) in old_devices.items():
-                        if udev_device_is_dm_lvm(old_device):
-                            del old_devices[old_name]
+                    for (old_path, old_device) in old_devices.items():
+                        if old_device and udev_device_is_dm_lvm(old_device):
+                            del old_devices[old_path]
                     continue
                 # nothing is changing -- we are finished building devices
                 break
 
             log.info("devices to scan: %s" % [d['name'] for d in devices])
+            self._probeFormats(devices)
             for dev in devices:
                 self.addUdevDevice(dev)
 
+        self._probes.clear()
         self.populated = True
 
         # After having the complete tree we make sure that the system
@@ -1881,26 +2217,37 @@ class DeviceTree(object):
         if not path:
             return None
 
-        found = None
+        return self._lookup("sysfs", path, lambda d: d.sysfsPath == path)
+
+    def getDeviceByMajorMinor(self, major, minor):
+        if major is None or minor is None:
+            return None
+
+        key = (major, minor)
+        return self._lookup("majorminor", key,
+                            lambda d: (d.major, d.minor) == key)
+
+    def _scanForDevice(self, match):
+        """ Find a device by linear scan and refresh its index entries.
+
+            This is the fallback for the hint indexes (uuid, label), whose
+            keys can change on a device's format without the tree noticing.
+        """
         for device in self._devices:
-            if device.sysfsPath == path:
-                found = device
-                break
+            if match(device):
+                self._reindexDevice(device)
+                return device
 
-        return found
+        return None
 
     def getDeviceByUuid(self, uuid):
         if not uuid:
             return None
 
-        found = None
-        for device in self._devices:
-            if device.uuid == uuid:
-                found = device
-                break
-            elif device.format.uuid == uuid:
-                found = device
-                break
+        match = lambda d: d.uuid == uuid or d.format.uuid == uuid
+        found = self._lookup("uuid", uuid, match)
+        if found is None:
+            found = self._scanForDevice(match)
 
         return found
 
@@ -1918,15 +2265,26 @@ class DeviceTree(object):
         if not label:
             return None
 
-        found = None
-        for device in self._devices:
-            _label = getattr(device.format, "label", None)
-            if not _label:
-                continue
+        match = lambda d: getattr(d.format, "label", None) == label
+        found = self._lookup("label", label, match)
+        if found is None:
+            found = self._scanForDevice(match)
 
-            if _label == label:
-                found = device
-                break
+        return found
+
+    def _lookupLVMAware(self, index, key, attr):
+        """ Look up a device by name or path, allowing for lvm's doubled
+            dashes in the names of vgs and lvs.
+        """
+        found = self._lookup(index, key, lambda d: getattr(d, attr) == key)
+        _key = key.replace("--", "-")
+        if _key != key:
+            lvm = self._lookup(index, _key,
+                               lambda d: d.type in ("lvmlv", "lvmvg") and
+                                         getattr(d, attr) == _key)
+            if lvm and (found is None or
+                        self._indexed[id(lvm)][1] < self._indexed[id(found)][1]):
+                found = lvm
 
         return found
 
@@ -1936,16 +2294,7 @@ class DeviceTree(object):
             log_method_return(self, None)
             return None
 
-        found = None
-        for device in self._devices:
-            if device.name == name:
-                found = device
-                break
-            elif (device.type == "lvmlv" or device.type == "lvmvg") and \
-                    device.name == name.replace("--","-"):
-                found = device
-                break
-
+        found = self._lookupLVMAware("name", name, "name")
         log_method_return(self, found)
         return found
 
@@ -1955,16 +2304,7 @@ class DeviceTree(object):
             log_method_return(self, None)
             return None
 
-        found = None
-        for device in self._devices:
-            if device.path == path:
-                found = device
-                break
-            elif (device.type == "lvmlv" or device.type == "lvmvg") and \
-                    device.path == path.replace("--","-"):
-                found = device
-                break
-
+        found = self._lookupLVMAware("path", path, "path")
         log_method_return(self, found)
         return found
 
@@ -1975,18 +2315,31 @@ class DeviceTree(object):
     def getDevicesByInstance(self, device_class):
         return [d for d in self._devices if isinstance(d, device_class)]
 
+    @property
+    def generation(self):
+        """ A number that changes every time the set of devices does.
+
+            This covers devices being added and removed as well as devices
+            getting a new name, path or format.
+        """
+        return self._generation
+
     @property
     def devices(self):
         """ List of device instances """
-        devices = []
-        for device in self._devices:
-            if device.path in [d.path for d in devices] and \
-               not isinstance(device, NoDevice):
-                raise DeviceTreeError("duplicate paths in device tree")
+        if self._devicesCache is None or \
+           self._devicesCache[0] != self._generation:
+            paths = set()
+            for device in self._devices:
+                if device.path in paths and \
+                   not isinstance(device, NoDevice):
+                    raise DeviceTreeError("duplicate paths in device tree")
 
-            devices.append(device)
+                paths.add(device.path)
 
-        return devices
+            self._devicesCache = (self._generation, self._devices[:])
+
+        return self._devicesCache[1][:]
 
     @property
     def filesystems(self):
@@ -733,19 +733,19 @@ def removeNewPartitions(disks, partitions):
             log.debug("removing empty extended partition from %s" % disk.name)
             disk.format.partedDisk.removePartition(extended)
 
-def addPartition(disklabel, free, part_type, size):
-    """ Return new partition after adding it to the specified disk.
+def getPartitionGeometry(disklabel, free, part_type, size):
+    """ Return the geometry of a new partition in a free region.
 
         Arguments:
 
-            disklabel -- disklabel instance to add partition to
+            disklabel -- disklabel instance the partition would be added to
             free -- where to add the partition (parted.Geometry instance)
             part_type -- partition type (parted.PARTITION_* constant)
             size -- size (in MB) of the new partition
 
-        The new partition will be aligned.
+        The geometry will be aligned.
 
-        Return value is a parted.Partition instance.
+        Return value is a parted.Geometry instance.
 
     """
     start = free.start
@@ -779,6 +779,25 @@ def addPartition(disklabel, free, part_type, size):
     if max_length and new_geom.length > max_length:
         raise PartitioningError("requested size exceeds maximum allowed")
 
+    return new_geom
+
+def addPartition(disklabel, free, part_type, size):
+    """ Return new partition after adding it to the specified disk.
+
+        Arguments:
+
+            disklabel -- disklabel instance to add partition to
+            free -- where to add the partition (parted.Geometry instance)
+            part_type -- partition type (parted.PARTITION_* constant)
+            size -- size (in MB) of the new partition
+
+        The new partition will be aligned.
+
+        Return value is a parted.Partition instance.
+
+    """
+    new_geom = getPartitionGeometry(disklabel, free, part_type, size)
+
     # create the partition and add it to the disk
     partition = parted.Partition(disk=disklabel.partedDisk,
                                  type=part_type,
@@ -938,6 +957,7 @@ def allocatePartitions(storage, disks, partitions, freespace):
             all_disks[disk.path] = disk
 
     removeNewPartitions(disks, new_partitions)
+    estimator = GrowthEstimator(disklabels, all_disks, freespace)
 
     for _part in new_partitions:
         if _part.partedPartition and _part.isExtended:
@@ -1055,58 +1075,8 @@ def allocatePartitions(storage, disks, partitions, freespace):
                 update = True
                 if _part.req_grow:
                     log.debug("evaluating growth potential for new layout")
-                    new_growth = 0
-                    for disk_path in disklabels.keys():
-                        log.debug("calculating growth for disk %s" % disk_path)
-                        # Now we check, for growable requests, which of the two
-                        # free regions will allow for more growth.
-
-                        # set up chunks representing the disks' layouts
-                        temp_parts = []
-                        for _p in new_partitions[:new_partitions.index(_part)]:
-                            if _p.disk.path == disk_path:
-                                temp_parts.append(_p)
-
-                        # add the current request to the temp disk to set up
-                        # its partedPartition attribute with a base geometry
-                        if disk_path == _disk.path:
-                            temp_part = addPartition(disklabel,
-                                                     best,
-                                                     new_part_type,
-                                                     _part.req_size)
-                            _part.partedPartition = temp_part
-                            _part.disk = _disk
-                            temp_parts.append(_part)
-
-                        chunks = getDiskChunks(all_disks[disk_path],
-                                               temp_parts, freespace)
-
-                        # grow all growable requests
-                        disk_growth = 0
-                        disk_sector_size = disklabels[disk_path].partedDevice.sectorSize
-                        for chunk in chunks:
-                            chunk.growRequests()
-                            # record the growth for this layout
-                            new_growth += chunk.growth
-                            disk_growth += chunk.growth
-                            for req in chunk.requests:
-                                log.debug("request %d (%s) growth: %d (%dMB) "
-                                          "size: %dMB" %
-                                          (req.partition.id,
-                                           req.partition.name,
-                                           req.growth,
-                                           sectorsToSize(req.growth,
-                                                         disk_sector_size),
-                                           sectorsToSize(req.growth + req.base,
-                                                         disk_sector_size)))
-                        log.debug("disk %s growth: %d (%dMB)" %
-                                        (disk_path, disk_growth,
-                                         sectorsToSize(disk_growth,
-                                                       disk_sector_size)))
-
-                    disklabel.partedDisk.removePartition(temp_part)
-                    _part.partedPartition = None
-                    _part.disk = None
+                    new_growth = estimator.totalGrowth(_part, _disk, best,
+                                                       new_part_type)
 
                     log.debug("total growth: %d sectors" % new_growth)
 
@@ -1185,6 +1155,7 @@ def allocatePartitions(storage, disks, partitions, freespace):
         # parted modifies the partition in the process of adding it to
         # the disk, so we need to grab the latest version...
         _part.partedPartition = disklabel.partedDisk.getPartitionByPath(_part.path)
+        estimator.addPartition(_part)
 
 
 class Request(object):
@@ -1342,114 +1313,120 @@ class Chunk(object):
         """ True if we are finished growing all requests in this chunk. """
         return self.remaining == 0
 
-    def trimOverGrownRequest(self, req, base=None):
-        """ Enforce max growth and return extra sectors to the pool. """
-        req_end = req.partition.partedPartition.geometry.end
-        req_start = req.partition.partedPartition.geometry.start
-
-        # Establish the current total number of sectors of growth for requests
-        # that lie before this one within this chunk. We add the total count
-        # to this request's end sector to obtain the end sector for this
-        # request, including growth of earlier requests but not including
-        # growth of this request. Maximum growth values are obtained using
-        # this end sector and various values for maximum end sector.
-        growth = 0
-        for request in self.requests:
-            if request.partition.partedPartition.geometry.start < req_start:
-                growth += request.growth
-        req_end += growth
-
-        # obtain the set of possible maximum sectors-of-growth values for this
-        # request and use the smallest
-        limits = []
-
-        # disklabel-specific maximum sector
-        max_sector = req.partition.partedPartition.disk.maxPartitionStartSector
-        limits.append(max_sector - req_end)
-
-        # 2TB limit on bootable partitions, regardless of disklabel
-        if req.partition.req_bootable:
-            limits.append(sizeToSectors(2*1024*1024, self.sectorSize) - req_end)
-
-        # request-specific maximum (see Request.__init__, above, for details)
-        if req.max_growth:
-            limits.append(req.max_growth)
-
-        max_growth = min(limits)
-
-        if max_growth and req.growth >= max_growth:
-            if req.growth > max_growth:
-                # we've grown beyond the maximum. put some back.
-                extra = req.growth - max_growth
-                log.debug("taking back %d (%dMB) from %d (%s)" %
-                            (extra,
-                             sectorsToSize(extra, self.sectorSize),
-                             req.partition.id, req.partition.name))
-                self.pool += extra
-                req.growth = max_growth
-
-            # We're done growing this partition, so it no longer
-            # factors into the growable base used to determine
-            # what fraction of the pool each request gets.
-            if base is not None:
-                base -= req.base
-            req.done = True
-
-        return base
-
     def growRequests(self):
-        """ Calculate growth amounts for requests in this chunk. """
+        """ Calculate growth amounts for requests in this chunk.
+
+            Free sectors are handed out in rounds. In each round every
+            request that can still grow gets a share of the pool in
+            proportion to its base size, relative to the total base size
+            of the requests still growing at the start of the round. A
+            request that reaches its maximum growth gives the excess back
+            to the pool and stops growing. Rounds continue until the pool
+            stops shrinking, and whatever is left after that goes to the
+            first request that can still take it.
+
+            The maximum growth of a request depends on the growth of the
+            requests before it in the chunk, since that moves its end
+            sector, so all of this is done in one pass per round over the
+            requests sorted by start sector.
+        """
         log.debug("Chunk.growRequests: %s" % self)
 
         # sort the partitions by start sector
         self.requests.sort(key=lambda r: r.partition.partedPartition.geometry.start)
-
-        # we use this to hold the base for the next loop through the
-        # chunk's requests since we want the base to be the same for
-        # all requests in any given growth iteration
-        new_base = self.base
+        count = len(self.requests)
+
+        bases = [r.base for r in self.requests]
+        growth = [r.growth for r in self.requests]
+        done = [r.done for r in self.requests]
+
+        # the parts of the maximum growth of each request that don't depend
+        # on the other requests' growth
+        ends = []
+        max_sectors = []
+        boot_sectors = []
+        max_growth = [r.max_growth for r in self.requests]
+        boot_limit = sizeToSectors(2*1024*1024, self.sectorSize)
+        for r in self.requests:
+            partition = r.partition.partedPartition
+            ends.append(partition.geometry.end)
+            max_sectors.append(partition.disk.maxPartitionStartSector)
+            boot_sectors.append(r.partition.req_bootable and boot_limit)
+
+        def limit(i, preceding):
+            """ Return the maximum growth for request i. """
+            req_end = ends[i] + preceding
+            limits = [max_sectors[i] - req_end]
+            if boot_sectors[i]:
+                # 2TB limit on bootable partitions, regardless of disklabel
+                limits.append(boot_sectors[i] - req_end)
+            if max_growth[i]:
+                limits.append(max_growth[i])
+            return min(limits)
+
+        pool = self.pool
+        base = self.base
+        new_base = base
+        remaining = done.count(False)
         last_pool = 0 # used to track changes to the pool across iterations
-        while not self.done and self.pool and last_pool != self.pool:
-            last_pool = self.pool    # to keep from getting stuck
-            self.base = new_base
+        while remaining and pool and last_pool != pool:
+            last_pool = pool    # to keep from getting stuck
+            base = new_base
             log.debug("%d partitions and %d (%dMB) left in chunk" %
-                        (self.remaining, self.pool,
-                         sectorsToSize(self.pool, self.sectorSize)))
-            for p in self.requests:
-                if p.done:
-                    continue
-
-                # Each partition is allocated free sectors from the pool
-                # based on the relative _base_ sizes of the remaining
-                # growable partitions.
-                share = p.base / float(self.base)
-                growth = int(share * last_pool) # truncate, don't round
-                p.growth += growth
-                self.pool -= growth
-                log.debug("adding %d (%dMB) to %d (%s)" %
-                            (growth,
-                             sectorsToSize(growth, self.sectorSize),
-                             p.partition.id, p.partition.name))
-
-                new_base = self.trimOverGrownRequest(p, base=new_base)
-                log.debug("new grow amount for partition %d (%s) is %d "
-                          "sectors, or %dMB" %
-                            (p.partition.id, p.partition.name, p.growth,
-                             sectorsToSize(p.growth, self.sectorSize)))
-
-        if self.pool:
+                        (remaining, pool, sectorsToSize(pool, self.sectorSize)))
+
+            # growth of the requests before the current one
+            preceding = 0
+            for i in range(count):
+                if not done[i]:
+                    share = bases[i] / float(base)
+                    grown = int(share * last_pool) # truncate, don't round
+                    growth[i] += grown
+                    pool -= grown
+
+                    max_grow = limit(i, preceding)
+                    if max_grow and growth[i] >= max_grow:
+                        # we've grown as much as we can, put any extra back
+                        # and take this one out of the growable base
+                        if growth[i] > max_grow:
+                            pool += growth[i] - max_grow
+                            growth[i] = max_grow
+                        new_base -= bases[i]
+                        done[i] = True
+                        remaining -= 1
+
+                preceding += growth[i]
+
+        if pool:
             # allocate any leftovers in pool to the first partition
             # that can still grow
-            for p in self.requests:
-                if p.done:
-                    continue
+            preceding = 0
+            for i in range(count):
+                if not done[i]:
+                    growth[i] += pool
+                    pool = 0
+
+                    max_grow = limit(i, preceding)
+                    if max_grow and growth[i] >= max_grow:
+                        if growth[i] > max_grow:
+                            pool += growth[i] - max_grow
+                            growth[i] = max_grow
+                        done[i] = True
+
+                    if pool == 0:
+                        break
 
-                p.growth += self.pool
-                self.pool = 0
+                preceding += growth[i]
 
-                self.trimOverGrownRequest(p)
-                if self.pool == 0:
-                    break
+        for (i, r) in enumerate(self.requests):
+            r.growth = growth[i]
+            r.done = done[i]
+            log.debug("grow amount for partition %d (%s) is %d sectors, "
+                      "or %dMB" % (r.partition.id, r.partition.name, r.growth,
+                                   sectorsToSize(r.growth, self.sectorSize)))
+
+        self.pool = pool
+        self.base = base
 
 
 def getDiskChunks(disk, partitions, free):
@@ -1484,6 +1461,109 @@ def getDiskChunks(disk, partitions, free):
 
     return chunks
 
+class TrialPartition(object):
+    """ A PartitionDevice as it would be if allocated with a given geometry.
+
+        This stands in for the PartitionDevice when working out how much
+        growth a candidate layout allows, so that neither the disk's
+        partedDisk nor the PartitionDevice itself have to be modified.
+    """
+    def __init__(self, partition, disk, partedPartition):
+        self._partition = partition
+        self.disk = disk
+        self.partedPartition = partedPartition
+        self.exists = False
+
+    @property
+    def isExtended(self):
+        return self.partedPartition.type & parted.PARTITION_EXTENDED
+
+    def __getattr__(self, attr):
+        return getattr(self._partition, attr)
+
+
+class GrowthEstimator(object):
+    """ Total growth allowed by the layouts allocatePartitions considers.
+
+        The growth each disk allows is computed from the partitions
+        allocated on it so far and kept until another partition gets
+        allocated on that disk. Evaluating a candidate region for a
+        growable request then only means growing the requests on the one
+        disk the region is on.
+    """
+    def __init__(self, disklabels, disks, freespace):
+        """ Create a GrowthEstimator instance.
+
+            Arguments:
+
+                disklabels -- dict of DiskLabel instances keyed by disk path
+                disks -- dict of StorageDevice instances keyed by disk path
+                freespace -- list of parted.Geometry instances representing
+                             the free space on the disks
+
+        """
+        self.disklabels = disklabels
+        self.disks = disks
+        self.freespace = freespace
+        self.partitions = dict([(path, []) for path in disklabels])
+        self._growth = {}   # chunk growth lists keyed by disk path
+
+    def addPartition(self, partition):
+        """ Record the allocation of a partition. """
+        path = partition.disk.path
+        self.partitions[path].append(partition)
+        self._growth.pop(path, None)
+
+    def diskGrowth(self, path, partitions):
+        """ Return the growth of each chunk of a disk, in sectors. """
+        growth = []
+        for chunk in getDiskChunks(self.disks[path], partitions,
+                                   self.freespace):
+            chunk.growRequests()
+            growth.append(chunk.growth)
+
+        log.debug("disk %s growth: %d" % (path, sum(growth)))
+        return growth
+
+    def totalGrowth(self, partition, disk, free, part_type):
+        """ Return the total growth if partition were allocated from free.
+
+            Arguments:
+
+                partition -- the PartitionDevice to allocate
+                disk -- the disk the free region is on
+                free -- the free region (parted.Geometry instance)
+                part_type -- partition type (parted.PARTITION_* constant)
+
+            Return value is the growth of all requests on all disks, in
+            sectors.
+        """
+        disklabel = self.disklabels[disk.path]
+        geometry = getPartitionGeometry(disklabel, free, part_type,
+                                        partition.req_size)
+        trial = TrialPartition(partition, disk,
+                               parted.Partition(disk=disklabel.partedDisk,
+                                                type=part_type,
+                                                geometry=geometry))
+        candidate = self.diskGrowth(disk.path,
+                                    self.partitions[disk.path] + [trial])
+
+        # add up the chunks in the same order as a full recalculation would
+        total = 0
+        for path in self.disklabels.keys():
+            if path == disk.path:
+                growth = candidate
+            else:
+                if path not in self._growth:
+                    self._growth[path] = self.diskGrowth(path,
+                                                         self.partitions[path])
+                growth = self._growth[path]
+
+            for chunk_growth in growth:
+                total += chunk_growth
+
+        return total
+
 def growPartitions(disks, partitions, free):
     """ Grow all growable partition requests.
 
@@ -1733,20 +1813,17 @@ def growLVM(storage):
         # keep a tab on space not allocated due to format or requested
         # maximums -- we'll dole it out to subsequent requests
         leftover = 0
-        for lv in lvs:
+        proportional = [l for l in lvs if l.req_grow and not l.req_percent]
+        for (i, lv) in enumerate(proportional):
             log.debug("checking lv %s: req_grow: %s ; req_percent: %s"
                       % (lv.name, lv.req_grow, lv.req_percent))
-            if not lv.req_grow or lv.req_percent:
-                continue
 
             portion = float(lv.req_size) / float(lv_total)
             grow = portion * total_free
             log.debug("grow is %dMB" % grow)
 
-            todo = lvs[lvs.index(lv):]
             unallocated = reduce(lambda x,y: x+y,
-                                 [l.req_size for l in todo
-                                  if l.req_grow and not l.req_percent])
+                                 [l.req_size for l in proportional[i:]])
             extra_portion = float(lv.req_size) / float(unallocated)
             extra = extra_portion * leftover
             log.debug("%s getting %dMB (%d%%) of %dMB leftover space"
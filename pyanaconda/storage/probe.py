@@ -0,0 +1,110 @@
+# probe.py
+# Parallel probing of devices for anaconda's storage configuration module.
+#
+# Copyright (C) 2010  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+import threading
+import Queue
+
+import logging
+log = logging.getLogger("storage")
+
+# maximum number of probes to run at the same time
+PROBE_WORKERS = 8
+
+class ProbeCache(object):
+    """ Results of slow device probes, gathered in parallel.
+
+        Probes are functions that only look at a device, like running
+        dumpe2fs or mdadm --examine on it. They get queued up with add and
+        run on a bounded pool of threads by run. The code that builds the
+        device tree then asks for the results with pop, still in a single
+        thread and in its usual order.
+
+        A probe that raises an exception leaves no result behind, so the
+        caller simply falls back to doing the work itself and handles any
+        error the same way it always has.
+    """
+    def __init__(self, workers=PROBE_WORKERS):
+        self.workers = workers
+        self._jobs = []
+        self._keys = set()
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, func, *args, **kwargs):
+        """ Queue up a probe whose result will be stored under key. """
+        if key in self._keys or key in self._results:
+            return
+
+        self._keys.add(key)
+        self._jobs.append((key, func, args, kwargs))
+
+    def run(self):
+        """ Run all queued probes and wait for them to finish. """
+        jobs = self._jobs
+        self._jobs = []
+        self._keys = set()
+        if not jobs:
+            return
+
+        queue = Queue.Queue()
+        for job in jobs:
+            queue.put(job)
+
+        threads = []
+        for i in range(min(self.workers, len(jobs))):
+            thread = threading.Thread(target=self._worker, args=(queue,))
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        log.debug("probed %d devices with %d threads" % (len(jobs),
+                                                         len(threads)))
+
+    def _worker(self, queue):
+        while True:
+            try:
+                (key, func, args, kwargs) = queue.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                log.debug("probe %s failed: %s" % (key, e))
+                continue
+
+            self._lock.acquire()
+            try:
+                self._results[key] = result
+            finally:
+                self._lock.release()
+
+    def pop(self, key, default=None):
+        """ Return and forget the result stored under key. """
+        return self._results.pop(key, default)
+
+    def clear(self):
+        """ Forget all queued probes and unclaimed results. """
+        self._jobs = []
+        self._keys = set()
+        self._results = {}
@@ -19,6 +19,7 @@
 #
 # Red Hat Author(s): David Cantrell <dcantrell@redhat.com>
 
+import re
 from decimal import Decimal
 from decimal import InvalidOperation
 
@@ -66,65 +67,78 @@ def _makeSpecs(prefix, abbr):
 
     return specs
 
+# lower case specifier -> factor, for every specifier we accept
+_specFactors = {}
+for _spec in _bytes:
+    _specFactors[_spec] = 1
+for (_factor, _prefix, _abbr) in _prefixes:
+    for _spec in _makeSpecs(_prefix, _abbr):
+        _specFactors.setdefault(_spec, _factor)
+
+# the unit strings humanReadable puts after the number, for each prefix
+# as (singular, plural)
+_units = []
+for (_factor, _prefix, _abbr) in _prefixes:
+    if _abbr:
+        _units.append((_abbr + _("b"), _abbr + _("b")))
+    else:
+        _units.append((_prefix + _("byte"), _prefix + _("bytes")))
+
+# a number, optionally followed by a specifier with or without a space
+_specRE = re.compile(r"^\s*([-+]?(?:\d+(?:\.\d*)?|\.\d+))\s*([^\s\d.]*)\s*$")
+
 def _parseSpec(spec):
     """ Parse string representation of size. """
     if not spec:
         return None
 
-    # first check for strings like "47 MB" or "1.21 GB"
-    fields = spec.split()
-    if len(fields) == 2:
-        # assume value for the first field and specifier for the second
-        size = Decimal(fields[0])
-        specifier = fields[1].lower()
-
-        if size < 1:
-            raise SizeNotPositiveError("spec= param must be >0")
+    m = _specRE.match(spec)
+    if not m:
+        return None
 
-        if specifier in _bytes:
-            return size
+    (value, specifier) = m.groups()
+    if "." in value:
+        size = Decimal(value)
+    else:
+        size = int(value)
 
-        for factor, prefix, abbr in _prefixes:
-            check = _makeSpecs(prefix, abbr)
+    if size < 1:
+        raise SizeNotPositiveError("spec= param must be >0")
 
-            if specifier in check:
-                return size * factor
-    elif len(fields) > 2 or len(fields) < 1:
-        # too much data in the string
+    factor = _specFactors.get(specifier.lower() or _("b"))
+    if factor is None:
         return None
-    else:
-        # no space between value and specifier
-        try:
-            size = Decimal(spec)
 
-            if size < 1:
-                raise SizeNotPositiveError("spec= param must be >0")
+    return size * factor
 
-            if str(size) == spec:
-                return size
-        except InvalidOperation:
-            pass
+def _trimEnd(val):
+    """ Internal method to trim trailing zeros. """
+    while val != '' and val.endswith('0'):
+        val = val[:-1]
 
-        for factor, prefix, abbr in _prefixes:
-            check = _makeSpecs(prefix, abbr)
-            match = filter(lambda x: spec.lower().endswith(x), check)
+    if val.endswith('.'):
+        val = val[:-1]
 
-            if match != [] and len(match) == 1:
-                size = Decimal(spec[:len(match[0])].strip())
+    return val
 
-                if size < 1:
-                    raise SizeNotPositiveError("spec= param must be >0")
-
-                return size * factor
+def _convert(value, spec):
+    factor = _specFactors.get(spec.lower())
+    if factor is None:
+        return None
+    elif factor == 1:
+        return value
 
-    return None
+    return Decimal(value) / Decimal(factor)
 
-class Size(Decimal):
+class Size(long):
     """ Common class to represent storage device and filesystem sizes.
         Can handle parsing strings such as 45MB or 6.7GB to initialize
         itself, or can be initialized with a numerical size in bytes.
         Also generates human readable strings to a specified number of
         decimal places.
+
+        Sizes are a whole number of bytes, and all the work is done with
+        integers.  Use DecimalSize for sizes that can be fractional.
     """
 
     def __new__(cls, bytes=None, spec=None):
@@ -144,32 +158,26 @@ class Size(Decimal):
 
             If you want to use spec to pass a bytes value, you can use the
             letter 'b' or 'B' or simply leave the specifier off and bytes
-            will be assumed.
+            will be assumed.  Fractions of a byte are dropped.
         """
         if bytes and spec:
             raise SizeParamsError("only specify one parameter")
 
         if bytes:
-            if type(bytes).__name__ in ["int", "long"] and bytes > 0:
-                self = Decimal.__new__(cls, value=bytes)
+            if isinstance(bytes, (int, long)) and bytes > 0:
+                return long.__new__(cls, bytes)
             else:
                 raise SizeNotPositiveError("bytes= param must be >0")
         elif spec:
-            self = Decimal.__new__(cls, value=_parseSpec(spec))
+            value = _parseSpec(spec)
+            if value is None:
+                raise SizeParamsError("invalid spec= param: %s" % spec)
+            return long.__new__(cls, int(value))
         else:
             raise SizeParamsError("missing bytes= or spec=")
 
-        return self
-
-    def _trimEnd(self, val):
-        """ Internal method to trim trailing zeros. """
-        while val != '' and val.endswith('0'):
-            val = val[:-1]
-
-        if val.endswith('.'):
-            val = val[:-1]
-
-        return val
+    def __repr__(self):
+        return "Size(%d)" % self
 
     def convertTo(self, spec="b"):
         """ Return the size in the units indicated by the specifier.  The
@@ -178,19 +186,86 @@ class Size(Decimal):
             or 'bytes' (for prefixes like kilo or mega).  The size is
             returned as a Decimal.
         """
-        spec = spec.lower()
+        return _convert(self, spec)
+
+    def humanReadable(self, places=2):
+        """ Return a string representation of this size with appropriate
+            size specifier and in the specified number of decimal places
+            (default: 2).
+        """
+        if places < 1:
+            raise SizePlacesError("places= must be >1")
+
+        totalLen = places + 2
+        check = _trimEnd("%d" % self)
+
+        if len(check) == totalLen:
+            return "%s b" % check
 
-        if spec in _bytes:
-            return self
+        # The result is the first prefix, decimal ones first, whose value
+        # rounded to at most places decimals takes exactly totalLen
+        # characters.  That needs at most places digits before the point,
+        # which rules out every decimal prefix below the one that gets the
+        # integer part down to that, so start there.
+        start = (len("%d" % self) - places + 2) / 3 - 1
+        start = min(max(start, 0), len(_decimalPrefix))
+        for index in range(start, len(_prefixes)):
+            factor = _prefixes[index][0]
 
-        for factor, prefix, abbr in _prefixes:
-            check = _makeSpecs(prefix, abbr)
+            i = places
+            while i > 0:
+                # round half even, as Decimal.quantize does
+                scale = 10 ** i
+                (q, r) = divmod(self * scale, factor)
+                if 2 * r > factor or (2 * r == factor and q % 2):
+                    q += 1
+
+                whole = "%d" % (q / scale)
+                if len(whole) + 1 + i == totalLen:
+                    retval = "%s.%0*d" % (whole, i, q % scale)
+                    (singular, plural) = _units[index]
+                    if q == scale:
+                        return retval + " " + singular
+                    else:
+                        return retval + " " + plural
 
-            if spec in check:
-                return self / Decimal(factor)
+                i -= 1
 
         return None
 
+class DecimalSize(Decimal):
+    """ A Size that can hold a fractional number of bytes.
+
+        This is the same as Size except that it is a Decimal, so parsing a
+        specification like "1.5 b" keeps the fraction, and all arithmetic
+        is done with Decimals.
+    """
+
+    def __new__(cls, bytes=None, spec=None):
+        if bytes and spec:
+            raise SizeParamsError("only specify one parameter")
+
+        if bytes:
+            if type(bytes).__name__ in ["int", "long"] and bytes > 0:
+                self = Decimal.__new__(cls, value=bytes)
+            else:
+                raise SizeNotPositiveError("bytes= param must be >0")
+        elif spec:
+            value = _parseSpec(spec)
+            if value is None:
+                raise SizeParamsError("invalid spec= param: %s" % spec)
+            self = Decimal.__new__(cls, value=value)
+        else:
+            raise SizeParamsError("missing bytes= or spec=")
+
+        return self
+
+    def convertTo(self, spec="b"):
+        """ Return the size in the units indicated by the specifier, as a
+            Decimal.
+        """
+        return _convert(self, spec)
+
     def humanReadable(self, places=2):
         """ Return a string representation of this size with appropriate
             size specifier and in the specified number of decimal places
@@ -200,13 +275,13 @@ class Size(Decimal):
             raise SizePlacesError("places= must be >1")
 
         totalLen = places + 2
-        check = self._trimEnd("%d" % self)
+        check = _trimEnd("%d" % self)
 
         if len(check) == totalLen:
             return "%s b" % check
 
-        for factor, prefix, abbr in _prefixes:
-            check = self / Decimal(factor)
+        for index in range(len(_prefixes)):
+            check = self / Decimal(_prefixes[index][0])
 
             i = places
             while i > 0:
@@ -215,12 +290,11 @@ class Size(Decimal):
                 retval = str(newcheck)
 
                 if len(retval) == totalLen:
-                    if abbr:
-                        return retval + " " + abbr + _("b")
-                    elif newcheck == 1:
-                        return retval + " " + prefix + _("byte")
+                    (singular, plural) = _units[index]
+                    if newcheck == 1:
+                        return retval + " " + singular
                     else:
-                        return retval + " " + prefix + _("bytes")
+                        return retval + " " + plural
 
                 i -= 1
 
@@ -89,22 +89,77 @@ def udev_get_block_devices():
                                stdout = "/dev/tty5", stderr="/dev/tty5")
     udev_settle()
     entries = []
-    for path in udev_enumerate_block_devices():
-        entry = udev_get_block_device(path)
-        if entry:
-            if entry["name"].startswith("md"):
-                # mdraid is really braindead, when a device is stopped
-                # it is no longer usefull in anyway (and we should not
-                # probe it) yet it still sticks around, see bug rh523387
-                state = None
-                state_file = "/sys/%s/md/array_state" % entry["sysfs_path"]
-                if os.access(state_file, os.R_OK):
-                    state = open(state_file).read().strip()
-                if state == "clear":
-                    continue
+    for entry in udev_get_devices_bulk(deviceClass="block"):
+        if __is_blacklisted_blockdev(entry["name"]):
+            continue
+
+        if not __is_stopped_md(entry):
             entries.append(entry)
     return entries
 
+def udev_snapshot_block_devices():
+    """ Return a list of the sysfs paths of all block devices.
+
+        Unlike udev_enumerate_block_devices this only lists the contents
+        of /sys/class/block, without asking udev or filtering anything, so
+        it is cheap enough to call repeatedly.
+    """
+    block_dir = "/sys/class/block"
+    try:
+        nodes = os.listdir(block_dir)
+    except OSError as e:
+        log.error("failed to list %s: %s" % (block_dir, e))
+        return []
+
+    return [os.path.realpath(os.path.join(block_dir, node))[4:]
+                for node in nodes]
+
+def udev_get_new_block_devices(known):
+    """ Return udev db entries for block devices not in known.
+
+        known is a dict whose keys are the sysfs paths of the devices the
+        caller has already seen. The sysfs paths of new devices are added
+        to it, with their udev db entry as the value, or None for devices
+        that will never be interesting (eg: blacklisted ones).
+
+        udev is settled once, then only the devices that were not already
+        known have their udev db entries read.
+    """
+    udev_settle()
+    entries = []
+    for path in udev_snapshot_block_devices():
+        if path in known:
+            continue
+
+        if __is_blacklisted_blockdev(os.path.basename(path)):
+            known[path] = None
+            continue
+
+        entry = udev_get_block_device(path)
+        if not entry or __is_stopped_md(entry):
+            # it may yet turn into something useful, so look again next time
+            continue
+
+        known[path] = entry
+        entries.append(entry)
+
+    return entries
+
+def __is_stopped_md(entry):
+    """ Is this an md array that has been stopped? """
+    if not entry["name"].startswith("md"):
+        return False
+
+    # mdraid is really braindead, when a device is stopped
+    # it is no longer usefull in anyway (and we should not
+    # probe it) yet it still sticks around, see bug rh523387
+    state = None
+    state_file = "/sys/%s/md/array_state" % entry["sysfs_path"]
+    if os.access(state_file, os.R_OK):
+        state = open(state_file).read().strip()
+
+    return state == "clear"
+
 def __is_blacklisted_blockdev(dev_name):
     """Is this a blockdev we never want for an install?"""
     if dev_name.startswith("ram") or dev_name.startswith("fd"):
@@ -25,40 +25,55 @@ class CyclicGraphError(Exception):
     pass
 
 def tsort(graph):
+    """ Return a topologically sorted list of the graph's items.
+
+        This is Kahn's algorithm working from a per-item adjacency list, so
+        it runs in O(V+E). The graph passed in is not modified.
+
+        Raise CyclicGraphError if the graph contains cycles.
+    """
     order = []  # sorted list of items
 
     if not graph or not graph['items']:
         return order
 
+    incoming = graph['incoming'].copy()
+    children = graph.get('children')
+    if children is None:
+        children = _adjacency(graph['items'], graph['edges'])
+
     # determine which nodes have no incoming edges
-    roots = [n for n in graph['items'] if graph['incoming'][n] == 0]
+    roots = [n for n in graph['items'] if incoming[n] == 0]
     if not roots:
         raise CyclicGraphError("no root nodes")
 
-    visited = []    # list of nodes visited, for cycle detection
     while roots:
         # remove a root, add it to the order
         root = roots.pop()
-        if root in visited:
-            raise CyclicGraphError("graph contains cycles")
-
-        visited.append(root)
-        i = graph['items'].index(root)
         order.append(root)
         # remove each edge from the root to another node
-        for (parent, child) in [e for e in graph['edges'] if e[0] == root]:
-            graph['incoming'][child] -= 1
-            graph['edges'].remove((parent, child))
+        for child in children[root]:
+            incoming[child] -= 1
             # if destination node is now a root, add it to roots
-            if graph['incoming'][child] == 0:
+            if incoming[child] == 0:
                 roots.append(child)
 
-    if len(graph['items']) != len(visited):
+    if len(graph['items']) != len(order):
         raise CyclicGraphError("graph contains cycles")
 
-
     return order
 
+def _adjacency(items, edges):
+    """ Return a dict of child lists hashed by parent item. """
+    children = {}
+    for item in items:
+        children[item] = []
+
+    for (parent, child) in edges:
+        children[parent].append(child)
+
+    return children
+
 def create_graph(items, edges):
     """ Create a graph based on a list of items and a list of edges.
 
@@ -70,16 +85,18 @@ def create_graph(items, edges):
         Return Value:
 
             The return value is a dictionary representing the directed graph.
-            It has three keys:
+            It has four keys:
 
                 items is the same as the input argument of the same name
                 edges is the same as the input argument of the same name
                 incoming is a dict of incoming edge count hashed by item
+                children is a dict of lists of child items hashed by item
 
     """
     graph = {'items': [],       # the items to sort
              'edges': [],       # partial order info: (parent, child) pairs
-             'incoming': {}}    # incoming edge count for each item
+             'incoming': {},    # incoming edge count for each item
+             'children': {}}    # adjacency list for each item
 
     graph['items'] = items
     graph['edges'] = edges
@@ -89,7 +106,9 @@ def create_graph(items, edges):
     for (parent, child) in edges:
         graph['incoming'][child] += 1
 
-    return graph 
+    graph['children'] = _adjacency(items, edges)
+
+    return graph
 
 
 if __name__ == "__main__":
@@ -21,6 +21,8 @@ from flags import flags
 from errors import *
 
 from ConfigParser import ConfigParser
+from ConfigParser import Error as ConfigParserError
+from cStringIO import StringIO
 import sys
 import os
 import os.path
@@ -34,6 +36,10 @@ import tempfile
 import itertools
 import re
 import gzip
+import subprocess
+import threading
+import zlib
+import struct
 
 import anaconda_log
 import rpm
@@ -74,6 +80,17 @@ urlgrabber.grabber.default_grabber.opts.user_agent = "%s (anaconda)/%s" %(produc
 import iutil
 import isys
 
+# the TinyCore payload, and how much of it to decompress at a time
+TINYCORE_IMAGE = "/tmp/updates/tinycore.gz"
+TINYCORE_CHUNK = 1024 * 1024
+
+# how many packages to download ahead of the one rpm is installing.  this
+# can be changed with the prefetch= boot option, and 0 turns it off.
+PREFETCH_AHEAD = 8
+
+# minimum number of seconds between two updates of the install progress
+PROGRESS_INTERVAL = 0.2
+
 def size_string (size):
     def number_format(s):
         return locale.format("%s", s, 1)
@@ -91,6 +108,200 @@ def size_string (size):
 
     return to_unicode(retval)
 
+class PackagePrefetcher:
+    """ Download the packages of a transaction ahead of rpm.
+
+        Packages from network repos are downloaded in transaction order by
+        a background thread while rpm installs the ones before them.  The
+        thread stays at most ahead packages in front of rpm, and only
+        downloads a package if the cache filesystem will still have room
+        for everything rpm has left to install.
+
+        urlgrabber uses a single curl handle for all of its downloads, so
+        every call into the repos made while the prefetcher is running has
+        to hold its lock.  That includes the ones made by AnacondaCallback.
+
+        A package that fails to download is left to AnacondaCallback, which
+        downloads it again with the usual retry and mirror handling.
+    """
+    def __init__(self, pkgs, ahead=PREFETCH_AHEAD):
+        self.ahead = ahead
+        self.lock = threading.Lock()
+
+        self._cond = threading.Condition()
+        self._position = {}
+        self._remaining = []
+        remaining = sum([int(po.returnSimple("installedsize")) for po in pkgs])
+        self._pkgs = []
+        for po in pkgs:
+            self._position[po.pkgtup] = len(self._remaining)
+            self._remaining.append(remaining)
+            remaining -= int(po.returnSimple("installedsize"))
+            if po.repo.needsNetwork():
+                self._pkgs.append(po)
+
+        self._next = 0
+        self._current = -1
+        self._fetching = None
+        self._done = {}
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        if not self._pkgs:
+            return
+
+        self._thread = threading.Thread(target=self._worker)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop downloading and remove the packages nobody asked for. """
+        self._cond.acquire()
+        try:
+            self._stopped = True
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+        for fn in self._done.values():
+            try:
+                os.unlink(fn)
+            except OSError:
+                pass
+        self._done = {}
+
+    def _hasRoom(self, po):
+        """ Would downloading po leave enough space for rpm? """
+        try:
+            st = os.statvfs(os.path.dirname(po.localPkg()))
+        except OSError:
+            return True
+
+        # rpm still needs room for the package it is working on
+        free = st.f_bavail * st.f_frsize
+        needed = self._remaining[max(self._current, 0)]
+        return free - po.size > needed
+
+    def _nextPackage(self):
+        """ Return the next package to download, or None if there is none
+            that can be downloaded right now.
+        """
+        while self._next < len(self._pkgs):
+            po = self._pkgs[self._next]
+            position = self._position[po.pkgtup]
+            if position <= self._current:
+                # rpm already got there, so AnacondaCallback fetches it
+                self._next += 1
+                continue
+
+            if position - self._current > self.ahead:
+                return None
+            if self._done and not self._hasRoom(po):
+                return None
+
+            self._next += 1
+            return po
+
+        return None
+
+    def _worker(self):
+        while True:
+            self._cond.acquire()
+            try:
+                po = self._nextPackage()
+                while not self._stopped and po is None:
+                    if self._next >= len(self._pkgs):
+                        return
+                    self._cond.wait()
+                    po = self._nextPackage()
+
+                if self._stopped:
+                    return
+
+                self._fetching = po.pkgtup
+            finally:
+                self._cond.release()
+
+            fn = None
+            self.lock.acquire()
+            try:
+                try:
+                    fn = po.repo.getPackage(po)
+                except Exception as e:
+                    log.info("prefetching %s failed: %s" % (po, e))
+            finally:
+                self.lock.release()
+
+            self._cond.acquire()
+            try:
+                self._fetching = None
+                if fn:
+                    self._done[po.pkgtup] = fn
+                self._cond.notifyAll()
+            finally:
+                self._cond.release()
+
+    def get(self, po):
+        """ Tell the prefetcher rpm wants po now, and return the file it was
+            downloaded to.  Return None if it wasn't downloaded.
+        """
+        self._cond.acquire()
+        try:
+            position = self._position.get(po.pkgtup)
+            if position is not None and position > self._current:
+                self._current = position
+            self._cond.notifyAll()
+
+            while self._fetching == po.pkgtup:
+                self._cond.wait()
+
+            return self._done.pop(po.pkgtup, None)
+        finally:
+            self._cond.release()
+
+class ThrottledProgress:
+    """ Pass updates on to the install progress display at most every
+        interval seconds.
+
+        Only the latest label, text and fraction are kept in between, so a
+        fast run of small packages doesn't spend its time redrawing the
+        screen.  flush pushes out whatever is pending right away.
+    """
+    def __init__(self, progress, interval=PROGRESS_INTERVAL):
+        self.progress = progress
+        self.interval = interval
+        self._pending = {}
+        self._lastUpdate = 0
+
+    def set_label(self, txt):
+        self._pending["set_label"] = txt
+        self.processEvents()
+
+    def set_text(self, txt):
+        self._pending["set_text"] = txt
+        self.processEvents()
+
+    def set_fraction(self, pct):
+        self._pending["set_fraction"] = pct
+        self.processEvents()
+
+    def processEvents(self):
+        if time.time() - self._lastUpdate >= self.interval:
+            self.flush()
+
+    def flush(self):
+        for method in ("set_label", "set_text", "set_fraction"):
+            if self._pending.has_key(method):
+                getattr(self.progress, method)(self._pending.pop(method))
+
+        self.progress.processEvents()
+        self._lastUpdate = time.time()
+
 class AnacondaCallback:
 
     def __init__(self, ayum, anaconda, instLog, modeText):
@@ -101,7 +312,7 @@ class AnacondaCallback:
 
         self.messageWindow = anaconda.intf.messageWindow
         self.pulseWindow = anaconda.intf.progressWindow
-        self.progress = anaconda.intf.instProgress
+        self.progress = ThrottledProgress(anaconda.intf.instProgress)
         self.progressWindowClass = anaconda.intf.progressWindow
         self.rootPath = anaconda.rootPath
 
@@ -116,11 +327,41 @@ class AnacondaCallback:
 
         self.openfile = None
         self.inProgressPo = None
+        self.prefetcher = None
+
+    def startPrefetch(self, pkgs):
+        """ Start downloading pkgs, in the order rpm will install them. """
+        try:
+            ahead = int(flags.cmdline.get("prefetch", PREFETCH_AHEAD))
+        except (TypeError, ValueError):
+            ahead = PREFETCH_AHEAD
+
+        if ahead <= 0 or not pkgs:
+            return
+
+        self.prefetcher = PackagePrefetcher(pkgs, ahead=ahead)
+        self.prefetcher.start()
 
-    def setSizes(self, numpkgs, totalSize, totalFiles):
+    def stopPrefetch(self):
+        if self.prefetcher:
+            self.prefetcher.stop()
+            self.prefetcher = None
+
+    def _getPackage(self, repo, po):
+        if not self.prefetcher:
+            return repo.getPackage(po)
+
+        self.prefetcher.lock.acquire()
+        try:
+            return repo.getPackage(po)
+        finally:
+            self.prefetcher.lock.release()
+
+    def setSizes(self, numpkgs, totalSize, totalFiles, pkgSizes=None):
         self.numpkgs = numpkgs
         self.totalSize = totalSize
         self.totalFiles = totalFiles
+        self.pkgSizes = pkgSizes or {}
 
         self.donepkgs = 0
         self.doneSize = 0
@@ -178,17 +419,25 @@ class AnacondaCallback:
             self.instLog.flush()
             self.openfile = None
 
+            fn = None
+            if self.prefetcher:
+                fn = self.prefetcher.get(po)
+
             while self.openfile is None:
                 try:
-                    fn = repo.getPackage(po)
+                    if fn is None:
+                        fn = self._getPackage(repo, po)
 
                     f = open(fn, 'r')
                     self.openfile = f
                 except yum.Errors.NoMoreMirrorsRepoError:
+                    fn = None
                     self.ayum._handleFailure(po)
                 except IOError:
+                    fn = None
                     self.ayum._handleFailure(po)
                 except yum.Errors.RepoError, e:
+                    fn = None
                     continue
             self.inProgressPo = po
 
@@ -199,8 +448,6 @@ class AnacondaCallback:
                 self.initWindow.pop()
                 self.initWindow = None
 
-            (hdr, rpmloc) = h
-
             fn = self.openfile.name
             self.openfile.close()
             self.openfile = None
@@ -212,8 +459,12 @@ class AnacondaCallback:
                     log.debug("unable to remove file %s" %(e.strerror,))
 
             self.donepkgs += 1
-            self.doneSize += self.inProgressPo.returnSimple("installedsize") / 1024.0
-            self.doneFiles += len(hdr[rpm.RPMTAG_BASENAMES])
+            if self.pkgSizes.has_key(self.inProgressPo.pkgtup):
+                (size, files) = self.pkgSizes[self.inProgressPo.pkgtup]
+                self.doneSize += size
+                self.doneFiles += files
+            else:
+                self.doneSize += self.inProgressPo.returnSimple("installedsize") / 1024.0
 
             if self.donepkgs <= self.numpkgs:
                 self.progress.set_text(P_("Packages completed: "
@@ -223,7 +474,7 @@ class AnacondaCallback:
                                           self.numpkgs)
                                        % {'donepkgs': self.donepkgs,
                                           'numpkgs': self.numpkgs})
-            self.progress.set_fraction(float(self.doneSize / self.totalSize))
+            self.progress.set_fraction(float(self.doneSize) / self.totalSize)
             self.progress.processEvents()
 
             self.inProgressPo = None
@@ -250,6 +501,7 @@ class AnacondaCallback:
             # we should only error out for fatal script errors or the cpio and
             # unpack problems.
             if what != rpm.RPMCALLBACK_SCRIPT_ERROR or total:
+                self.progress.flush()
                 self.messageWindow(_("Error Installing Package"),
                     _("A fatal error occurred when installing the %s "
                       "package.  This could indicate errors when reading "
@@ -311,6 +563,11 @@ class AnacondaYum(yum.YumBase):
 
         self.repoIDcounter = itertools.count()
 
+        # .treeinfo files by baseurl, and the baseurls whose .treeinfo has
+        # been checked for changes since doConfigSetup was last called
+        self._treeinfoCache = {}
+        self._treeinfoChecked = set()
+
         # Only needed for hard drive and nfsiso installs.
         self.isodir = None
 
@@ -653,17 +910,15 @@ class AnacondaYum(yum.YumBase):
         valid addon repos and if so, return a list of (repo name, repo URL).
         """
         retval = []
-        c = ConfigParser()
 
         # If there's no .treeinfo for this repo, don't bother looking for addons.
-        treeinfo = self._getTreeinfo(baseurl, proxy_url)
-        if not treeinfo:
+        c = self._getTreeinfo(baseurl, proxy_url)
+        if not c:
             return retval
 
         # We need to know which variant is being installed so we know what addons
         # are valid options.
         try:
-            ConfigParser.read(c, treeinfo)
             variant = c.get("general", "variant")
         except:
             return retval
@@ -684,37 +939,114 @@ class AnacondaYum(yum.YumBase):
 
         return retval
 
+    def _treeinfoLocalPath(self, url):
+        if url.startswith("file://"):
+            return url[len("file://"):]
+        elif url.startswith("/"):
+            return url
+        return None
+
+    def _downloadTreeinfo(self, url, proxies, entry=None):
+        """
+        Download and parse the treeinfo file at url, returning a cache entry
+        for it.  If entry is given it is returned as is when its ETag,
+        Last-Modified or mtime show the file hasn't changed.
+        """
+        path = self._treeinfoLocalPath(url)
+        headers = []
+        if path:
+            mtime = os.stat(path).st_mtime
+            if entry and entry["mtime"] == mtime:
+                return entry
+        else:
+            mtime = None
+            if entry and entry["etag"]:
+                headers.append(("If-None-Match", entry["etag"]))
+            if entry and entry["modified"]:
+                headers.append(("If-Modified-Since", entry["modified"]))
+            if entry and not headers:
+                # nothing to validate against (ftp), so keep what we have
+                return entry
+
+        try:
+            fo = URLGrabber().urlopen(url, proxies=proxies,
+                                      http_headers=tuple(headers))
+        except URLGrabError as e:
+            if entry and getattr(e, "code", None) == 304:
+                return entry
+            raise
+
+        try:
+            content = fo.read()
+            hdr = getattr(fo, "hdr", None)
+        finally:
+            fo.close()
+
+        etag = modified = None
+        if hdr is not None:
+            etag = hdr.getheader("ETag")
+            modified = hdr.getheader("Last-Modified")
+
+        c = ConfigParser()
+        try:
+            c.readfp(StringIO(content), url)
+        except ConfigParserError as e:
+            log.info("Error parsing %s: %s" % (url, e))
+            c = None
+
+        return {"url": url, "etag": etag, "modified": modified,
+                "mtime": mtime, "parser": c}
+
     def _getTreeinfo(self, baseurl, proxy_url=None):
         """
-        Try to get .treeinfo file from baseurl, optionally using proxy_url
-        Saves the file into /tmp/.treeinfo
+        Try to get .treeinfo file from baseurl, optionally using proxy_url,
+        and return it parsed by ConfigParser.
+
+        The file is fetched once per baseurl.  After the next call to
+        doConfigSetup it is checked for changes again, using the ETag and
+        Last-Modified headers for http and the mtime for local files, and
+        only downloaded again if it did change.
         """
         if not baseurl:
             return None
+
+        entry = self._treeinfoCache.get(baseurl)
+        if baseurl in self._treeinfoChecked:
+            return entry and entry["parser"]
+
         if baseurl.startswith("http") or baseurl.startswith("ftp"):
             if not network.hasActiveNetDev():
                 if not self.anaconda.intf.enableNetwork():
                     log.error("Error downloading %s/.treeinfo: network enablement failed" % (baseurl))
                     return None
-        ug = URLGrabber()
+
         if proxy_url:
             proxies = { 'http'  : proxy_url,
                         'https' : proxy_url }
         else:
             proxies = {}
 
-        try:
-            ug.urlgrab("%s/.treeinfo" % baseurl, "/tmp/.treeinfo",
-                       copy_local=1, proxies=proxies)
-        except Exception as e:
+        if entry:
+            urls = [entry["url"]]
+        else:
+            urls = ["%s/.treeinfo" % baseurl, "%s/treeinfo" % baseurl]
+
+        for url in urls:
             try:
-                ug.urlgrab("%s/treeinfo" % baseurl, "/tmp/.treeinfo",
-                           copy_local=1, proxies=proxies)
+                entry = self._downloadTreeinfo(url, proxies, entry)
+                break
             except Exception as e:
-                log.info("Error downloading treeinfo: %s" % e)
-                return None
+                entry = None
+        else:
+            log.info("Error downloading treeinfo: %s" % e)
+
+        self._treeinfoChecked.add(baseurl)
+        if entry:
+            self._treeinfoCache[baseurl] = entry
+            return entry["parser"]
 
-        return "/tmp/.treeinfo"
+        self._treeinfoCache.pop(baseurl, None)
+        return None
 
     def _getReleasever(self):
         """
@@ -722,13 +1054,10 @@ class AnacondaYum(yum.YumBase):
         read.  Since there's no redhat-release package in /mnt/sysimage (and
         won't be for quite a while), we need to do our own substutition.
         """
-        c = ConfigParser()
-
-        treeinfo = self._getTreeinfo(self._baseRepoURL, self.proxy_url)
-        if not treeinfo:
+        c = self._getTreeinfo(self._baseRepoURL, self.proxy_url)
+        if not c:
             return productVersion
 
-        ConfigParser.read(c, treeinfo)
         try:
             return c.get("general", "version")
         except:
@@ -768,6 +1097,9 @@ class AnacondaYum(yum.YumBase):
 
 
     def doConfigSetup(self, fn='/tmp/anaconda-yum.conf', root='/'):
+        # repos may have been changed since the last setup
+        self._treeinfoChecked = set()
+
         if hasattr(self, "preconf"):
             self.preconf.fn = fn
             self.preconf.root = root
@@ -957,7 +1289,8 @@ class AnacondaYum(yum.YumBase):
             return
 
         delay = 0.25*(2**(obj.tries-1))
-        if delay > 1:
+        if delay > 1 and threading.currentThread().getName() == "MainThread":
+            # package prefetching can't put up windows from its thread
             w = self.anaconda.intf.waitWindow(_("Retrying"), _("Retrying download."))
             time.sleep(delay)
             w.pop()
@@ -968,14 +1301,36 @@ class AnacondaYum(yum.YumBase):
         downloadpkgs = []
         totalSize = 0
         totalFiles = 0
+        pkgSizes = {}
         for txmbr in self.tsInfo.getMembersWithState(output_states=TS_INSTALL_STATES):
             if txmbr.po:
-                totalSize += int(txmbr.po.returnSimple("installedsize")) / 1024
+                size = int(txmbr.po.returnSimple("installedsize")) / 1024
+                files = 0
                 for filetype in txmbr.po.returnFileTypes():
-                    totalFiles += len(txmbr.po.returnFileEntries(ftype=filetype))
+                    files += len(txmbr.po.returnFileEntries(ftype=filetype))
+                totalSize += size
+                totalFiles += files
+                pkgSizes[txmbr.po.pkgtup] = (size, files)
                 downloadpkgs.append(txmbr.po)
 
-        return (downloadpkgs, totalSize, totalFiles)
+        return (downloadpkgs, totalSize, totalFiles, pkgSizes)
+
+    def _orderedInstallPkgs(self):
+        """ Return the packages to install in the order rpm will use. """
+        pkgs = []
+        for te in self.ts.ts:
+            if te.Type() != rpm.TR_ADDED:
+                continue
+
+            epoch = te.E()
+            if epoch is not None:
+                epoch = str(epoch)
+            txmbrs = self.tsInfo.matchNaevr(te.N(), te.A(), epoch, te.V(),
+                                            te.R())
+            if txmbrs and txmbrs[0].po:
+                pkgs.append(txmbrs[0].po)
+
+        return pkgs
 
     def setColor(self):
         if rpmUtils.arch.isMultiLibArch():
@@ -1015,7 +1370,13 @@ class AnacondaYum(yum.YumBase):
         self.ts.order()
         self.ts.clean()
 
-        if self._run(instLog, cb, intf) == DISPATCH_BACK:
+        cb.startPrefetch(self._orderedInstallPkgs())
+        try:
+            rc = self._run(instLog, cb, intf)
+        finally:
+            cb.stopPrefetch()
+
+        if rc == DISPATCH_BACK:
             return DISPATCH_BACK
 
         self.ts.close()
@@ -1533,7 +1894,7 @@ reposdir=/etc/anaconda.repos.d,/tmp/updates/anaconda.repos.d,/tmp/product/anacon
             else:
                 break
 
-        (self.dlpkgs, self.totalSize, self.totalFiles)  = self.ayum.getDownloadPkgs()
+        (self.dlpkgs, self.totalSize, self.totalFiles, self.pkgSizes)  = self.ayum.getDownloadPkgs()
 
         if not anaconda.upgrade:
             largePart = anaconda.storage.mountpoints.get("/usr", anaconda.storage.rootDevice)
@@ -1686,9 +2047,11 @@ reposdir=/etc/anaconda.repos.d,/tmp/updates/anaconda.repos.d,/tmp/product/anacon
 
         cb = AnacondaCallback(self.ayum, anaconda,
                               self.instLog, self.modeText)
-        cb.setSizes(len(self.dlpkgs), self.totalSize, self.totalFiles)
+        cb.setSizes(len(self.dlpkgs), self.totalSize, self.totalFiles,
+                    self.pkgSizes)
 
         rc = self.ayum.run(self.instLog, cb, anaconda.intf)
+        cb.progress.flush()
 
         if cb.initWindow is not None:
             cb.initWindow.pop()
@@ -1941,7 +2304,7 @@ reposdir=/etc/anaconda.repos.d,/tmp/updates/anaconda.repos.d,/tmp/product/anacon
         iutil.resetRpmDb(anaconda.rootPath)
 
     def doInstallTinyCore(self, anaconda):
-        gzipImage = "/tmp/updates/tinycore.gz"
+        gzipImage = TINYCORE_IMAGE
         if os.path.exists(gzipImage) == False:
             rc = anaconda.intf.detailedMessageWindow(_("Warning"),
                                                      _("Cannot find tinycore.gz"),
@@ -1950,17 +2313,53 @@ reposdir=/etc/anaconda.repos.d,/tmp/updates/anaconda.repos.d,/tmp/product/anacon
                                                                      _("_Continue")])
             sys.exit(1)
 
-        
-        f = gzip.open(gzipImage, 'rb')
-        data = f.read()
-        cpioFile = "/tmp/tinycore.cpio"
-        w = open(cpioFile,'wb')
-        w.write(data)
-        w.close()
-        f.close()
-
-        cmd = "cd %(rootPath)s && cpio -id < %(cpiofile)s" %{'rootPath' : anaconda.rootPath, 'cpiofile' : cpioFile}
-        os.system(cmd)
+
+        # stream the decompressed archive straight into cpio, so neither
+        # the archive nor its uncompressed copy ever has to be held in RAM
+        total = os.stat(gzipImage).st_size
+        pw = anaconda.intf.progressWindow(_("Installing"),
+                                          _("Extracting TinyCore packages..."),
+                                          total)
+        errlog = tempfile.TemporaryFile()
+        f = open(gzipImage, 'rb')
+        try:
+            try:
+                cpio = subprocess.Popen(["cpio", "-id", "--quiet"],
+                                        stdin=subprocess.PIPE,
+                                        stdout=errlog, stderr=errlog,
+                                        cwd=anaconda.rootPath)
+                try:
+                    # GzipFile checks the CRC and length of the data when
+                    # it reaches the end of it
+                    gz = gzip.GzipFile(fileobj=f, mode='rb')
+                    while True:
+                        data = gz.read(TINYCORE_CHUNK)
+                        if not data:
+                            break
+                        cpio.stdin.write(data)
+                        pw.set(f.tell())
+                finally:
+                    cpio.stdin.close()
+                    rc = cpio.wait()
+
+                if rc:
+                    raise IOError("cpio exited with status %d" % rc)
+            except (IOError, OSError, EOFError, struct.error,
+                    zlib.error) as e:
+                errlog.seek(0)
+                map(log.error, errlog.read().splitlines())
+                log.error("error extracting %s: %s" % (gzipImage, e))
+                anaconda.intf.messageWindow(_("Error"),
+                        _("There was an error extracting %s to your hard "
+                          "drive.  The file may be corrupt.\n\n"
+                          "Press <return> to exit the installer.") % gzipImage,
+                        type="custom", custom_icon="error",
+                        custom_buttons=[_("_Exit installer")])
+                sys.exit(1)
+        finally:
+            f.close()
+            errlog.close()
+            pw.pop()
 
 class DownloadHeaderProgress:
     def __init__(self, intf, ayum=None):
@@ -40,6 +40,12 @@ for k in langs.localeInfo.keys():
     if not found:
         names[langs.localeInfo[k][0]] = langs.localeInfo[k][0]
 
+# with --index FILE, write the lookup index anaconda loads at startup
+# instead of lang-names
+if len(sys.argv) == 3 and sys.argv[1] == "--index":
+    language.writeLangIndex(sys.argv[2], langs, names)
+    sys.exit(0)
+
 nameList = names.keys()
 nameList.sort()
 
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+
+import os
+import tempfile
+import unittest
+
+from pyanaconda import fastcopy
+
+class CopyDataTestCase(unittest.TestCase):
+    size = 64 * 1024 * 1024
+
+    def setUp(self):
+        (fd, self.src) = tempfile.mkstemp()
+        # a sparse image with data at the start, middle and end
+        os.ftruncate(fd, self.size)
+        for offset in (0, 20 * 1024 * 1024 + 123, self.size - 4096):
+            os.lseek(fd, offset, 0)
+            os.write(fd, os.urandom(4096))
+        os.close(fd)
+
+        (fd, self.dst) = tempfile.mkstemp()
+        os.close(fd)
+
+        self.methods = (fastcopy._copy_file_range, fastcopy._sendfile)
+
+    def tearDown(self):
+        (fastcopy._copy_file_range, fastcopy._sendfile) = self.methods
+        os.unlink(self.src)
+        os.unlink(self.dst)
+
+    def _copy(self, size=None):
+        size = size or self.size
+        # start with garbage on the destination so skipped holes show up
+        dstfd = os.open(self.dst, os.O_WRONLY)
+        garbage = "\xff" * (1024 * 1024)
+        for i in range(self.size / len(garbage)):
+            os.write(dstfd, garbage)
+        os.lseek(dstfd, 0, 0)
+
+        updates = []
+        srcfd = os.open(self.src, os.O_RDONLY)
+        try:
+            fastcopy.copyData(srcfd, dstfd, size, progress=updates.append)
+        finally:
+            os.close(srcfd)
+            os.close(dstfd)
+
+        self.assertEqual(updates[-1], size)
+        self.assertEqual(open(self.src).read(int(size)),
+                         open(self.dst).read(int(size)))
+
+    def testCopy(self):
+        """ Copy with the best method the kernel supports. """
+        self._copy()
+
+    def testSendfile(self):
+        """ Copy with sendfile. """
+        fastcopy._copy_file_range = None
+        self._copy()
+
+    def testReadWrite(self):
+        """ Copy through a buffer. """
+        fastcopy._copy_file_range = None
+        fastcopy._sendfile = None
+        self._copy()
+
+    def testFloatSize(self):
+        """ Copy a float size, ending in a hole, through a buffer. """
+        fastcopy._copy_file_range = None
+        fastcopy._sendfile = None
+        self._copy(5 * 1024 * 1024 + 512.0)
+
+    def testSparse(self):
+        """ Verify holes are left as holes in an empty destination. """
+        srcfd = os.open(self.src, os.O_RDONLY)
+        dstfd = os.open(self.dst, os.O_WRONLY)
+        try:
+            fastcopy.copyData(srcfd, dstfd, self.size, sparse=True, sync=False)
+        finally:
+            os.close(srcfd)
+            os.close(dstfd)
+
+        self.assertEqual(os.path.getsize(self.dst), self.size)
+        self.assertEqual(open(self.src).read(), open(self.dst).read())
+        # only the three blocks of data take up any space
+        self.assertTrue(os.stat(self.dst).st_blocks * 512 < 1024 * 1024)
+
+    def testExtents(self):
+        """ Verify the extents of the source cover all of it. """
+        fd = os.open(self.src, os.O_RDONLY)
+        try:
+            extents = list(fastcopy._extents(fd, self.size))
+        finally:
+            os.close(fd)
+
+        self.assertEqual(extents[0][0], 0)
+        self.assertEqual(extents[-1][1], self.size)
+        for (first, second) in zip(extents, extents[1:]):
+            self.assertEqual(first[1], second[0])
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(CopyDataTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+
+import unittest
+
+from pyanaconda import isys
+from mock.nm import FakeNMBus
+
+class NMDeviceCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.bus = FakeNMBus()
+        self.nmDevices = isys.nmDevices
+        isys.nmDevices = isys.NMDeviceCache(bus=self.bus)
+
+    def tearDown(self):
+        isys.nmDevices = self.nmDevices
+
+    def getAlls(self):
+        return len([c for c in self.bus.calls if c[0] == "GetAll"])
+
+    def testSnapshot(self):
+        """ Verify each device is only asked for its properties once. """
+        ifaces = ["eth%d" % i for i in range(50)]
+        for (i, iface) in enumerate(ifaces):
+            self.bus.addDevice(iface, "52:54:00:00:00:%02x" % i,
+                               ip4=["10.0.0.%d" % (i + 1)])
+
+        self.assertEqual(sorted(isys.getDeviceProperties().keys()),
+                         sorted(ifaces))
+        for (i, iface) in enumerate(ifaces):
+            self.assertEqual(isys.getMacAddress(iface),
+                             "52:54:00:00:00:%02X" % i)
+            self.assertEqual(isys.getIPAddresses(iface),
+                             ["10.0.0.%d" % (i + 1)])
+            props = isys.getDeviceProperties(iface)
+            self.assertEqual(props.Get(isys.NM_DEVICE_IFACE, "Interface"),
+                             iface)
+        self.assertEqual(isys.getNetworkDeviceCount(), 50)
+        self.assertEqual(isys.getDeviceProperties("eth99"), None)
+        self.assertEqual(isys.getMacAddress("eth99"), None)
+
+        # one sweep for the devices and their wired properties, one call
+        # for each ip config
+        self.assertEqual(len([c for c in self.bus.calls
+                              if c[0] == "GetDevices"]), 1)
+        self.assertEqual(self.getAlls(), 150)
+
+    def testDeviceTypes(self):
+        """ Verify MAC addresses come from the device type's interface. """
+        wlan0 = self.bus.addDevice("wlan0", "00:11:22:33:44:55",
+                                   devtype=isys.NM_DEVICE_TYPE_WIFI)
+        self.bus.addDevice("ttyUSB0", None, devtype=8)
+        self.bus.addDevice("eth0", "52:54:00:00:00:01")
+
+        self.assertEqual(isys.getMacAddress("wlan0"), "00:11:22:33:44:55")
+        self.assertEqual(isys.getMacAddress("eth0"), "52:54:00:00:00:01")
+        self.assertEqual(isys.getMacAddress("ttyUSB0"), None)
+        # a modem has no type interface to ask
+        self.assertEqual(self.getAlls(), 5)
+
+        props = isys.getDeviceProperties("wlan0")
+        self.assertEqual(props.Get(isys.NM_DEVICE_WIRELESS_IFACE,
+                                   "PermHwAddress"), "00:11:22:33:44:55")
+        wireless = props.GetAll(isys.NM_DEVICE_WIRELESS_IFACE)
+        self.assertEqual(wireless["HwAddress"], "00:11:22:33:44:55")
+
+        # NetworkManager's signal for a changed address comes from the
+        # device's type interface, on the device's path
+        self.bus.emit("PropertiesChanged", isys.NM_DEVICE_WIRELESS_IFACE,
+                      wlan0, {"HwAddress": "00:11:22:33:44:66"})
+        self.assertEqual(isys.getMacAddress("wlan0"), "00:11:22:33:44:66")
+        self.assertEqual(self.getAlls(), 5)
+
+    def testSignals(self):
+        """ Verify NetworkManager's signals invalidate the snapshot. """
+        eth0 = self.bus.addDevice("eth0", "52:54:00:00:00:01",
+                                  ip4=["10.0.0.1"])
+        self.assertEqual(isys.getNetworkDeviceCount(), 1)
+
+        eth1 = self.bus.addDevice("eth1", "52:54:00:00:00:02")
+        self.assertEqual(isys.getNetworkDeviceCount(), 1)
+        self.bus.emit("DeviceAdded", isys.NM_MANAGER_IFACE,
+                      isys.NM_MANAGER_PATH, eth1)
+        self.assertEqual(isys.getNetworkDeviceCount(), 2)
+        self.assertEqual(isys.getMacAddress("eth1"), "52:54:00:00:00:02")
+
+        # changed properties are taken from the signal
+        calls = self.getAlls()
+        config = self.bus.setAddresses(eth1, ["192.168.0.1"])
+        self.bus.emit("PropertiesChanged", isys.NM_DEVICE_IFACE, eth1,
+                      {"Ip4Config": config})
+        self.assertEqual(isys.getIPAddresses("eth1"), ["192.168.0.1"])
+        self.assertEqual(self.getAlls(), calls + 1)
+
+        # and so are changed addresses of an ip config
+        self.assertEqual(isys.getIPAddresses("eth0"), ["10.0.0.1"])
+        config = self.bus.devices[eth0]["Ip4Config"]
+        self.bus.configs[config]["Addresses"] = \
+            self.bus.configs[self.bus.devices[eth1]["Ip4Config"]]["Addresses"]
+        self.assertEqual(isys.getIPAddresses("eth0"), ["10.0.0.1"])
+        self.bus.emit("PropertiesChanged", isys.NM_IP4CONFIG_IFACE, config, {})
+        self.assertEqual(isys.getIPAddresses("eth0"), ["192.168.0.1"])
+
+        del self.bus.devices[eth0]
+        self.bus.emit("DeviceRemoved", isys.NM_MANAGER_IFACE,
+                      isys.NM_MANAGER_PATH, eth0)
+        self.assertEqual(isys.getDeviceProperties().keys(), ["eth1"])
+
+        # a restarted NetworkManager has new object paths
+        self.bus.devices = {}
+        self.bus.addDevice("eth0", "52:54:00:00:00:03")
+        self.bus.emit("NameOwnerChanged", "org.freedesktop.DBus",
+                      "/org/freedesktop/DBus", isys.NM_SERVICE, ":1.2", ":1.3")
+        self.assertEqual(isys.getDeviceProperties().keys(), ["eth0"])
+        self.assertEqual(isys.getMacAddress("eth0"), "52:54:00:00:00:03")
+
+    def testMainLoop(self):
+        """ Verify nothing is kept while no main loop handles the signals. """
+        eth0 = self.bus.addDevice("eth0", "52:54:00:00:00:01")
+        depth = [0]
+        isys.nmDevices._mainDepth = lambda: depth[0]
+
+        self.bus.muted = True
+        self.assertEqual(isys.getMacAddress("eth0"), "52:54:00:00:00:01")
+        self.bus.typed[eth0][1]["HwAddress"] = "52:54:00:00:00:02"
+        self.assertEqual(isys.getMacAddress("eth0"), "52:54:00:00:00:02")
+        self.assertEqual(len([c for c in self.bus.calls
+                              if c[0] == "GetDevices"]), 2)
+
+        # called from a handler, the loop gets to the signals afterwards
+        depth[0] = 1
+        self.bus.typed[eth0][1]["HwAddress"] = "52:54:00:00:00:03"
+        self.assertEqual(isys.getMacAddress("eth0"), "52:54:00:00:00:02")
+        self.assertEqual(len([c for c in self.bus.calls
+                              if c[0] == "GetDevices"]), 2)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(NMDeviceCacheTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/python
+
+import os
+import signal
+import tempfile
+import time
+import unittest
+
+from pyanaconda import iutil
+
+class ExecWithCallbackTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def _callback(self, data, callback_data=None):
+        self.calls.append(data)
+
+    def testOutput(self):
+        """ Verify stdout, stderr and the exit status are all collected. """
+        ret = iutil.execWithCallback("sh", ["-c", "echo out; echo err >&2; exit 3"],
+                                     stderr="/dev/null", echo=False,
+                                     callback=self._callback)
+        self.assertEqual(ret.rc, 3)
+        self.assertEqual(ret.stdout, "out\n")
+        self.assertEqual(ret.stderr, "err\n")
+        self.assertEqual("".join(self.calls), "out\n")
+
+    def testBenchmark(self):
+        """ Run a command writing 50 MB to stdout through execWithCallback. """
+        size = 50 * 1024 * 1024
+        start = time.time()
+        ret = iutil.execWithCallback("head", ["-c", str(size), "/dev/zero"],
+                                     echo=False, callback=self._callback)
+        elapsed = time.time() - start
+
+        self.assertEqual(ret.rc, 0)
+        self.assertEqual(len(ret.stdout), size)
+
+        # the callback sees all of the output, just in far fewer calls
+        self.assertEqual(sum([len(d) for d in self.calls]), size)
+        self.assertTrue(len(self.calls) <= elapsed / iutil.EXEC_CALLBACK_INTERVAL + 2,
+                        "%d callbacks in %.2fs" % (len(self.calls), elapsed))
+        self.assertTrue(elapsed < 10,
+                        "50 MB of output took %.2fs to read" % elapsed)
+
+
+class ExecWithRedirectTestCase(unittest.TestCase):
+    def setUp(self):
+        (fd, self.out) = tempfile.mkstemp()
+        os.close(fd)
+        (fd, self.err) = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.out)
+        os.unlink(self.err)
+
+    def testRedirect(self):
+        """ Verify both streams end up in their files. """
+        rc = iutil.execWithRedirect("sh", ["-c", "echo one; echo two >&2; "
+                                           "printf three; exit 2"],
+                                    stdout=self.out, stderr=self.err)
+        self.assertEqual(rc, 2)
+        self.assertEqual(open(self.out).read(), "one\nthree")
+        self.assertEqual(open(self.err).read(), "two\n")
+
+    def testMissingProgram(self):
+        """ Verify a program that can't be run raises RuntimeError. """
+        self.assertRaises(RuntimeError, iutil.execWithRedirect,
+                          "/nonexistent/program", [],
+                          stdout=self.out, stderr=self.err)
+
+    def testBrokenOutput(self):
+        """ Verify a failing write to stdout doesn't hang on the child. """
+        def timeout(signum, frame):
+            raise AssertionError("execWithRedirect hung")
+
+        (r, w) = os.pipe()
+        os.close(r)
+        handler = signal.signal(signal.SIGALRM, timeout)
+        signal.alarm(30)
+        try:
+            # yes never stops writing unless its output goes away
+            self.assertRaises(RuntimeError, iutil.execWithRedirect,
+                              "yes", [], stdout=w, stderr=self.err)
+        finally:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, handler)
+            os.close(w)
+
+    def testEnvironment(self):
+        """ Verify changes to os.environ reach the programs run. """
+        os.environ["IUTIL_TEST"] = "first"
+        try:
+            iutil.execWithRedirect("sh", ["-c", "echo $IUTIL_TEST $LC_ALL"],
+                                   stdout=self.out, stderr=self.err)
+            self.assertEqual(open(self.out).read(), "first C\n")
+
+            os.environ["IUTIL_TEST"] = "second"
+            self.assertEqual(iutil.execWithCapture("sh", ["-c", "echo $IUTIL_TEST"],
+                                                   stderr=self.err),
+                             "second\n")
+        finally:
+            del os.environ["IUTIL_TEST"]
+
+    def testExecTimes(self):
+        """ Verify the time spent in each program is recorded. """
+        iutil.execWithRedirect("true", [], stdout=self.out, stderr=self.err)
+        iutil.execWithRedirect("true", [], stdout=self.out, stderr=self.err)
+        times = iutil._execTimes["true"]
+        self.assertTrue(times[0] >= 2)
+        self.assertEqual(sum(times[3:]), times[0])
+        iutil.logExecTimes()
+
+
+def suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(ExecWithCallbackTestCase),
+        unittest.TestLoader().loadTestsFromTestCase(ExecWithRedirectTestCase)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyanaconda import language
+
+LANG_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "..", "data", "lang-table")
+
+class LanguageIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.environ = os.environ.copy()
+        self.tmpdir = tempfile.mkdtemp()
+        shutil.copy(LANG_TABLE, self.tmpdir)
+        os.chdir(self.tmpdir)
+        os.environ["LANG"] = "en_US.UTF-8"
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmpdir)
+
+    def _scanCanonLang(self, lang, localeInfo):
+        # what _canonLang used to do
+        for key in localeInfo.keys():
+            if lang in language.expandLangs(key):
+                return key
+
+        return None
+
+    def _checkLookups(self, langs, parsed=None):
+        # short forms shared by several locales resolve the way a scan of
+        # a freshly parsed lang-table does, even in a Language loaded from
+        # an index whose localeInfo iterates in some other order
+        localeInfo = (parsed or langs).localeInfo
+        short = set(["xx", "fr_CA", "C"])
+        for key in localeInfo.keys():
+            short.update(language.expandLangs(key))
+
+        for lang in short:
+            try:
+                found = langs._canonLang(lang)
+            except ValueError:
+                found = None
+            self.assertEqual(found, self._scanCanonLang(lang, localeInfo))
+
+        for (key, val) in localeInfo.iteritems():
+            name = val[0]
+            expected = [k for (k, v) in localeInfo.iteritems()
+                          if v[0] == name][0]
+            self.assertEqual(langs.getLangByName(name), expected)
+
+        self.assertEqual(langs.getLangByName("Elvish"), None)
+
+    def testLookups(self):
+        """ Verify indexed lookups match a scan of lang-table. """
+        langs = language.Language()
+        self.assertEqual(langs._canonLang("fr"), "fr_FR.UTF-8")
+        self.assertRaises(ValueError, langs._canonLang, "fr_CA")
+        self._checkLookups(langs)
+
+    def testIndexFile(self):
+        """ Verify the index written at build time is loaded and used. """
+        langs = language.Language()
+        names = {"French": "Fran\xc3\xa7ais"}
+        language.writeLangIndex("lang-index", langs, names)
+
+        indexed = language.Language()
+        self.assertEqual(indexed.nativeLangNames, names)
+        self.assertEqual(indexed.localeInfo, langs.localeInfo)
+        self._checkLookups(indexed, langs)
+
+        # an index built from some other lang-table is ignored
+        f = open("lang-table", "a")
+        f.write("Klingon\ttlh\tnone\ttlh_QO.UTF-8\tus\tEurope/Prague\n")
+        f.close()
+        updated = language.Language()
+        self.assertEqual(updated.nativeLangNames, {})
+        self.assertEqual(updated.getLangByName("Klingon"), "tlh_QO.UTF-8")
+        self._checkLookups(updated)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(LanguageIndexTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from pyanaconda import anaconda_log
+anaconda_log.init()
+from pyanaconda import livecd
+
+class CopytreeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmpdir, "src")
+        self.dst = os.path.join(self.tmpdir, "dst")
+
+        os.makedirs(os.path.join(self.src, "etc/deep/deeper"))
+        os.makedirs(os.path.join(self.src, "var/empty"))
+        self._write("etc/passwd", "root:x:0:0\n", 0644)
+        self._write("etc/shadow", "root:!!\n", 0400)
+        self._write("etc/deep/deeper/script", "#!/bin/sh\n", 0755)
+        # more files than fit in one batch, so several workers get some
+        for i in range(livecd.COPYTREE_BATCH * 2 + 1):
+            self._write("var/file%d" % i, "%d\n" % i, 0600)
+
+        # a sparse file with data at both ends
+        f = open(os.path.join(self.src, "var/sparse"), "w")
+        f.write("start")
+        f.seek(16 * 1024 * 1024)
+        f.write("end")
+        f.close()
+
+        os.symlink("passwd", os.path.join(self.src, "etc/link"))
+        os.symlink("deep", os.path.join(self.src, "etc/dirlink"))
+
+        os.chmod(os.path.join(self.src, "etc/deep"), 0750)
+        os.chmod(os.path.join(self.src, "var/empty"), 0700)
+        # directory times from the past, so changing them shows up
+        for (path, when) in (("etc/deep/deeper", 1000000000),
+                             ("etc/deep", 1100000000),
+                             ("etc", 1200000000),
+                             ("var/empty", 1300000000),
+                             ("var", 1400000000)):
+            os.utime(os.path.join(self.src, path), (when, when))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, path, data, mode):
+        path = os.path.join(self.src, path)
+        f = open(path, "w")
+        f.write(data)
+        f.close()
+        os.chmod(path, mode)
+
+    def _walk(self, top):
+        """ Return a dict of path -> (mode, mtime, contents) under top. """
+        entries = {}
+        for (dirpath, dirnames, filenames) in os.walk(top):
+            for name in dirnames + filenames:
+                path = os.path.join(dirpath, name)
+                st = os.lstat(path)
+                if stat.S_ISLNK(st.st_mode):
+                    contents = os.readlink(path)
+                    mtime = None
+                elif stat.S_ISDIR(st.st_mode):
+                    contents = None
+                    mtime = int(st.st_mtime)
+                else:
+                    contents = open(path).read()
+                    mtime = int(st.st_mtime)
+                entries[os.path.relpath(path, top)] = (st.st_mode, mtime,
+                                                       contents)
+        return entries
+
+    def testCopy(self):
+        """ Verify modes, times, symlinks and holes are preserved. """
+        livecd.copytree(self.src, self.dst, symlinks=True, preserveOwner=True)
+        self.assertEqual(self._walk(self.dst), self._walk(self.src))
+
+        sparse = os.stat(os.path.join(self.dst, "var/sparse"))
+        self.assertEqual(sparse.st_size, 16 * 1024 * 1024 + 3)
+        self.assertTrue(sparse.st_blocks * 512 < 1024 * 1024)
+
+    def testFollowSymlinks(self):
+        """ Verify symlinks are copied as what they point to. """
+        livecd.copytree(self.src, self.dst)
+
+        link = os.path.join(self.dst, "etc/link")
+        self.assertFalse(os.path.islink(link))
+        self.assertEqual(open(link).read(), "root:x:0:0\n")
+
+        dirlink = os.path.join(self.dst, "etc/dirlink")
+        self.assertFalse(os.path.islink(dirlink))
+        self.assertEqual(sorted(os.listdir(dirlink)), ["deeper"])
+        self.assertEqual(stat.S_IMODE(os.stat(dirlink).st_mode), 0750)
+
+    def testErrors(self):
+        """ Verify what can't be copied is reported after everything else. """
+        os.symlink("nowhere", os.path.join(self.src, "etc/dangling"))
+        os.mkfifo(os.path.join(self.src, "var/fifo"))
+
+        try:
+            livecd.copytree(self.src, self.dst)
+        except livecd.Error as e:
+            errors = e.args[0]
+        else:
+            self.fail("copytree didn't raise Error")
+
+        self.assertEqual(sorted([(src, dst) for (src, dst, why) in errors]),
+                         [(os.path.join(self.src, path),
+                           os.path.join(self.dst, path))
+                          for path in ("etc/dangling", "var/fifo")])
+        for (src, dst, why) in errors:
+            self.assertTrue(isinstance(why, str) and why)
+
+        # everything else still got copied
+        self.assertEqual(open(os.path.join(self.dst, "etc/shadow")).read(),
+                         "root:!!\n")
+        self.assertEqual(stat.S_IMODE(os.stat(self.dst + "/var").st_mode),
+                         stat.S_IMODE(os.stat(self.src + "/var").st_mode))
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(CopytreeTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,385 @@
+#!/usr/bin/python
+
+import bz2
+import gzip
+import os
+import random
+import shutil
+import StringIO
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "utils"))
+import log_picker
+import log_picker.archiving as archiving
+import log_picker.logmining as logmining
+
+def makeDump(sections, lines):
+    """ A made up Anaconda dump with a traceback and some files in it. """
+    yield "anaconda 15.0 exception report\n"
+    yield "Traceback (most recent call first):\n\n"
+    for i in range(sections):
+        yield "\n\n/tmp/section%d.log:\n" % i
+        for j in range(lines):
+            yield "%d: some line of /tmp/section%d.log\n" % (j, i)
+
+class FakeAnacondaLogMiner(logmining.AnacondaLogMiner):
+    sections = 20
+    lines = 500
+
+    def _action(self):
+        time.sleep(0.3)
+        self._used = True
+        self.logfile.writelines(makeDump(self.sections, self.lines))
+
+class Running(object):
+    """ Counts how many miners run at once. """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.now = 0
+        self.most = 0
+
+    def enter(self):
+        with self.lock:
+            self.now += 1
+            self.most = max(self.most, self.now)
+
+    def leave(self):
+        with self.lock:
+            self.now -= 1
+
+class SlowLogMiner(logmining.LogMinerBaseClass):
+    _name = "slow"
+    _description = "Something slow."
+    _independent = True
+    running = Running()
+
+    def __init__(self, filename):
+        logmining.LogMinerBaseClass.__init__(self)
+        self._filename = filename
+
+    def get_filename(self):
+        return self._filename
+
+    def _action(self):
+        self.running.enter()
+        try:
+            time.sleep(0.3)
+            self.logfile.write("done with %s\n" % self._filename)
+        finally:
+            self.running.leave()
+
+class FailingLogMiner(SlowLogMiner):
+    def _action(self):
+        raise logmining.LogMinerError("no luck")
+
+class BrokenLogMiner(SlowLogMiner):
+    def _action(self):
+        raise RuntimeError("bug in the miner")
+
+class LogPickerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pickers = []
+
+    def tearDown(self):
+        for picker in self.pickers:
+            if picker.tmpdir:
+                shutil.rmtree(picker.tmpdir)
+            # an unnamed archive goes next to the temp dir, not into it
+            if picker.archive and os.path.exists(picker.archive):
+                os.remove(picker.archive)
+
+    def picker(self, archive_obj=None, miners=None, **kwargs):
+        if miners is None:
+            miners = [FakeAnacondaLogMiner(),
+                      SlowLogMiner("dmsetup-ls"),
+                      SlowLogMiner("dmsetup-info"),
+                      FailingLogMiner("filesystem")]
+        picker = log_picker.LogPicker(
+                        archive_obj=archive_obj or archiving.Bzip2Archive(),
+                        miners=miners, **kwargs)
+        self.pickers.append(picker)
+        return picker
+
+    def contents(self, picker):
+        ret = {}
+        for filename in picker.files:
+            ret[os.path.basename(filename)] = open(filename).read()
+        return ret
+
+    def oldCutToPieces(self, filename):
+        # what LogPicker._cut_to_pieces used to do, all in memory
+        actual_file = os.path.basename(filename)
+        files = {actual_file: []}
+        empty_lines = 0
+        for line in open(filename):
+            striped = line.strip()
+            if not striped:
+                empty_lines += 1
+            elif empty_lines > 1 and striped.startswith('/') \
+                            and striped.endswith(':') and len(line) > 2:
+                actual_file = striped[:-1].rsplit('/', 1)[-1]
+                files[actual_file] = []
+                empty_lines = 0
+            files[actual_file].append(line)
+
+        ret = {}
+        for (name, lines) in files.items():
+            ret[name] = "".join(lines)
+        return ret
+
+    def testPipeline(self):
+        """ Verify the pipeline collects the same logs, concurrently. """
+        SlowLogMiner.running = Running()
+        sequential = self.picker()
+        sequential.getlogs()
+        sequential.create_archive()
+        self.assertEqual(SlowLogMiner.running.most, 1)
+
+        # the dump is split just like it always was
+        expected = self.contents(sequential)
+        dump = [f for f in sequential.files if f.endswith("anaconda-dump")][0]
+        shutil.copy(dump, dump + ".orig")
+        pieces = self.oldCutToPieces(dump + ".orig")
+        self.assertEqual(pieces.pop("anaconda-dump.orig"),
+                         expected["anaconda-dump"])
+        for (name, data) in pieces.items():
+            self.assertEqual(expected[name], data)
+        self.assertEqual(len(expected), 4 + 20)
+
+        SlowLogMiner.running = Running()
+        pipeline = self.picker(pipeline=True)
+        pipeline.getlogs()
+        pipeline.create_archive("logs")
+
+        self.assertEqual(self.contents(pipeline), expected)
+        self.assertEqual([os.path.basename(f) for f in pipeline.files],
+                         [os.path.basename(f) for f in sequential.files])
+        # the independent miners ran side by side
+        self.assertEqual(SlowLogMiner.running.most, 2)
+
+        # and everything made it into the archive
+        self.assertEqual(pipeline.archive,
+                         os.path.join(pipeline.tmpdir, "logs.tar.bz2"))
+        tar = tarfile.open(pipeline.archive)
+        names = sorted([os.path.basename(n) for n in tar.getnames()])
+        tar.close()
+        self.assertEqual(names, sorted(expected.keys()))
+
+    def _checkAborted(self, picker, threads, archive):
+        # nothing is left running or open, and the archive is gone
+        self.assertEqual(threading.active_count(), threads)
+        self.assertFalse(os.path.exists(archive))
+        for fd in os.listdir("/proc/self/fd"):
+            try:
+                path = os.readlink(os.path.join("/proc/self/fd", fd))
+            except OSError:
+                continue
+            self.assertNotEqual(path, archive)
+
+    def testBrokenMiner(self):
+        """ Verify a miner raising an exception stops the archiving. """
+        threads = threading.active_count()
+        archive_obj = archiving.Bzip2StreamArchive(threads=2)
+        picker = self.picker(archive_obj=archive_obj,
+                             miners=[SlowLogMiner("dmsetup-ls"),
+                                     BrokenLogMiner("dmesg")],
+                             pipeline=True)
+        opened = []
+        openArchive = picker._open_archive
+        def recordArchive():
+            openArchive()
+            opened.append(picker.archive)
+        picker._open_archive = recordArchive
+
+        self.assertRaises(RuntimeError, picker.getlogs)
+        self.assertEqual(picker.archive, None)
+        # it was started where an unnamed archive goes
+        self.assertEqual(opened, [picker.tmpdir + ".tar.bz2"])
+        self._checkAborted(picker, threads, opened[0])
+
+    def testArchiveError(self):
+        """ Verify a file that can't be archived stops the archiving. """
+        threads = threading.active_count()
+        archive_obj = archiving.Bzip2StreamArchive(usetar=False, threads=2)
+        picker = self.picker(archive_obj=archive_obj,
+                             miners=[SlowLogMiner("dmsetup-ls"),
+                                     SlowLogMiner("dmsetup-info")],
+                             pipeline=True)
+        picker.getlogs()
+        self.assertRaises(archiving.ArchivationError, picker.create_archive)
+        self._checkAborted(picker, threads, picker.archive)
+
+    def testDuplicatePieces(self):
+        """ Verify pieces with the same name don't overwrite each other. """
+        picker = self.picker(pipeline=True)
+        picker._get_tmp_file("dmsetup-ls", register=False)
+        get_tmp_file = lambda name: picker._get_tmp_file(name, register=False)
+        done = []
+        splitter = log_picker.DumpSplitter(get_tmp_file("anaconda-dump"),
+                                           get_tmp_file, done.append)
+        splitter.write("start\n\n\n/tmp/x:\nfirst\n\n\n/var/x:\nsec")
+        splitter.write("ond\n\n\n/tmp/anaconda-dump:\nthird\n\n\n/dmsetup-ls:")
+        # the last line isn't complete yet, so neither is its piece
+        self.assertEqual([os.path.basename(f) for f in done],
+                         ["anaconda-dump", "x", "x-2"])
+        splitter.close()
+
+        self.assertEqual(done, splitter.files)
+        self.assertEqual([open(f).read() for f in done],
+                         ["start\n\n\n", "/tmp/x:\nfirst\n\n\n",
+                          "/var/x:\nsecond\n\n\n",
+                          "/tmp/anaconda-dump:\nthird\n\n\n",
+                          "/dmsetup-ls:"])
+        self.assertEqual(os.path.basename(done[-1]), "dmsetup-ls-2")
+
+
+def bunzip2(data):
+    # bz2 only reads the first of several concatenated streams
+    ret = []
+    while data:
+        decompressor = bz2.BZ2Decompressor()
+        ret.append(decompressor.decompress(data))
+        data = decompressor.unused_data
+    return "".join(ret)
+
+def gunzip(data):
+    return gzip.GzipFile(fileobj=StringIO.StringIO(data)).read()
+
+class StreamingArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.outfile = os.path.join(self.tmpdir, "out")
+        os.mkdir(os.path.join(self.tmpdir, "logs"))
+
+        random.seed(0)
+        self.files = {}
+        for (i, size) in enumerate([0, 10, 3 * 1024 * 1024 + 17, 500000]):
+            self.addFile("log%d" % i, size)
+
+        self.chunk = archiving.CHUNK_SIZE
+        archiving.CHUNK_SIZE = 256 * 1024
+
+    def tearDown(self):
+        archiving.CHUNK_SIZE = self.chunk
+        shutil.rmtree(self.tmpdir)
+
+    def addFile(self, name, size):
+        # compressible, but not too much
+        words = ["anaconda", "storage", "DEBUG", "INFO", "/dev/sda1", "\n"]
+        data = []
+        length = 0
+        while length < size:
+            word = random.choice(words) + str(random.randint(0, 1000)) + " "
+            data.append(word)
+            length += len(word)
+        data = "".join(data)[:size]
+
+        path = os.path.join(self.tmpdir, "logs", name)
+        open(path, "w").write(data)
+        self.files[path] = data
+        return path
+
+    def untar(self, data):
+        ret = {}
+        tar = tarfile.open(fileobj=StringIO.StringIO(data))
+        for member in tar.getmembers():
+            ret[os.path.join(self.tmpdir, member.name)] = \
+                tar.extractfile(member).read()
+        tar.close()
+        return ret
+
+    def _check(self, archive, decompress):
+        self.assertEqual(archive.create_archive(self.outfile,
+                                                sorted(self.files.keys())),
+                         self.outfile)
+        data = decompress(open(self.outfile, "rb").read())
+        self.assertEqual(self.untar(data), self.files)
+
+    def testBzip2(self):
+        """ Verify single stream and multi-threaded bzip2 archives. """
+        self._check(archiving.Bzip2StreamArchive(), bunzip2)
+        # one stream that the standard tools can read too
+        tarfile.open(self.outfile, "r:bz2").close()
+        self._check(archiving.Bzip2StreamArchive(threads=4), bunzip2)
+
+    def testGzip(self):
+        """ Verify single stream and multi-threaded gzip archives. """
+        self._check(archiving.GzipStreamArchive(), gunzip)
+        tarfile.open(self.outfile, "r:gz").close()
+        self._check(archiving.GzipStreamArchive(threads=4), gunzip)
+
+    def testXz(self):
+        """ Verify xz archives, when there is an lzma module. """
+        if archiving.lzma is None:
+            self.assertRaises(archiving.ArchivationError,
+                              archiving.XzStreamArchive)
+            return
+        decompress = lambda data: archiving.lzma.decompress(data)
+        self._check(archiving.XzStreamArchive(), decompress)
+
+    def testNoTar(self):
+        """ Verify a single file can be compressed without tar. """
+        path = sorted(self.files.keys())[2]
+        archive = archiving.Bzip2StreamArchive(usetar=False, threads=3)
+        self.assertEqual(archive.file_ext, ".bz2")
+        archive.create_archive(self.outfile, [path])
+        self.assertEqual(bunzip2(open(self.outfile, "rb").read()),
+                         self.files[path])
+
+        self.assertRaises(archiving.ArchivationError, archive.create_archive,
+                          self.outfile, sorted(self.files.keys()))
+
+    def testNoFiles(self):
+        """ Verify archiving nothing, or only empty files, fails. """
+        archive = archiving.GzipStreamArchive()
+        self.assertRaises(archiving.NoFilesArchivationError,
+                          archive.create_archive, self.outfile, [])
+        empty = [p for (p, d) in self.files.items() if not d]
+        self.assertRaises(archiving.NoFilesArchivationError,
+                          archive.create_archive, self.outfile, empty)
+
+    def testBenchmark(self):
+        """ Compare the streaming archive with Bzip2Archive. """
+        for i in range(4):
+            self.addFile("big%d" % i, 2 * 1024 * 1024)
+        filelist = sorted(self.files.keys())
+
+        # Bzip2Archive makes its temp tar with mkstemp
+        tmpfiles = []
+        mkstemp = tempfile.mkstemp
+        def countingMkstemp(*args, **kwargs):
+            ret = mkstemp(*args, **kwargs)
+            tmpfiles.append(ret[1])
+            return ret
+
+        tempfile.mkstemp = countingMkstemp
+        try:
+            archiving.Bzip2Archive().create_archive(self.outfile + "-old",
+                                                    filelist)
+            self.assertEqual(len(tmpfiles), 1)
+
+            archiving.Bzip2StreamArchive().create_archive(self.outfile,
+                                                          filelist)
+            self.assertEqual(len(tmpfiles), 1)
+        finally:
+            tempfile.mkstemp = mkstemp
+
+        old = bunzip2(open(self.outfile + "-old", "rb").read())
+        new = bunzip2(open(self.outfile, "rb").read())
+        self.assertEqual(self.untar(new), self.untar(old))
+
+
+def suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(LogPickerTestCase),
+        unittest.TestLoader().loadTestsFromTestCase(StreamingArchiveTestCase)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import socket
+import struct
+
+from pyanaconda import isys
+
+class FakeMatch(object):
+    def __init__(self, bus, receiver):
+        self.bus = bus
+        self.receiver = receiver
+
+    def remove(self):
+        self.bus.receivers.remove(self.receiver)
+
+class FakeObject(object):
+    def __init__(self, bus, path):
+        self.bus = bus
+        self.path = path
+
+    def get_dbus_method(self, name, dbus_interface=None):
+        def method(*args):
+            self.bus.calls.append((name, self.path) + args)
+            return getattr(self.bus, name)(self.path, *args)
+        return method
+
+class FakeNMBus(object):
+    """ Just enough of a system bus with NetworkManager on it.
+
+        Signals are handled as soon as they are sent, unless the bus is
+        muted, as if they were waiting for a busy main loop.
+    """
+    def __init__(self):
+        self.calls = []
+        self.receivers = []
+        self.muted = False
+        self.state = isys.NM_STATE_DISCONNECTED
+        self.devices = {}
+        self.typed = {}
+        self.configs = {}
+        self.paths = {}
+
+    def addDevice(self, iface, hwaddr=None, ip4=(),
+                  devtype=isys.NM_DEVICE_TYPE_ETHERNET,
+                  state=isys.NM_DEVICE_STATE_ACTIVATED):
+        path = "/org/freedesktop/NetworkManager/Devices/%d" % len(self.devices)
+        self.devices[path] = {"Interface": iface,
+                              "DeviceType": devtype,
+                              "State": state,
+                              "Udi": "/sys/devices/virtual/net/%s" % iface,
+                              "Ip4Config": "/",
+                              "Ip6Config": "/"}
+        self.paths[iface] = path
+        # like NetworkManager, only wired and wireless devices have a
+        # hardware address, and not on the Device interface
+        type_iface = isys.NM_DEVICE_TYPE_IFACES.get(devtype)
+        if type_iface:
+            self.typed[path] = (type_iface, {"HwAddress": hwaddr,
+                                             "PermHwAddress": hwaddr})
+        if ip4:
+            self.setAddresses(path, ip4)
+        return path
+
+    def setAddresses(self, path, ip4):
+        config = "/org/freedesktop/NetworkManager/IP4Config/%d" % len(self.configs)
+        addrs = [(struct.unpack("I", socket.inet_aton(a))[0], 24, 0)
+                 for a in ip4]
+        self.configs[config] = {"Addresses": addrs}
+        self.devices[path]["Ip4Config"] = config
+        return config
+
+    def setDeviceState(self, iface, state):
+        path = self.paths[iface]
+        old = self.devices[path]["State"]
+        self.devices[path]["State"] = state
+        self.emit("StateChanged", isys.NM_DEVICE_IFACE, path, state, old, 0)
+
+    def setState(self, state):
+        self.state = state
+        self.emit("StateChanged", isys.NM_MANAGER_IFACE, isys.NM_MANAGER_PATH,
+                  state)
+
+    def get_object(self, service, path):
+        assert service == isys.NM_SERVICE
+        return FakeObject(self, path)
+
+    def add_signal_receiver(self, handler, signal_name, **kwargs):
+        receiver = (signal_name, handler, kwargs)
+        self.receivers.append(receiver)
+        return FakeMatch(self, receiver)
+
+    def emit(self, signal_name, iface, path, *args):
+        if self.muted:
+            return
+        for (name, handler, kwargs) in list(self.receivers):
+            if name != signal_name:
+                continue
+            if kwargs.get("dbus_interface") not in (None, iface):
+                continue
+            if kwargs.get("path") not in (None, path):
+                continue
+            if "arg0" in kwargs and args[0] != kwargs["arg0"]:
+                continue
+            if "path_keyword" in kwargs:
+                handler(*args, **{kwargs["path_keyword"]: path})
+            else:
+                handler(*args)
+
+    def GetDevices(self, path):
+        return sorted(self.devices.keys())
+
+    def GetAll(self, path, iface):
+        if iface == isys.NM_DEVICE_IFACE:
+            return self.devices[path].copy()
+        if path in self.typed:
+            assert iface == self.typed[path][0]
+            return self.typed[path][1].copy()
+        return self.configs[path].copy()
+
+    def Get(self, path, iface, name):
+        if path == isys.NM_MANAGER_PATH:
+            return self.state
+        return self.devices[path][name]
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+
+import time
+import unittest
+
+from pyanaconda import anaconda_log
+anaconda_log.init()
+
+from pyanaconda import isys
+from pyanaconda import network
+from mock.nm import FakeNMBus
+
+class FakeContext(object):
+    """ A main context that runs one scheduled change per iteration.  If
+        a main loop is running, the change's signals are left to it.
+    """
+    def __init__(self, bus, running=False):
+        self.bus = bus
+        self.running = running
+        self.changes = []
+        self.iterations = 0
+
+    def iterate(self, timeout):
+        self.iterations += 1
+        if self.changes:
+            self.bus.muted = self.running
+            try:
+                self.changes.pop(0)()
+            finally:
+                self.bus.muted = False
+        else:
+            time.sleep(timeout)
+        return not self.running
+
+class NMStateWaiterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.bus = FakeNMBus()
+        self.context = FakeContext(self.bus)
+        self.nmDevices = isys.nmDevices
+        isys.nmDevices = isys.NMDeviceCache(bus=self.bus)
+
+    def tearDown(self):
+        isys.nmDevices = self.nmDevices
+
+    def stateReceivers(self):
+        return [r for r in self.bus.receivers if r[0] == "StateChanged"]
+
+    def waiter(self):
+        return network.NMStateWaiter(bus=self.bus, context=self.context)
+
+    def testDevices(self):
+        """ Verify waiting for several devices ends with the last of them. """
+        for iface in ("eth0", "eth1", "eth2"):
+            self.bus.addDevice(iface, state=30)
+        self.bus.addDevice("eth3", state=isys.NM_DEVICE_STATE_ACTIVATED)
+
+        activated = isys.NM_DEVICE_STATE_ACTIVATED
+        self.context.changes = [
+            lambda: self.bus.setDeviceState("eth1", 50),
+            lambda: self.bus.setDeviceState("eth1", activated),
+            lambda: self.bus.setDeviceState("eth2", activated),
+            lambda: self.bus.setDeviceState("eth0", activated),
+            lambda: self.fail("waited after the last device was activated")]
+
+        start = time.time()
+        failed = self.waiter().waitForDevices(["eth0", "eth1", "eth2", "eth3",
+                                               "eth9"], timeout=30)
+        self.assertEqual(failed, [])
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(self.context.iterations, 4)
+
+        # each device's state was only asked for once
+        self.assertEqual(len([c for c in self.bus.calls if c[0] == "Get"]), 4)
+        self.assertEqual(self.stateReceivers(), [])
+
+    def testDeadline(self):
+        """ Verify the devices not activated by the deadline are returned. """
+        self.bus.addDevice("eth0", state=30)
+        self.bus.addDevice("eth1", state=30)
+        self.context.changes = [
+            lambda: self.bus.setDeviceState("eth1",
+                                            isys.NM_DEVICE_STATE_ACTIVATED)]
+
+        start = time.time()
+        failed = self.waiter().waitForDevices(["eth0", "eth1"], timeout=0.3)
+        elapsed = time.time() - start
+        self.assertEqual(failed, ["eth0"])
+        self.assertTrue(0.3 <= elapsed < 1.3, elapsed)
+        self.assertEqual(self.stateReceivers(), [])
+
+    def testManager(self):
+        """ Verify waiting for NetworkManager to be connected. """
+        self.assertTrue(self.waiter().waitForManager(lambda s: s > 0))
+        self.assertEqual(self.context.iterations, 0)
+
+        self.context.changes = [
+            lambda: self.bus.setState(isys.NM_STATE_CONNECTING),
+            lambda: self.bus.setState(isys.NM_STATE_CONNECTED_GLOBAL)]
+        self.assertTrue(self.waiter().waitForManager(network.nmIsConnected,
+                                                     timeout=30))
+        self.assertEqual(self.context.iterations, 2)
+
+        self.context.changes = [
+            lambda: self.bus.setState(isys.NM_STATE_DISCONNECTED)]
+        self.assertFalse(self.waiter().waitForManager(
+                         lambda s: s == isys.NM_STATE_ASLEEP, timeout=0.2))
+        self.assertEqual(self.stateReceivers(), [])
+
+    def testMainLoopRunning(self):
+        """ Verify the states are looked at again if the signals can't be
+            handled while waiting.
+        """
+        self.context = FakeContext(self.bus, running=True)
+        self.bus.addDevice("eth0", state=30)
+        self.bus.addDevice("eth1", state=30)
+        activated = isys.NM_DEVICE_STATE_ACTIVATED
+        self.context.changes = [
+            lambda: self.bus.setDeviceState("eth0", activated),
+            lambda: self.bus.setDeviceState("eth1", activated),
+            lambda: self.bus.setState(isys.NM_STATE_CONNECTED_GLOBAL)]
+
+        failed = self.waiter().waitForDevices(["eth0", "eth1"], timeout=30)
+        self.assertEqual(failed, [])
+        self.assertEqual(self.context.iterations, 2)
+        # both at first, both after eth0 changed, then only eth1
+        self.assertEqual(len([c for c in self.bus.calls if c[0] == "Get"]), 5)
+
+        self.assertTrue(self.waiter().waitForManager(network.nmIsConnected,
+                                                     timeout=30))
+        self.assertEqual(self.context.iterations, 3)
+        self.assertEqual(self.stateReceivers(), [])
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(NMStateWaiterTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
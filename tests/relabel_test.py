@@ -0,0 +1,200 @@
+#!/usr/bin/python
+
+import logging
+import os
+import re
+import shutil
+import stat
+import StringIO
+import tempfile
+import threading
+import unittest
+
+from pyanaconda import relabel
+
+# the first match wins
+SPEC = [("/var/lib/rpm(/.*)?", None, "system_u:object_r:rpm_var_lib_t:s0"),
+        ("/var/log/audit(/.*)?", None, "system_u:object_r:auditd_log_t:s0"),
+        ("/var/log(/.*)?", None, "system_u:object_r:var_log_t:s0"),
+        ("/etc/lvm/cache(/.*)?", None, "<<none>>"),
+        ("/etc/lvm(/.*)?", stat.S_IFDIR, "system_u:object_r:lvm_etc_t:s0"),
+        ("/etc/lvm(/.*)?", None, "system_u:object_r:lvm_metadata_t:s0"),
+        ("/.*", None, "system_u:object_r:default_t:s0")]
+
+class FakeSELinux(object):
+    """ File contexts kept in a dict instead of in xattrs, matched against a
+        made up spec the way libselinux does it.
+    """
+    def __init__(self):
+        self.spec = [(re.compile("^%s$" % regex), mode, con)
+                     for (regex, mode, con) in SPEC]
+        self.contexts = {}
+        self.sets = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, path, mode):
+        for (regex, specMode, con) in self.spec:
+            if specMode and stat.S_IFMT(mode) != specMode:
+                continue
+            if regex.match(path):
+                if con == "<<none>>":
+                    raise OSError(2, "no context")
+                return con
+        raise OSError(2, "no context")
+
+    def getfilecon(self, path):
+        if path not in self.contexts:
+            raise OSError(61, "no context")
+        return self.contexts[path]
+
+    def setfilecon(self, path, con):
+        with self.lock:
+            self.sets += 1
+        self.contexts[path] = con
+        return True
+
+    def close(self):
+        pass
+
+class RelabelerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.backend = FakeSELinux()
+
+        self.logged = StringIO.StringIO()
+        self.handler = logging.StreamHandler(self.logged)
+        relabel.log.addHandler(self.handler)
+        self.level = relabel.log.level
+        relabel.log.setLevel(logging.DEBUG)
+
+    def tearDown(self):
+        relabel.log.removeHandler(self.handler)
+        relabel.log.setLevel(self.level)
+        shutil.rmtree(self.root)
+
+    def _write(self, path):
+        full_path = os.path.join(self.root, path.lstrip("/"))
+        if not os.path.isdir(os.path.dirname(full_path)):
+            os.makedirs(os.path.dirname(full_path))
+        open(full_path, "w").close()
+        return full_path
+
+    def makeTree(self, top, dirs, files, labeled=0):
+        """ Make dirs directories of files files under top, the first
+            labeled of which are labeled right already.
+        """
+        n = 0
+        for d in range(dirs):
+            for f in range(files):
+                path = "%s/dir%d/file%d" % (top, d, f)
+                full_path = self._write(path)
+                if n < labeled:
+                    self.backend.contexts[full_path] = \
+                        self.backend.lookup(path, stat.S_IFREG)
+                n += 1
+
+    def oldSetFileCons(self, tops):
+        # what packages.setFileCons used to do, one matchpathcon, one
+        # lsetfilecon and one line of log for every file
+        def contextCB(arg, directory, files):
+            for file in files:
+                path = os.path.join(directory, file)
+                if not os.access(path, os.R_OK):
+                    relabel.log.warning("%s doesn't exist" % path)
+                    continue
+                if path.startswith(self.root):
+                    path = path.replace(self.root, "")
+                full_path = os.path.normpath("%s/%s" % (self.root, path))
+                try:
+                    # matchpathcon copes with the leading "//" here
+                    ret = self.backend.lookup(
+                        os.path.normpath("/" + path.lstrip("/")), 0)
+                    self.backend.setfilecon(full_path, ret)
+                except OSError:
+                    ret = None
+                relabel.log.info("set fc of %s to %s" % (path, ret))
+
+        for top in tops:
+            dir = "%s/%s" % (self.root, top)
+            os.path.walk(dir, contextCB, None)
+            contextCB(None, "", [dir])
+
+    def testRelabel(self):
+        """ Verify trees are relabeled to what the spec says. """
+        self.makeTree("/var/log", 2, 3)
+        self._write("/var/log/audit/audit.log")
+        self._write("/etc/lvm/lvm.conf")
+        self._write("/etc/lvm/cache/.cache")
+        os.symlink("/nonexistent", os.path.join(self.root, "etc/lvm/link"))
+        self._write("/etc/shadow")
+
+        relabeler = relabel.Relabeler(self.root, backend=self.backend)
+        counts = relabeler.relabelTrees(["/var/log", "/etc/lvm", "/missing"])
+        self.assertEqual(counts, {"/var/log": [11, 11, 0],
+                                  "/etc/lvm": [5, 3, 0],
+                                  "/missing": [0, 0, 0]})
+        self.assertEqual(relabeler.relabelFiles(["//etc/shadow", "/nothere"]),
+                         [1, 1, 0])
+
+        contexts = self.backend.contexts
+        def context(path):
+            return contexts.get(os.path.join(self.root, path))
+        self.assertEqual(context("var/log/dir1/file2"),
+                         "system_u:object_r:var_log_t:s0")
+        self.assertEqual(context("var/log/audit/audit.log"),
+                         "system_u:object_r:auditd_log_t:s0")
+        self.assertEqual(context("etc/lvm"), "system_u:object_r:lvm_etc_t:s0")
+        self.assertEqual(context("etc/lvm/lvm.conf"),
+                         "system_u:object_r:lvm_metadata_t:s0")
+        self.assertEqual(context("etc/lvm/link"),
+                         "system_u:object_r:lvm_metadata_t:s0")
+        self.assertEqual(context("etc/lvm/cache/.cache"), None)
+        self.assertEqual(context("etc/shadow"), "system_u:object_r:default_t:s0")
+
+        # nothing is set again the second time around
+        sets = self.backend.sets
+        relabeler.relabelTrees(["/var/log", "/etc/lvm"])
+        self.assertEqual(self.backend.sets, sets)
+
+        # one line for each tree and list of files, plus the missing ones
+        self.assertEqual(len(self.logged.getvalue().splitlines()), 7)
+
+    def testBenchmark(self):
+        """ Relabel 20000 files, most of them right already. """
+        tops = ["/var/lib/rpm", "/var/log", "/etc/lvm", "/dev/vg_test"]
+        for top in tops:
+            self.makeTree(top, 50, 100, labeled=4500)
+
+        self.oldSetFileCons(tops)
+        expected = self.backend.contexts
+        oldLines = len(self.logged.getvalue().splitlines())
+
+        self.backend = FakeSELinux()
+        for top in tops:
+            self.makeTree(top, 50, 100, labeled=4500)
+        self.logged.truncate(0)
+
+        relabeler = relabel.Relabeler(self.root, backend=self.backend)
+        counts = relabeler.relabelTrees(tops)
+
+        for top in tops:
+            self.assertEqual(counts[top], [5051, 551, 0])
+        self.assertEqual(self.backend.sets, 4 * 551)
+        self.assertEqual(len(self.logged.getvalue().splitlines()), 4)
+        self.assertTrue(oldLines > 20000)
+
+        # the old way used the file type blind lookup, so /etc/lvm's
+        # directories were labeled as files
+        for (path, con) in expected.items():
+            if con == "system_u:object_r:lvm_metadata_t:s0" and \
+               os.path.isdir(path):
+                con = "system_u:object_r:lvm_etc_t:s0"
+            self.assertEqual(self.backend.contexts[path], con)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(RelabelerTestCase)
+
+
+if __name__ == "__main__":
+    unittest.main()
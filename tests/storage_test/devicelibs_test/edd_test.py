@@ -0,0 +1,96 @@
+#!/usr/bin/python
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import storage.devicelibs.edd as edd
+
+class FakeDisk(object):
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.sysfsPath = "/block/%s" % name
+
+class EddTestCase(unittest.TestCase):
+    """ Match disks against a fake /sys/firmware/edd tree. """
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.paths = (edd.EDD_PATH, edd.SYSFS_PATH)
+        edd.EDD_PATH = os.path.join(self.root, "firmware/edd")
+        edd.SYSFS_PATH = self.root
+        os.makedirs(edd.EDD_PATH)
+
+        self.reads = []
+        self.read_disk_info = edd._read_disk_info
+        edd._read_disk_info = self._read_disk_info
+
+    def tearDown(self):
+        (edd.EDD_PATH, edd.SYSFS_PATH) = self.paths
+        edd._read_disk_info = self.read_disk_info
+        shutil.rmtree(self.root)
+
+    def _read_disk_info(self, dev):
+        self.reads.append(dev.name)
+        return self.read_disk_info(dev)
+
+    def _write(self, path, data):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        f = open(path, "w")
+        f.write(data)
+        f.close()
+
+    def addBiosDev(self, biosdev, signature, sectors=None):
+        path = os.path.join(edd.EDD_PATH, "int13_dev%d" % biosdev)
+        os.makedirs(path)
+        if signature is not None:
+            self._write(os.path.join(path, "mbr_signature"),
+                        "0x%08x\n" % signature)
+        if sectors is not None:
+            self._write(os.path.join(path, "sectors"), "%d\n" % sectors)
+
+    def addDisk(self, name, signature, sectors):
+        path = os.path.join(self.root, "dev", name)
+        self._write(path, "\0" * 440 + struct.pack("I", signature) + "\0" * 68)
+        self._write(os.path.join(self.root, "block", name, "size"),
+                    "%d\n" % sectors)
+        return FakeDisk(name, path)
+
+    def testMatch(self):
+        """ Verify each biosdev is matched to the right disk. """
+        disks = [self.addDisk("sda", 0x1234, 1000),
+                 self.addDisk("sdb", 0x5678, 2000),
+                 self.addDisk("sdc", 0x5678, 3000),
+                 self.addDisk("sdd", 0x9abc, 4000),
+                 self.addDisk("sde", 0x9abc, 4000)]
+        self.addBiosDev(80, 0x5678, 3000)
+        self.addBiosDev(81, 0x1234)
+        self.addBiosDev(82, None)
+        self.addBiosDev(83, 0x9abc, 4000)
+        self.addBiosDev(84, 0xdead)
+
+        self.assertEqual(edd.get_edd_dict(disks), {"sdc": 80, "sda": 81})
+
+        # every disk was read exactly once for all five biosdevs
+        self.assertEqual(sorted(self.reads), [d.name for d in disks])
+
+    def testUnreadable(self):
+        """ Verify disks that can't be read are skipped. """
+        disks = [self.addDisk("sda", 0x1234, 1000),
+                 FakeDisk("sdb", os.path.join(self.root, "dev/missing"))]
+        self.addBiosDev(80, 0x1234, 1000)
+        self.assertEqual(edd.get_edd_dict(disks), {"sda": 80})
+
+    def testNoEdd(self):
+        """ Verify no disk is opened when there is no EDD data. """
+        disks = [self.addDisk("sda", 0x1234, 1000)]
+        self.assertEqual(edd.get_edd_dict(disks), {})
+        self.assertEqual(self.reads, [])
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(EddTestCase)
+
+if __name__ == '__main__':
+    unittest.main()
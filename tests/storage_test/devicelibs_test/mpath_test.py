@@ -1,11 +1,14 @@
 #!/usr/bin/python
 import baseclass
+import os
+import shutil
+import tempfile
 import unittest
 
+import storage.devicelibs.mpath as mpath
+
 class MPathTestCase(baseclass.DevicelibsTestCase):
     def testMPath(self):
-        import storage.devicelibs.mpath as mpath
-
         ##
         ## parseMultipathOutput
         ## 
@@ -24,8 +27,204 @@ size=10G features='1 queue_if_no_path' hwhandler='1 emc' wp=undef
         expected = {'mpatha':['sdb','sdc'], 'mpathb':['sda']}
         self.assertEqual(topology, expected)
 
+class FakeDevice(object):
+    def __init__(self, serial=None, vendor=None, model=None):
+        self.serial = serial
+        self.vendor = vendor
+        self.model = model
+
+class FakeMultipath(object):
+    def __init__(self, name, wwid):
+        self.config = {'wwid': wwid, 'alias': name}
+
+class MultipathTopologyTestCase(unittest.TestCase):
+    """ Build topologies from synthetic udev data. """
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.paths = (mpath.SYSFS_PATH, mpath.BINDINGS_PATH)
+        mpath.SYSFS_PATH = self.root
+        mpath.BINDINGS_PATH = os.path.join(self.root, "bindings")
+
+        self.commands = []
+        self.outputs = {}
+        self.execWithCapture = mpath.iutil.execWithCapture
+        mpath.iutil.execWithCapture = self._execWithCapture
+
+        self.devices = []
+
+    def tearDown(self):
+        (mpath.SYSFS_PATH, mpath.BINDINGS_PATH) = self.paths
+        mpath.iutil.execWithCapture = self.execWithCapture
+        shutil.rmtree(self.root)
+
+    def _execWithCapture(self, command, argv, **kwargs):
+        self.commands.append([command] + argv)
+        return self.outputs.get(tuple(argv), "")
+
+    def addDisk(self, serial, vendor="HP", model="HSV400", size=41943040,
+                **kwargs):
+        name = "sd%s" % mpath._alias(len(self.devices))[5:]
+        info = {'name': name,
+                'sysfs_path': "/devices/block/%s" % name,
+                'DEVTYPE': "disk",
+                'ID_BUS': "scsi",
+                'ID_VENDOR': vendor,
+                'ID_MODEL': model}
+        if serial:
+            info['ID_SERIAL'] = serial
+        info.update(kwargs)
+
+        path = os.path.join(self.root, info['sysfs_path'][1:])
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        f = open(os.path.join(path, "size"), "w")
+        f.write("%d\n" % size)
+        f.close()
+
+        self.devices.append(info)
+        return name
+
+    def addPartition(self, disk):
+        info = {'name': "%s1" % disk,
+                'sysfs_path': "/devices/block/%s/%s1" % (disk, disk),
+                'DEVTYPE': "partition"}
+        self.devices.append(info)
+        return info['name']
+
+    def members(self, topology):
+        return sorted([sorted([d['name'] for d in disks])
+                       for disks in topology.multipaths_iter()])
+
+    def testTopology(self):
+        """ Verify paths are grouped by wwid with the usual exceptions. """
+        a = [self.addDisk("3600a0b80001"), self.addDisk("3600a0b80001")]
+        b = [self.addDisk("3600a0b80002"), self.addDisk("3600a0b80002"),
+             self.addDisk("3600a0b80002")]
+        part = self.addPartition(a[0])
+        single = self.addDisk("3600a0b80003")
+        noserial = [self.addDisk(None), self.addDisk(None)]
+        sata = [self.addDisk("ST3120026AS", vendor="ATA"),
+                self.addDisk("ST3120026AS", vendor="ATA")]
+        lunz = [self.addDisk("36006016000", vendor="DGC", model="LUNZ"),
+                self.addDisk("36006016000", vendor="DGC", model="LUNZ")]
+        usb = [self.addDisk("Generic_Card_Reader", vendor="Generic",
+                            ID_USB_DRIVER="usb-storage"),
+               self.addDisk("Generic_Card_Reader", vendor="Generic",
+                            ID_USB_DRIVER="usb-storage")]
+
+        topology = mpath.MultipathTopology(self.devices)
+        self.assertEqual(self.members(topology), [sorted(a), sorted(b)])
+        self.assertEqual(self.commands, [])
+
+        self.assertEqual(topology.multipath_name(a[1]), "mpatha")
+        self.assertEqual(topology.multipath_name(b[0]), "mpathb")
+        self.assertEqual(topology.multipath_name(single), None)
+        for name in a + b:
+            info = topology._devmap[name]
+            self.assertEqual(info["ID_FS_TYPE"], "multipath_member")
+            self.assertEqual(info["ID_MPATH_NAME"],
+                             topology.multipath_name(name))
+
+        self.assertEqual(topology._nondisks, [part])
+        self.assertEqual(sorted(topology._singlepaths),
+                         sorted([single] + noserial + sata + lunz + usb))
+        self.assertEqual([d['name'] for d in topology.devices_iter()],
+                         [d['name'] for d in self.devices])
+
+        # the names stick, and new ones don't clash with them
+        self.assertEqual(open(mpath.BINDINGS_PATH).read(),
+                         "mpatha 3600a0b80001\nmpathb 3600a0b80002\n")
+        self.devices = []
+        c = [self.addDisk("3600a0b80004"), self.addDisk("3600a0b80004")]
+        b = [self.addDisk("3600a0b80002"), self.addDisk("3600a0b80002")]
+        topology = mpath.MultipathTopology(self.devices)
+        self.assertEqual(topology.multipath_name(c[0]), "mpathc")
+        self.assertEqual(topology.multipath_name(b[0]), "mpathb")
+
+    def testAmbiguous(self):
+        """ Verify multipath is only run for groups of paths that differ. """
+        a = [self.addDisk("3600a0b80001"), self.addDisk("3600a0b80001")]
+        b = [self.addDisk("SSEAGATE_1234", size=1000),
+             self.addDisk("SSEAGATE_1234", size=2000),
+             self.addDisk("SSEAGATE_1234", size=2000)]
+        c = [self.addDisk("SHITACHI_5678", model="HUS"),
+             self.addDisk("SHITACHI_5678", model="HUS2")]
+
+        self.outputs[("-d", "/dev/%s" % b[0])] = """\
+create: mpathq (SSEAGATE_1234) undef SEAGATE,ST1
+size=1G features='0' hwhandler='0' wp=undef
+`-+- policy='round-robin 0' prio=1 status=undef
+  |- 2:0:0:0 %s 8:0  undef ready running
+  `- 3:0:0:0 %s 8:16 undef ready running
+""" % (b[1], b[2])
+
+        topology = mpath.MultipathTopology(self.devices)
+        self.assertEqual(self.members(topology), [sorted(a), sorted(b[1:])])
+        self.assertEqual(topology.multipath_name(b[1]), "mpathq")
+        self.assertEqual(self.commands,
+                         [["multipath", "-d", "/dev/%s" % b[0]],
+                          ["multipath", "-d", "/dev/%s" % c[0]],
+                          ["multipath", "-ll", "/dev/%s" % c[0]]])
+
+    def testConfirmedNames(self):
+        """ Verify new names don't clash with ones multipath confirmed. """
+        a = [self.addDisk("SSEAGATE_1234", size=1000),
+             self.addDisk("SSEAGATE_1234", size=2000),
+             self.addDisk("SSEAGATE_1234", size=2000)]
+        b = [self.addDisk("3600a0b80001"), self.addDisk("3600a0b80001")]
+
+        self.outputs[("-d", "/dev/%s" % a[0])] = """\
+create: mpatha (SSEAGATE_1234) undef SEAGATE,ST1
+size=1G features='0' hwhandler='0' wp=undef
+`-+- policy='round-robin 0' prio=1 status=undef
+  |- 2:0:0:0 %s 8:0  undef ready running
+  `- 3:0:0:0 %s 8:16 undef ready running
+""" % (a[1], a[2])
+
+        topology = mpath.MultipathTopology(self.devices)
+        self.assertEqual(self.members(topology), [sorted(a[1:]), sorted(b)])
+        self.assertEqual(topology.multipath_name(a[1]), "mpatha")
+        self.assertEqual(topology.multipath_name(b[0]), "mpathb")
+        self.assertEqual(topology._singlepaths, [a[0]])
+        self.assertEqual(open(mpath.BINDINGS_PATH).read(),
+                         "mpathb 3600a0b80001\n")
+
+    def testConfig(self):
+        """ Verify the blacklist and mpaths of a config writer are honored. """
+        a = [self.addDisk("3600a0b80001"), self.addDisk("3600a0b80001")]
+        b = [self.addDisk("3600a0b80002"), self.addDisk("3600a0b80002")]
+        c = [self.addDisk("3600a0b80003", vendor="NETAPP", model="LUN"),
+             self.addDisk("3600a0b80003", vendor="NETAPP", model="LUN")]
+
+        config = mpath.MultipathConfigWriter()
+        config.addBlacklistDevice(FakeDevice(serial="3600a0b80001"))
+        config.addBlacklistDevice(FakeDevice(vendor="NETAPP", model="LUN"))
+        topology = mpath.MultipathTopology(self.devices, config=config)
+        self.assertEqual(self.members(topology), [sorted(b)])
+
+        # once there are mpaths only those are looked at
+        config = mpath.MultipathConfigWriter()
+        config.addMultipathDevice(FakeMultipath("mpathx", "3600a0b80002"))
+        topology = mpath.MultipathTopology(self.devices, config=config)
+        self.assertEqual(self.members(topology), [sorted(b)])
+        self.assertEqual(topology.multipath_name(b[0]), "mpathx")
+
+    def testBenchmark(self):
+        """ Build the topology of 500 LUNs with 4 paths each. """
+        for lun in range(500):
+            for path in range(4):
+                self.addDisk("3600a0b8%08d" % lun)
+
+        topology = mpath.MultipathTopology(self.devices)
+        self.assertEqual(len(list(topology.multipaths_iter())), 500)
+        self.assertEqual(len(set([topology.multipath_name(d['name'])
+                                  for d in self.devices])), 500)
+        self.assertEqual(self.commands, [])
+
 def suite():
-    return unittest.TestLoader().loadTestsFromTestCase(MPathTestCase)
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(MPathTestCase),
+        unittest.TestLoader().loadTestsFromTestCase(MultipathTopologyTestCase)])
 
 if __name__ == '__main__':
     unittest.main()
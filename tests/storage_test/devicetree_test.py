@@ -0,0 +1,229 @@
+#!/usr/bin/python
+
+import unittest
+
+from storagetestcase import StorageTestCase
+from pyanaconda.storage.devicetree import DeviceTree
+from pyanaconda.storage.errors import DeviceTreeError
+
+# device classes for brevity's sake -- later on, that is
+from pyanaconda.storage.devices import StorageDevice
+from pyanaconda.storage.devices import DiskDevice
+from pyanaconda.storage.devices import LVMVolumeGroupDevice
+from pyanaconda.storage.devices import LVMLogicalVolumeDevice
+
+class DeviceTreeLookupTestCase(StorageTestCase):
+    def setUp(self):
+        self.setUpAnaconda()
+        self.tree = DeviceTree()
+
+    def _populate(self, count):
+        """ Add count synthetic disks to the tree. """
+        for i in range(count):
+            disk = self.newDevice(device_class=DiskDevice,
+                                  name="sd%d" % i, size=1000,
+                                  major=8, minor=i,
+                                  sysfsPath="/devices/virtual/block/sd%d" % i)
+            disk.format = self.newFormat("ext4", uuid="uuid-%d" % i,
+                                         label="label-%d" % i)
+            self.tree._addDevice(disk)
+
+    def testLookups(self):
+        """ Verify the indexed lookups find the right devices. """
+        self._populate(10)
+        tree = self.tree
+
+        self.assertEqual(tree.getDeviceByName("sd3").name, "sd3")
+        self.assertEqual(tree.getDeviceByPath("/dev/sd4").name, "sd4")
+        self.assertEqual(tree.getDeviceBySysfsPath("/devices/virtual/block/sd5").name,
+                         "sd5")
+        self.assertEqual(tree.getDeviceByMajorMinor(8, 6).name, "sd6")
+        self.assertEqual(tree.getDeviceByUuid("uuid-7").name, "sd7")
+        self.assertEqual(tree.getDeviceByLabel("label-8").name, "sd8")
+        self.assertEqual(tree.getDeviceByName("sd10"), None)
+
+        # removal drops the device from all indexes
+        sd9 = tree.getDeviceByName("sd9")
+        tree._removeDevice(sd9)
+        self.assertEqual(tree.getDeviceByName("sd9"), None)
+        self.assertEqual(tree.getDeviceByUuid("uuid-9"), None)
+        self.assertEqual(tree.getDeviceByMajorMinor(8, 9), None)
+
+        # changes to a device's sysfs path and format are picked up
+        sd2 = tree.getDeviceByName("sd2")
+        sd2.sysfsPath = "/devices/pci0000:00/block/sd2"
+        self.assertEqual(tree.getDeviceBySysfsPath("/devices/virtual/block/sd2"),
+                         None)
+        self.assertEqual(tree.getDeviceBySysfsPath("/devices/pci0000:00/block/sd2"),
+                         sd2)
+
+        sd2.format = self.newFormat("ext4", uuid="new-uuid")
+        self.assertEqual(tree.getDeviceByUuid("new-uuid"), sd2)
+        self.assertEqual(tree.getDeviceByUuid("uuid-2"), None)
+
+        # uuids assigned behind the tree's back are still found
+        sd1 = tree.getDeviceByName("sd1")
+        sd1.format.uuid = "late-uuid"
+        self.assertEqual(tree.getDeviceByUuid("late-uuid"), sd1)
+
+    def testRename(self):
+        """ Verify vg and lv renames are reflected in lookups. """
+        self._populate(2)
+        tree = self.tree
+        pv = tree.getDeviceByName("sd0")
+        pv.format = self.newFormat("lvmpv")
+        vg = self.newDevice(device_class=LVMVolumeGroupDevice,
+                            name="vg-old", parents=[pv])
+        tree._addDevice(vg)
+        lv = self.newDevice(device_class=LVMLogicalVolumeDevice,
+                            name="root", vgdev=vg, size=100)
+        tree._addDevice(lv)
+
+        self.assertEqual(tree.getDeviceByName("vg-old-root"), lv)
+        self.assertEqual(tree.getDeviceByName("vg--old-root"), lv)
+        self.assertEqual(tree.getDeviceByPath("/dev/mapper/vg--old-root"), lv)
+
+        vg.name = "vgnew"
+        self.assertEqual(tree.getDeviceByName("vgnew"), vg)
+        self.assertEqual(tree.getDeviceByName("vg-old"), None)
+        self.assertEqual(tree.getDeviceByName("vgnew-root"), lv)
+        self.assertEqual(tree.getDeviceByPath("/dev/mapper/vgnew-root"), lv)
+        self.assertEqual(tree.getDeviceByName("vg-old-root"), None)
+
+    def testLookupScaling(self):
+        """ Verify lookups among 5000 devices only check the matching one. """
+        count = 5000
+        self._populate(count)
+        tree = self.tree
+        checked = []
+        lookup = tree._lookup
+        def countingLookup(index, key, match):
+            def countingMatch(device):
+                checked.append(device)
+                return match(device)
+            return lookup(index, key, countingMatch)
+        tree._lookup = countingLookup
+
+        names = ["sd%d" % i for i in range(0, count, count / 500)]
+        for name in names:
+            path = "/devices/virtual/block/%s" % name
+            self.assertEqual(tree.getDeviceBySysfsPath(path).name, name)
+
+        # a linear scan would have looked at half the tree every time
+        self.assertEqual([d.name for d in checked], names)
+
+class CountingDisk(DiskDevice):
+    """ A disk that counts how often it's asked if it has media. """
+    checks = 0
+    missing = set()
+
+    @property
+    def mediaPresent(self):
+        CountingDisk.checks += 1
+        return self.name not in CountingDisk.missing
+
+
+class StorageViewTestCase(StorageTestCase):
+    def setUp(self):
+        self.setUpStorage()
+        CountingDisk.checks = 0
+        CountingDisk.missing = set()
+
+    def _populate(self, count):
+        for i in range(count):
+            disk = self.newDevice(device_class=CountingDisk,
+                                  name="sd%d" % i, size=1000)
+            self.storage.devicetree._addDevice(disk)
+
+    def testInvalidation(self):
+        """ Verify the views follow additions, removals and format changes. """
+        self._populate(3)
+        storage = self.storage
+        tree = storage.devicetree
+        self.assertEqual([d.name for d in storage.disks], ["sd0", "sd1", "sd2"])
+        self.assertEqual(storage.pvs, [])
+
+        # callers are free to change the lists they get
+        storage.disks.pop()
+        self.assertEqual(len(storage.disks), 3)
+
+        generation = tree.generation
+        sd1 = tree.getDeviceByName("sd1")
+        sd1.format = self.newFormat("lvmpv")
+        self.assertNotEqual(tree.generation, generation)
+        self.assertEqual(storage.pvs, [sd1])
+
+        vg = self.newDevice(device_class=LVMVolumeGroupDevice,
+                            name="vg", parents=[sd1])
+        tree._addDevice(vg)
+        self.assertEqual(storage.vgs, [vg])
+
+        tree._removeDevice(vg)
+        self.assertEqual(storage.vgs, [])
+
+        sd3 = self.newDevice(device_class=CountingDisk, name="sd3", size=1000)
+        tree._addDevice(sd3)
+        self.assertEqual(storage.disks[-1], sd3)
+        self.assertEqual(len(storage.devices), 4)
+
+    def testMedia(self):
+        """ Verify media coming and going shows up without a tree change. """
+        self._populate(3)
+        storage = self.storage
+        tree = storage.devicetree
+        for disk in tree.devices:
+            disk.format = self.newFormat("disklabel", exists=True)
+        self.assertEqual(len(storage.partitioned), 3)
+
+        generation = tree.generation
+        CountingDisk.missing.add("sd1")
+        self.assertEqual([d.name for d in storage.disks], ["sd0", "sd2"])
+        self.assertEqual([d.name for d in storage.partitioned], ["sd0", "sd2"])
+
+        CountingDisk.missing.clear()
+        self.assertEqual(len(storage.disks), 3)
+        self.assertEqual(len(storage.partitioned), 3)
+        self.assertEqual(tree.generation, generation)
+
+    def testDuplicatePaths(self):
+        """ Verify duplicate paths are still caught. """
+        self._populate(2)
+        tree = self.storage.devicetree
+        tree._devices.append(self.newDevice(device_class=CountingDisk,
+                                            name="sd0", size=1000))
+        # the tree was changed behind its back, so let it know
+        tree._generation += 1
+        self.assertRaises(DeviceTreeError, getattr, tree, "devices")
+
+    def testRepeatedDisks(self):
+        """ Verify repeated storage.disks calls don't re-sort 1000 disks. """
+        count = 1000
+        self._populate(count)
+        storage = self.storage
+        compares = []
+        compareDisks = storage.compareDisks
+        def counting(first, second):
+            compares.append(first)
+            return compareDisks(first, second)
+        storage.compareDisks = counting
+
+        self.assertEqual(len(storage.disks), count)
+        sorted_once = len(compares)
+        self.assertTrue(sorted_once)
+
+        for i in range(100):
+            storage.disks
+
+        # only whether media is present gets looked at again
+        self.assertEqual(len(compares), sorted_once)
+        self.assertEqual(CountingDisk.checks, count * 101)
+
+
+def suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(DeviceTreeLookupTestCase),
+        unittest.TestLoader().loadTestsFromTestCase(StorageViewTestCase)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,9 @@
 #!/usr/bin/python
 
+import os
+import random
+import shutil
+import tempfile
 import unittest
 from mock import Mock
 
@@ -8,7 +12,13 @@ import parted
 import pyanaconda.anaconda_log
 pyanaconda.anaconda_log.init()
 
+from pyanaconda.storage import partitioning
 from pyanaconda.storage.partitioning import getNextPartitionType
+from pyanaconda.storage.partitioning import Chunk, Request, sizeToSectors
+from pyanaconda.storage.errors import PartitioningError
+from pyanaconda.storage.devices import DiskDevice
+from pyanaconda.storage.devices import PartitionDevice
+from pyanaconda.storage.formats import getFormat
 
 # disklabel-type-specific constants
 # keys: disklabel type string
@@ -122,8 +132,263 @@ class PartitioningTestCase(unittest.TestCase):
         self.assertEqual(getNextPartitionType(disk, no_primary=True), None)
 
 
+class ReferenceChunk(Chunk):
+    """ Chunk growth as it was done one request at a time. """
+    def trimOverGrownRequest(self, req, base=None):
+        req_end = req.partition.partedPartition.geometry.end
+        req_start = req.partition.partedPartition.geometry.start
+
+        growth = 0
+        for request in self.requests:
+            if request.partition.partedPartition.geometry.start < req_start:
+                growth += request.growth
+        req_end += growth
+
+        limits = []
+        max_sector = req.partition.partedPartition.disk.maxPartitionStartSector
+        limits.append(max_sector - req_end)
+        if req.partition.req_bootable:
+            limits.append(sizeToSectors(2*1024*1024, self.sectorSize) - req_end)
+        if req.max_growth:
+            limits.append(req.max_growth)
+
+        max_growth = min(limits)
+
+        if max_growth and req.growth >= max_growth:
+            if req.growth > max_growth:
+                extra = req.growth - max_growth
+                self.pool += extra
+                req.growth = max_growth
+
+            if base is not None:
+                base -= req.base
+            req.done = True
+
+        return base
+
+    def growRequests(self):
+        self.requests.sort(key=lambda r: r.partition.partedPartition.geometry.start)
+
+        new_base = self.base
+        last_pool = 0
+        while not self.done and self.pool and last_pool != self.pool:
+            last_pool = self.pool
+            self.base = new_base
+            for p in self.requests:
+                if p.done:
+                    continue
+
+                share = p.base / float(self.base)
+                growth = int(share * last_pool)
+                p.growth += growth
+                self.pool -= growth
+
+                new_base = self.trimOverGrownRequest(p, base=new_base)
+
+        if self.pool:
+            for p in self.requests:
+                if p.done:
+                    continue
+
+                p.growth += self.pool
+                self.pool = 0
+
+                self.trimOverGrownRequest(p)
+                if self.pool == 0:
+                    break
+
+
+class ChunkGrowthTestCase(unittest.TestCase):
+    """ Compare Chunk.growRequests against the original growth loop. """
+    iterations = 500
+
+    def newChunk(self, chunk_class, seed):
+        rand = random.Random(seed)
+        sector_size = rand.choice([512, 4096])
+
+        disk = Mock()
+        disk.device.sectorSize = sector_size
+        disk.device.path = "/dev/sda"
+        disk.maxPartitionLength = rand.choice([0, 2**32 - 1])
+
+        start = rand.randint(0, 2048)
+        length = rand.randint(10**4, 10**10)
+        geometry = Mock()
+        geometry.device = disk.device
+        geometry.start = start
+        geometry.end = start + length - 1
+        geometry.length = length
+        geometry.getSize = Mock(return_value=length * sector_size / 1024.0**2)
+
+        # sometimes the disklabel limits how far the chunk can be used
+        disk.maxPartitionStartSector = rand.choice([2**32 - 1, 2**64 - 1,
+                                                    start + length / 2])
+
+        chunk = chunk_class(geometry)
+        sector = start
+        for i in range(rand.randint(1, 30)):
+            part_length = rand.randint(1, max(1, length / 60))
+            if sector + part_length > start + length / 2:
+                break
+
+            partition = Mock()
+            partition.id = i
+            partition.name = "req%d" % i
+            partition.req_grow = rand.random() < 0.7
+            partition.req_max_size = rand.choice([0, 0, rand.randint(1, 50000)])
+            partition.req_bootable = rand.random() < 0.1
+            partition.format.maxSize = rand.choice([0, 0, 16 * 1024 * 1024])
+            partition.partedPartition.disk = disk
+            partition.partedPartition.geometry.start = sector
+            partition.partedPartition.geometry.end = sector + part_length - 1
+            partition.partedPartition.geometry.length = part_length
+            chunk.addRequest(Request(partition))
+            sector += part_length + rand.randint(0, 2048)
+
+        return chunk
+
+    def testGrowth(self):
+        for seed in range(self.iterations):
+            expected = self.newChunk(ReferenceChunk, seed)
+            expected.growRequests()
+            chunk = self.newChunk(Chunk, seed)
+            chunk.growRequests()
+
+            self.assertEqual([(r.id, r.growth, r.done) for r in chunk.requests],
+                             [(r.id, r.growth, r.done) for r in expected.requests],
+                             "growth differs for seed %d" % seed)
+            self.assertEqual(chunk.pool, expected.pool)
+
+
+class ReferenceGrowthEstimator(partitioning.GrowthEstimator):
+    """ Growth evaluation as allocatePartitions originally did it.
+
+        The candidate partition is added to the disk for real, and the
+        chunks of every disk are grown from scratch for every candidate.
+    """
+    def totalGrowth(self, partition, disk, free, part_type):
+        disklabel = self.disklabels[disk.path]
+        new_growth = 0
+        for disk_path in self.disklabels.keys():
+            temp_parts = self.partitions[disk_path][:]
+            if disk_path == disk.path:
+                temp_part = partitioning.addPartition(disklabel, free,
+                                                      part_type,
+                                                      partition.req_size)
+                partition.partedPartition = temp_part
+                partition.disk = disk
+                temp_parts.append(partition)
+
+            chunks = partitioning.getDiskChunks(self.disks[disk_path],
+                                                temp_parts, self.freespace)
+            for chunk in chunks:
+                chunk.growRequests()
+                new_growth += chunk.growth
+
+        disklabel.partedDisk.removePartition(temp_part)
+        partition.partedPartition = None
+        partition.disk = None
+        return new_growth
+
+
+class AllocationEquivalenceTestCase(unittest.TestCase):
+    """ Compare allocatePartitions against the original growth evaluation. """
+    iterations = 50
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.estimator = partitioning.GrowthEstimator
+
+        class ImageDiskDevice(DiskDevice):
+            _devDir = self.tmpdir
+
+        self.diskClass = ImageDiskDevice
+
+    def tearDown(self):
+        partitioning.GrowthEstimator = self.estimator
+        shutil.rmtree(self.tmpdir)
+
+    def newDisk(self, name, size, label_type):
+        """ Return a DiskDevice with an empty disklabel on a sparse image. """
+        path = os.path.join(self.tmpdir, name)
+        image = open(path, "w")
+        image.truncate(size * 1024 * 1024)
+        image.close()
+
+        label = getFormat("disklabel", exists=False)
+        label._partedDevice = parted.Device(path=path)
+        label._partedDisk = parted.freshDisk(device=label._partedDevice,
+                                             ty=label_type)
+        if label._partedDisk.isFlagAvailable(parted.DISK_CYLINDER_ALIGNMENT):
+            label._partedDisk.unsetFlag(parted.DISK_CYLINDER_ALIGNMENT)
+        label.device = path
+
+        disk = self.diskClass(name, format=label, size=size, exists=True)
+        disk._partedDevice = label._partedDevice
+        return disk
+
+    def allocate(self, seed):
+        """ Allocate a random set of requests on a random set of disks.
+
+            Return a list describing where each request ended up, or the
+            message of the PartitioningError allocation failed with.
+        """
+        rand = random.Random(seed)
+        label_type = rand.choice(["msdos", "gpt"])
+        disks = []
+        for i in range(rand.randint(1, 6)):
+            disks.append(self.newDisk("sd%s" % chr(ord("a") + i),
+                                      rand.randint(2, 40) * 1024, label_type))
+
+        partitions = []
+        for i in range(rand.randint(1, 12)):
+            req_disks = []
+            if rand.random() < 0.3:
+                req_disks = rand.sample(disks, rand.randint(1, len(disks)))
+
+            grow = rand.random() < 0.5
+            maxsize = 0
+            if grow and rand.random() < 0.5:
+                maxsize = rand.randint(500, 20000)
+
+            fmt = getFormat(rand.choice(["ext4", "ext4", "swap"]))
+            part = PartitionDevice("req%d" % i, format=fmt,
+                                   size=rand.randint(100, 4000),
+                                   grow=grow, maxsize=maxsize,
+                                   primary=rand.random() < 0.2,
+                                   parents=req_disks)
+            partitions.append(part)
+
+        storage = Mock()
+        storage.compareDisks = lambda a, b: cmp(a, b)
+        storage.anaconda.bootloader.drivelist = [disks[0].name]
+
+        free = partitioning.getFreeRegions(disks)
+        try:
+            partitioning.allocatePartitions(storage, disks, partitions, free)
+            partitioning.growPartitions(disks, partitions, free)
+        except PartitioningError as e:
+            return str(e)
+
+        return [(p.disk.name, p.partedPartition.type,
+                 p.partedPartition.geometry.start,
+                 p.partedPartition.geometry.end) for p in partitions]
+
+    def testEquivalence(self):
+        for seed in range(self.iterations):
+            partitioning.GrowthEstimator = ReferenceGrowthEstimator
+            expected = self.allocate(seed)
+
+            partitioning.GrowthEstimator = self.estimator
+            self.assertEqual(self.allocate(seed), expected,
+                             "layouts differ for seed %d" % seed)
+
+
 def suite():
-    return unittest.TestLoader().loadTestsFromTestCase(PartitioningTestCase)
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(PartitioningTestCase),
+        unittest.TestLoader().loadTestsFromTestCase(ChunkGrowthTestCase),
+        unittest.TestLoader().loadTestsFromTestCase(AllocationEquivalenceTestCase)])
 
 
 if __name__ == "__main__":
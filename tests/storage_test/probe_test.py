@@ -0,0 +1,181 @@
+#!/usr/bin/python
+
+import os
+import threading
+import unittest
+
+from pyanaconda import anaconda_log
+anaconda_log.init()
+from pyanaconda.storage.probe import ProbeCache
+from pyanaconda.storage.devicetree import DeviceTree
+
+class ProbeCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _probe(self, name, fail=False):
+        self.lock.acquire()
+        try:
+            self.calls.append(name)
+        finally:
+            self.lock.release()
+        if fail:
+            raise RuntimeError("%s is broken" % name)
+        return "%s probed" % name
+
+    def testHits(self):
+        """ Verify probe results are returned once, under their keys. """
+        cache = ProbeCache(workers=3)
+        for name in ("sda1", "sdb1", "sdc1", "sdd1"):
+            cache.add(("format", name), self._probe, name)
+        # queueing the same key twice only probes it once
+        cache.add(("format", "sda1"), self._probe, "sda1")
+        cache.run()
+
+        self.assertEqual(sorted(self.calls), ["sda1", "sdb1", "sdc1", "sdd1"])
+        self.assertEqual(cache.pop(("format", "sdb1")), "sdb1 probed")
+        self.assertEqual(cache.pop(("format", "sdb1")), None)
+
+        # a result still waiting to be claimed isn't probed again
+        cache.add(("format", "sda1"), self._probe, "sda1")
+        cache.run()
+        self.assertEqual(len(self.calls), 4)
+        self.assertEqual(cache.pop(("format", "sda1")), "sda1 probed")
+
+    def testMisses(self):
+        """ Verify keys nothing was probed under return the default. """
+        cache = ProbeCache()
+        cache.add(("format", "sda1"), self._probe, "sda1")
+        self.assertEqual(cache.pop(("format", "sda1")), None)
+        cache.run()
+        self.assertEqual(cache.pop(("mdexamine", "sda1"), "none"), "none")
+
+        cache.clear()
+        self.assertEqual(cache.pop(("format", "sda1")), None)
+
+    def testExceptions(self):
+        """ Verify a failing probe leaves no result and stops nothing else. """
+        cache = ProbeCache(workers=2)
+        cache.add("good", self._probe, "good")
+        cache.add("bad", self._probe, "bad", fail=True)
+        cache.add("other", self._probe, "other")
+        cache.run()
+
+        self.assertEqual(sorted(self.calls), ["bad", "good", "other"])
+        self.assertEqual(cache.pop("bad"), None)
+        self.assertEqual(cache.pop("good"), "good probed")
+        self.assertEqual(cache.pop("other"), "other probed")
+
+class ProbeKeyTestCase(unittest.TestCase):
+    def testFormatKey(self):
+        """ Verify format probe keys don't depend on the device node. """
+        info = {"name": "md127", "sysfs_path": "/devices/virtual/block/md127"}
+        key = DeviceTree._formatProbeKey.im_func
+        args = ["ext4"]
+
+        probed = key(None, info, args, {"uuid": "1234",
+                                        "device": "/dev/md127"})
+        wanted = key(None, info, args, {"uuid": "1234",
+                                        "device": "/dev/md/root"})
+        self.assertEqual(probed, wanted)
+
+        other = dict(info, sysfs_path="/devices/virtual/block/md126")
+        self.assertNotEqual(key(None, other, args, {"uuid": "1234"}), probed)
+        self.assertNotEqual(key(None, info, args, {"uuid": "5678"}), probed)
+
+class FakeConf(object):
+    def __init__(self, ignoredDisks=[], exclusiveDisks=[]):
+        self.ignoredDisks = ignoredDisks
+        self.exclusiveDisks = exclusiveDisks
+
+class MayProbeTestCase(unittest.TestCase):
+    """ Decide which devices to probe from a fake udev db and sysfs. """
+    def setUp(self):
+        self.known = {}
+        self.slaves = {}
+        self.arrays = set()
+        self.os = (os.listdir, os.readlink, os.path.exists)
+        os.listdir = self._listdir
+        os.readlink = self._readlink
+        os.path.exists = self._exists
+
+        for disk in ("sda", "sdb", "sdc"):
+            self.addDevice(disk, DEVTYPE="disk")
+            self.addDevice("%s1" % disk, parent=disk, DEVTYPE="partition")
+        self.addDevice("md0", slaves=["sda1", "sdb1"])
+        self.addDevice("md1", slaves=["sda1", "sdc1"])
+        self.addDevice("dm-0", slaves=["md0"], DM_NAME="vg-root")
+        self.addDevice("dm-1", slaves=["md1"], DM_NAME="vg-home")
+        self.addDevice("dm-2", slaves=["sdd"], DM_NAME="unknown")
+
+    def tearDown(self):
+        (os.listdir, os.readlink, os.path.exists) = self.os
+
+    def addDevice(self, name, parent=None, slaves=None, **kwargs):
+        if parent:
+            path = "/devices/pci/block/%s/%s" % (parent, name)
+        elif slaves is not None:
+            path = "/devices/virtual/block/%s" % name
+            self.slaves["/sys%s/slaves" % path] = slaves
+            if not name.startswith("dm-"):
+                self.arrays.add("/sys%s/md" % path)
+        else:
+            path = "/devices/pci/block/%s" % name
+        info = dict(kwargs, name=name, sysfs_path=path)
+        self.known[path] = info
+        return info
+
+    def _listdir(self, path):
+        if path.startswith("/sys/"):
+            if path not in self.slaves:
+                raise OSError(2, "No such file or directory")
+            return self.slaves[path]
+        return self.os[0](path)
+
+    def _readlink(self, path):
+        if not path.startswith("/sys/"):
+            return self.os[1](path)
+        # slaves are linked to relative to /sys/devices/virtual/block/X/slaves
+        name = path.rsplit("/", 1)[1]
+        for (sysfs_path, info) in self.known.items():
+            if info["name"] == name:
+                return "../../../.." + sysfs_path[len("/devices"):]
+        raise OSError(2, "No such file or directory")
+
+    def _exists(self, path):
+        if path.startswith("/sys/"):
+            return path in self.arrays
+        return self.os[2](path)
+
+    def _probed(self, **kwargs):
+        tree = DeviceTree(conf=FakeConf(**kwargs))
+        return sorted([info["name"] for info in self.known.values()
+                       if tree._mayProbe(info, self.known)])
+
+    def testAll(self):
+        """ Verify everything on the disks udev knows about is probed. """
+        self.assertEqual(self._probed(),
+                         ["dm-0", "dm-1", "md0", "md1", "sda", "sda1", "sdb",
+                          "sdb1", "sdc", "sdc1"])
+
+    def testIgnored(self):
+        """ Verify arrays with a slave on an ignored disk aren't probed. """
+        self.assertEqual(self._probed(ignoredDisks=["sdc"]),
+                         ["dm-0", "md0", "sda", "sda1", "sdb", "sdb1"])
+
+    def testExclusive(self):
+        """ Verify arrays need all their slaves on exclusive disks. """
+        self.assertEqual(self._probed(exclusiveDisks=["sda", "sdc"]),
+                         ["dm-1", "md1", "sda", "sda1", "sdc", "sdc1"])
+
+
+def suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(ProbeCacheTestCase),
+        unittest.TestLoader().loadTestsFromTestCase(ProbeKeyTestCase),
+        unittest.TestLoader().loadTestsFromTestCase(MayProbeTestCase)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -21,12 +21,14 @@
 #
 # Red Hat Author(s): David Cantrell <dcantrell@redhat.com>
 
+import random
 import unittest
 
 from pyanaconda import anaconda_log
 anaconda_log.init()
 from pyanaconda.storage.errors import *
-from pyanaconda.storage.size import Size, _prefixes
+from pyanaconda.storage.size import Size, DecimalSize, _prefixes, _makeSpecs
+from decimal import Decimal
 
 class SizeTestCase(unittest.TestCase):
     def testExceptions(self):
@@ -79,8 +81,68 @@ class SizeTestCase(unittest.TestCase):
         s = Size(bytes=478360371L)
         self.assertEquals(s.humanReadable(), "0.48 Gb")
 
+    def testNoSpace(self):
+        self.assertEquals(Size(spec="640kb"), 640000)
+        self.assertEquals(Size(spec="640KiB"), 640 * 1024)
+        self.assertEquals(Size(spec="1.5Gb"), 1500000000)
+        self.assertEquals(Size(spec="640b"), 640)
+        self.assertRaises(SizeParamsError, Size, spec="640 furlongs")
+
+    def testDecimalSize(self):
+        s = DecimalSize(spec="1.5 b")
+        self.assertEquals(s, DecimalSize(spec="3 b") / 2)
+        self.assertEquals(Size(spec="1.5 b"), 1)
+
+        random.seed(0)
+        for e in range(1, 25):
+            bytes = random.randint(1, 10 ** e)
+            for places in (1, 2, 3):
+                self.assertEquals(Size(bytes=bytes).humanReadable(places),
+                                  DecimalSize(bytes=bytes).humanReadable(places))
+                self.assertEquals(Size(bytes=bytes).convertTo("MiB"),
+                                  DecimalSize(bytes=bytes).convertTo("MiB"))
+
+def scanParseSpec(spec):
+    """ The way specs like "47 MB" used to be parsed, by building the
+        specifiers of every prefix until one matches.
+    """
+    (size, specifier) = spec.split()
+    size = Decimal(size)
+    specifier = specifier.lower()
+    for factor, prefix, abbr in _prefixes:
+        if specifier in _makeSpecs(prefix, abbr):
+            return size * factor
+
+def scanConvertTo(size, spec):
+    """ The way convertTo used to find the factor for spec. """
+    spec = spec.lower()
+    for factor, prefix, abbr in _prefixes:
+        if spec in _makeSpecs(prefix, abbr):
+            return size / Decimal(factor)
+
+class SizeLookupTestCase(unittest.TestCase):
+    """ Check Size against the old way of finding prefixes. """
+    def setUp(self):
+        random.seed(0)
+        self.values = [random.randint(1, 10 ** random.randint(1, 15))
+                       for i in range(200)]
+
+    def testConvertTo(self):
+        for v in self.values:
+            for spec in ("GiB", "mb", "kilobytes", "TB"):
+                self.assertEquals(Size(bytes=v).convertTo(spec),
+                                  scanConvertTo(DecimalSize(bytes=v), spec))
+
+    def testParse(self):
+        for v in self.values:
+            spec = "%d %s" % (v % 100000 + 1,
+                              ("MB", "GB", "TB", "GiB", "kb")[v % 5])
+            self.assertEquals(Size(spec=spec), scanParseSpec(spec))
+
 def suite():
-    return unittest.TestLoader().loadTestsFromTestCase(SizeTestCase)
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(SizeTestCase),
+        unittest.TestLoader().loadTestsFromTestCase(SizeLookupTestCase)])
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,4 +1,6 @@
 
+import random
+import time
 import unittest
 import tsort
 
@@ -53,8 +55,76 @@ class TopologicalSortTestCase(unittest.TestCase):
                         "ordering constraints not satisfied")
 
 
+class TopologicalSortScalingTestCase(unittest.TestCase):
+    def _checkOrder(self, order, items, edges):
+        self.failUnlessEqual(len(order), len(items))
+        position = dict((item, i) for (i, item) in enumerate(order))
+        for (parent, child) in edges:
+            self.failUnless(position[parent] < position[child],
+                            "ordering constraint %s -> %s not satisfied"
+                            % (parent, child))
+
+    def _randomDAG(self, count, fanout):
+        items = range(count)
+        rank = items[:]
+        random.shuffle(rank)
+        edges = []
+        for i in range(count - 1):
+            for j in range(fanout):
+                child = random.randint(i + 1, count - 1)
+                edges.append((rank[i], rank[child]))
+        random.shuffle(items)
+        return (items, edges)
+
+    def _timeSort(self, count, fanout):
+        (items, edges) = self._randomDAG(count, fanout)
+        graph = tsort.create_graph(items, edges)
+        start = time.time()
+        order = tsort.tsort(graph)
+        elapsed = time.time() - start
+        self._checkOrder(order, items, edges)
+        return elapsed
+
+    def testLargeGraph(self):
+        """ Sort a graph with 20000 items and 80000 edges. """
+        random.seed(0)
+        self._timeSort(20000, 4)
+
+    def testLinearScaling(self):
+        """ Verify sort time grows roughly linearly with graph size. """
+        random.seed(0)
+        small = min([self._timeSort(5000, 4) for i in range(3)])
+        large = min([self._timeSort(40000, 4) for i in range(3)])
+
+        # an O(V*E) sort would be ~64 times slower on a graph 8 times larger
+        self.failUnless(large < small * 24,
+                        "sorting 8x the items took %.1fx as long"
+                        % (large / max(small, 1e-6)))
+
+    def testGraphUnchanged(self):
+        """ Verify tsort does not consume the graph it is given. """
+        items = [1, 2, 3, 4, 5]
+        edges = [(5, 4), (4, 3), (3, 2), (2, 1)]
+        graph = tsort.create_graph(items, edges)
+        first = tsort.tsort(graph)
+        self.failUnlessEqual(graph['edges'], edges)
+        self.failUnlessEqual(tsort.tsort(graph), first)
+        self._checkOrder(first, items, edges)
+
+    def testLargeCycle(self):
+        """ Verify cycle detection in a large graph with a root. """
+        count = 20000
+        items = range(count)
+        edges = [(i, i + 1) for i in range(count - 1)]
+        edges.append((count - 1, count / 2))
+        graph = tsort.create_graph(items, edges)
+        self.failUnlessRaises(tsort.CyclicGraphError, tsort.tsort, graph)
+
+
 def suite():
-    return unittest.TestLoader().loadTestsFromTestCase(TopologicalSortTestCase)
+    suite1 = unittest.TestLoader().loadTestsFromTestCase(TopologicalSortTestCase)
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(TopologicalSortScalingTestCase)
+    return unittest.TestSuite([suite1, suite2])
 
 
 if __name__ == "__main__":
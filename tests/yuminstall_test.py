@@ -0,0 +1,183 @@
+#!/usr/bin/python
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyanaconda import anaconda_log
+anaconda_log.init()
+from pyanaconda import yuminstall
+
+MB = 1024 * 1024
+
+class FakeRepo(object):
+    def __init__(self, network=True):
+        self.network = network
+
+    def needsNetwork(self):
+        return self.network
+
+class FakePackage(object):
+    """ A package taking up 10 MB once installed, with a 4 MB rpm. """
+    def __init__(self, name, repo):
+        self.pkgtup = (name, "x86_64", "0", "1", "1")
+        self.repo = repo
+        self.size = 4 * MB
+
+    def returnSimple(self, key):
+        if key == "installedsize":
+            return 10 * MB
+        raise KeyError(key)
+
+    def localPkg(self):
+        return "/var/cache/yum/packages/%s.rpm" % self.pkgtup[0]
+
+class FakeStatvfs(object):
+    def __init__(self, free):
+        self.f_bavail = free / 4096
+        self.f_frsize = 4096
+
+class PrefetchWindowTestCase(unittest.TestCase):
+    def setUp(self):
+        self.free = 0
+        self.statvfs = os.statvfs
+        os.statvfs = lambda path: FakeStatvfs(self.free)
+
+        repo = FakeRepo()
+        self.pkgs = [FakePackage("pkg%d" % i, repo) for i in range(20)]
+        # every package rpm has left to install takes 10 MB
+        self.total = 10 * MB * len(self.pkgs)
+
+    def tearDown(self):
+        os.statvfs = self.statvfs
+
+    def _window(self, prefetcher):
+        """ Return how many packages would be downloaded while rpm is busy
+            with the first one, using up free space as they are.
+        """
+        prefetcher.get(self.pkgs[0])
+        count = 0
+        while True:
+            po = prefetcher._nextPackage()
+            if po is None:
+                return count
+            prefetcher._done[po.pkgtup] = po.localPkg()
+            self.free -= po.size
+            count += 1
+
+    def testPlentyOfRoom(self):
+        """ Verify the prefetcher stays a full window ahead of rpm. """
+        self.free = self.total + 100 * MB
+        prefetcher = yuminstall.PackagePrefetcher(self.pkgs)
+        self.assertEqual(self._window(prefetcher), yuminstall.PREFETCH_AHEAD)
+
+    def testLittleRoom(self):
+        """ Verify downloads stop before rpm would run out of space. """
+        # room for everything rpm installs, plus three packages
+        self.free = self.total + 3 * 4 * MB + 4096
+        prefetcher = yuminstall.PackagePrefetcher(self.pkgs)
+        self.assertEqual(self._window(prefetcher), 3)
+
+    def testNoNetwork(self):
+        """ Verify packages from local repos are never downloaded. """
+        self.free = self.total + 100 * MB
+        local = FakeRepo(network=False)
+        for po in self.pkgs[1:5]:
+            po.repo = local
+        prefetcher = yuminstall.PackagePrefetcher(self.pkgs)
+        # the window counts packages rpm installs, not ones downloaded
+        self.assertEqual(self._window(prefetcher),
+                         yuminstall.PREFETCH_AHEAD - 4)
+
+class FakeProgressWindow(object):
+    def set(self, amount):
+        pass
+
+    def pop(self):
+        pass
+
+class FakeIntf(object):
+    def __init__(self):
+        self.messages = []
+
+    def progressWindow(self, title, text, total):
+        return FakeProgressWindow()
+
+    def messageWindow(self, title, text, **kwargs):
+        self.messages.append(title)
+
+class FakeAnaconda(object):
+    def __init__(self, rootPath):
+        self.intf = FakeIntf()
+        self.rootPath = rootPath
+
+class TinyCoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.image = yuminstall.TINYCORE_IMAGE
+        yuminstall.TINYCORE_IMAGE = os.path.join(self.tmpdir, "tinycore.gz")
+        self.anaconda = FakeAnaconda(self.tmpdir)
+
+        # a cpio that swallows its input, so only the image can be broken
+        bindir = os.path.join(self.tmpdir, "bin")
+        os.mkdir(bindir)
+        cpio = os.path.join(bindir, "cpio")
+        f = open(cpio, "w")
+        f.write("#!/bin/sh\ncat > /dev/null\n")
+        f.close()
+        os.chmod(cpio, 0755)
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = "%s:%s" % (bindir, self.path)
+
+    def tearDown(self):
+        os.environ["PATH"] = self.path
+        yuminstall.TINYCORE_IMAGE = self.image
+        shutil.rmtree(self.tmpdir)
+
+    def _writeImage(self, size=None):
+        gz = gzip.GzipFile(yuminstall.TINYCORE_IMAGE, "wb")
+        gz.write("tinycore\n" * 100000)
+        gz.close()
+        if size is not None:
+            f = open(yuminstall.TINYCORE_IMAGE, "r+b")
+            f.truncate(os.path.getsize(yuminstall.TINYCORE_IMAGE) + size)
+            f.close()
+
+    def _install(self):
+        yuminstall.YumBackend.doInstallTinyCore.im_func(None, self.anaconda)
+
+    def testInstall(self):
+        """ Verify an intact image is extracted without complaint. """
+        self._writeImage()
+        self._install()
+        self.assertEqual(self.anaconda.intf.messages, [])
+
+    def testTruncated(self):
+        """ Verify a truncated image is reported instead of raised. """
+        # cut into the trailing CRC and length
+        for size in (-2, -6, -1000):
+            self._writeImage(size)
+            self.anaconda.intf.messages = []
+            self.assertRaises(SystemExit, self._install)
+            self.assertEqual(self.anaconda.intf.messages, ["Error"])
+
+    def testHeaderOnly(self):
+        """ Verify an image cut off in its header is reported. """
+        self._writeImage()
+        f = open(yuminstall.TINYCORE_IMAGE, "r+b")
+        f.truncate(5)
+        f.close()
+        self.assertRaises(SystemExit, self._install)
+        self.assertEqual(self.anaconda.intf.messages, ["Error"])
+
+
+def suite():
+    return unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(PrefetchWindowTestCase),
+        unittest.TestLoader().loadTestsFromTestCase(TinyCoreTestCase)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,8 @@
 import os
 import sys
 import tempfile
+import threading
+import Queue
 
 import log_picker.archiving as archiving
 from log_picker.archiving import ArchivationError
@@ -17,18 +19,93 @@ class LogPickerError(Exception):
     pass
 
 
+class DumpSplitter(object):
+    """File object splitting an Anaconda dump into a file for each of the
+    files in it as it is written, without keeping it in memory.
+    A piece of the dump is handed to the done callback as soon as
+    it is complete."""
+    
+    def __init__(self, filename, get_tmp_file, done=None):
+        """@filename file for the start of the dump
+        @get_tmp_file function creating an unregistered temp file for a name
+        @done function called with the filename of every complete piece"""
+        self.get_tmp_file = get_tmp_file
+        self.done = done
+        self.files = []
+        self.empty_lines = 0
+        self.partial = ""
+        self._open(filename)
+    
+    def _open(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'w')
+        self.files.append(filename)
+    
+    def _finish(self):
+        self.file.close()
+        if self.done:
+            self.done(self.filename)
+    
+    def _new_piece(self, name):
+        # Pieces never overwrite another file, be it an earlier piece
+        # with the same name or some other log
+        tmpdir = os.path.dirname(self.filename)
+        unique = name
+        i = 1
+        while os.path.exists(os.path.join(tmpdir, unique)):
+            i += 1
+            unique = "%s-%d" % (name, i)
+        
+        self._finish()
+        self._open(self.get_tmp_file(unique))
+    
+    def _line(self, line):
+        striped = line.strip()
+        
+        if not striped:
+            self.empty_lines += 1
+        elif self.empty_lines > 1 and striped.startswith('/') \
+                        and striped.endswith(':') and len(line) > 2:
+            self._new_piece(striped[:-1].rsplit('/', 1)[-1])
+            self.empty_lines = 0
+        
+        self.file.write(line)
+    
+    def write(self, data):
+        lines = (self.partial + data).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self._line(line + '\n')
+    
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+    
+    def close(self):
+        if self.partial:
+            self._line(self.partial)
+            self.partial = ""
+        self._finish()
+
+
 class LogPicker(object):
 
     def __init__(self, archive_obj=None, sender_obj=None, miners=[], 
-                    use_one_file=False):
+                    use_one_file=False, pipeline=False):
+        """@pipeline run the independent miners concurrently and archive
+        logs as they are done, when every log has its own file"""
         self.sender_obj = sender_obj
         self.archive_obj = archive_obj
         self.miners = miners
+        self.pipeline = pipeline
         
         self.archive = None
         self.tmpdir = None
         self.files = []
         self.filename = self._get_tmp_file("completelog") if use_one_file else None
+        
+        self._writer = None
+        self._archive_error = None
 
     
     def _errprint(self, msg):
@@ -36,10 +113,16 @@ class LogPicker(object):
         sys.stderr.write('%s\n' % msg)
 
     
-    def _get_tmp_file(self, name, suffix="", register=True):
-        """Create temp file."""
+    def _get_tmpdir(self):
+        """Create temp dir, if there is none yet."""
         if not self.tmpdir:
             self.tmpdir = tempfile.mkdtemp(prefix="lp-logs-", dir="/tmp")
+        return self.tmpdir
+    
+    
+    def _get_tmp_file(self, name, suffix="", register=True):
+        """Create temp file."""
+        self._get_tmpdir()
                
         name += suffix
         filename = os.path.join(self.tmpdir, name)
@@ -52,6 +135,9 @@ class LogPicker(object):
     
     def create_archive(self, name=""):
         """Create archive (one file) containing multiple log files."""
+        if self._writer:
+            return self._close_archive(name)
+        
         name = name or self.tmpdir or "logs"
         self.archive = self._get_tmp_file(name, 
                             suffix=self.archive_obj.file_ext, register=False)
@@ -60,6 +146,52 @@ class LogPicker(object):
         except (ArchivationError):
             os.remove(self.archive)
             raise
+    
+    
+    def _open_archive(self):
+        """Start an archive to be filled in while the logs are collected."""
+        # Where create_archive() puts an unnamed archive
+        name = self._get_tmpdir()
+        self.archive = self._get_tmp_file(name, 
+                            suffix=self.archive_obj.file_ext, register=False)
+        self._writer = self.archive_obj.open_archive(self.archive)
+        self._archive_error = None
+    
+    
+    def _feed_archive(self, queue):
+        """Add the files put on queue to the archive, until None comes."""
+        while True:
+            filename = queue.get()
+            if filename is None:
+                return
+            if self._archive_error:
+                continue
+            try:
+                self._writer.add(filename)
+            except (ArchivationError):
+                self._archive_error = sys.exc_info()
+    
+    
+    def _close_archive(self, name=""):
+        """Finish the archive started by _open_archive()."""
+        writer = self._writer
+        self._writer = None
+        try:
+            if self._archive_error:
+                raise self._archive_error[0], self._archive_error[1], \
+                      self._archive_error[2]
+            writer.close()
+        except (ArchivationError):
+            writer.abort()
+            os.remove(self.archive)
+            raise
+        
+        if name:
+            # Where create_archive() puts a named archive
+            archive = os.path.join(self.tmpdir,
+                                   name + self.archive_obj.file_ext)
+            os.rename(self.archive, archive)
+            self.archive = archive
 
    
     def send(self):
@@ -81,9 +213,24 @@ class LogPicker(object):
         self.sender_obj.sendfile(file, contenttype)
 
     
+    def _run_miner(self, miner, f):
+        """Write the log of miner to the file object f."""
+        desc = "%s\n\n" % (miner.get_description())
+        f.write(desc)
+        try:
+            miner.set_logfile(f)
+            miner.getlog()
+        except (LogMinerError) as e:
+            self._errprint("Warning: %s - %s" % (miner._name, e))
+            f.write("\n%s\n\n\n" % e)
+    
+    
     def getlogs(self):
         """Collect logs generated by miners passed to the constructor."""
         
+        if self.pipeline and not self.filename:
+            return self._getlogs_pipeline()
+        
         # self.filename != None means that we should put all logs into one file.
         # self.filename == None means that every log should have its own file.
         if self.filename:
@@ -94,14 +241,7 @@ class LogPicker(object):
                 tmpfilename = self._get_tmp_file(miner.get_filename())
                 f = open(tmpfilename, 'w')
             
-            desc = "%s\n\n" % (miner.get_description())
-            f.write(desc)
-            try:
-                miner.set_logfile(f)
-                miner.getlog()
-            except (LogMinerError) as e:
-                self._errprint("Warning: %s - %s" % (miner._name, e))
-                f.write("\n%s\n\n\n" % e)
+            self._run_miner(miner, f)
             
             if not self.filename:
                 f.close()
@@ -113,34 +253,92 @@ class LogPicker(object):
             f.close()
     
            
-    def _cut_to_pieces(self, filename):
-        """Create multiple log files from Anaconda dump.
-        Attention: Anaconda dump file on input will be used and overwritten!
-        @filename file with Anaconda dump"""
-        actual_file = os.path.basename(filename)
-        files = {actual_file: []}
-        empty_lines = 0
+    def _getlogs_pipeline(self):
+        """Collect logs with the independent miners running in threads of
+        their own, while the others run one by one, splitting the Anaconda
+        dump as it is written and archiving every log as soon as it is
+        complete."""
+        queue = None
+        if self.archive_obj:
+            self._open_archive()
+            queue = Queue.Queue()
+            archiver = threading.Thread(target=self._feed_archive,
+                                        args=(queue,))
+            archiver.start()
+        
+        # Files of every miner, so they can be listed in the miners' order
+        jobs = []
+        for miner in self.miners:
+            filename = self._get_tmp_file(miner.get_filename(), register=False)
+            jobs.append((miner, filename, []))
         
-        # Split file into memmory
-        for line in open(filename):
-            striped = line.strip()
+        errors = []
+        def run(job):
+            (miner, filename, files) = job
+            def done(filename):
+                files.append(filename)
+                if queue:
+                    queue.put(filename)
             
-            if not striped:
-                empty_lines += 1
-            elif empty_lines > 1 and striped.startswith('/') \
-                            and striped.endswith(':') and len(line) > 2:
-                actual_file = striped[:-1].rsplit('/', 1)[-1]#.replace('.', '-')
-                files[actual_file] = []
-                empty_lines = 0
+            try:
+                if isinstance(miner, logmining.AnacondaLogMiner):
+                    get_tmp_file = lambda name: self._get_tmp_file(name,
+                                                            register=False)
+                    f = DumpSplitter(filename, get_tmp_file, done)
+                    self._run_miner(miner, f)
+                    f.close()
+                else:
+                    f = open(filename, 'w')
+                    self._run_miner(miner, f)
+                    f.close()
+                    done(filename)
+            except Exception:
+                # An exception can't leave a thread, it's raised below
+                errors.append(sys.exc_info())
+        
+        threads = []
+        try:
+            for job in jobs:
+                if job[0].is_independent():
+                    thread = threading.Thread(target=run, args=(job,))
+                    thread.start()
+                    threads.append(thread)
             
-            files[actual_file].append(line)
+            for job in jobs:
+                if not job[0].is_independent():
+                    run(job)
+        finally:
+            for thread in threads:
+                thread.join()
+            if queue:
+                queue.put(None)
+                archiver.join()
         
-        # Overwrite original file
-        actual_file = os.path.basename(filename)
-        open(filename, 'w').writelines(files[actual_file])
-        del files[actual_file]
+        for (miner, filename, files) in jobs:
+            self.files.extend(files)
+        
+        if errors:
+            if self._writer:
+                self._writer.abort()
+                self._writer = None
+                os.remove(self.archive)
+                self.archive = None
+            raise errors[0][0], errors[0][1], errors[0][2]
+    
+    
+    def _cut_to_pieces(self, filename):
+        """Create multiple log files from Anaconda dump.
+        Attention: Anaconda dump file on input will be used and overwritten!
+        @filename file with Anaconda dump"""
+        tmpfilename = filename + ".split"
+        get_tmp_file = lambda name: self._get_tmp_file(name, register=False)
+        splitter = DumpSplitter(tmpfilename, get_tmp_file)
         
-        # Write other individual files
-        for file in files:
-            open(self._get_tmp_file(file), 'w').writelines(files[file])
+        # One line at a time, pieces go straight to their files
+        with open(filename) as f:
+            splitter.writelines(f)
+        splitter.close()
         
+        os.rename(tmpfilename, filename)
+        for piece in splitter.files[1:]:
+            self.files.append(piece)
@@ -2,6 +2,15 @@ import os
 import tempfile
 import tarfile
 import bz2
+import zlib
+import struct
+import threading
+import Queue
+
+try:
+    import lzma
+except (ImportError):
+    lzma = None
 
 
 class ArchivationError(Exception):
@@ -10,6 +19,35 @@ class ArchivationError(Exception):
 class NoFilesArchivationError(ArchivationError):
     pass
 
+def _arcname(filename):
+    """Name of a file in the archive, its directory and basename."""
+    pieces = filename.rsplit('/', 2)
+    return "%s/%s" % (pieces[-2], pieces[-1])
+
+
+class ArchiveWriter(object):
+    """Takes the files of an archive one by one, while they are still being
+    collected. This one just remembers them and leaves the work to
+    create_archive() of the archive object when it is closed."""
+
+    def __init__(self, archive_obj, outfilename):
+        self.archive_obj = archive_obj
+        self.outfilename = outfilename
+        self.files = []
+
+    def add(self, filename):
+        """Add a complete file to the archive."""
+        self.files.append(filename)
+
+    def abort(self):
+        """Give up on the archive. There is nothing to clean up here."""
+        pass
+
+    def close(self):
+        """Finish the archive and return its filename."""
+        return self.archive_obj.create_archive(self.outfilename, self.files)
+
+
 class ArchiveBaseClass(object):
     """Base class for archive classes."""
 
@@ -39,15 +77,18 @@ class ArchiveBaseClass(object):
         _, tmpfile = tempfile.mkstemp(suffix=self._tar_ext)
         tar = tarfile.open(tmpfile, "w")
         for name in filelist:
-            pieces = name.rsplit('/', 2)
-            arcname = "%s/%s" % (pieces[-2], pieces[-1])
-            tar.add(name, arcname=arcname)
+            tar.add(name, arcname=_arcname(name))
         tar.close()
         return tmpfile
        
     def create_archive(self, outfilename, filelist):
         raise NotImplementedError()
 
+    def open_archive(self, outfilename):
+        """Return an ArchiveWriter for an archive to be filled in file by
+        file."""
+        return ArchiveWriter(self, outfilename)
+
 
 class Bzip2Archive(ArchiveBaseClass):
     """Class for bzip2 compression."""
@@ -98,3 +139,297 @@ class Bzip2Archive(ArchiveBaseClass):
         
         return outfilename
 
+
+CHUNK_SIZE = 1024 * 1024    # Data compressed at a time
+
+
+class _GzipMemberCompressor(object):
+    """Compressor object producing a complete gzip member."""
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._crc = zlib.crc32("")
+        self._size = 0
+        self._header = True
+
+    def compress(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        ret = self._compressor.compress(data)
+        if self._header:
+            # magic, deflate, no flags, no mtime, best compression, unix
+            ret = "\037\213\010\000\000\000\000\000\002\003" + ret
+            self._header = False
+        return ret
+
+    def flush(self):
+        ret = self.compress("") + self._compressor.flush()
+        return ret + struct.pack("<II", self._crc & 0xffffffffL,
+                                 self._size & 0xffffffffL)
+
+
+class _CompressedStream(object):
+    """File object compressing everything written to it into fileobj,
+    CHUNK_SIZE bytes at a time. With threads > 1 every chunk is compressed
+    into an independent stream by a pool of threads and the streams are
+    written one after another, which bzip2, gzip and xz all read back as
+    one file."""
+
+    def __init__(self, fileobj, compressor, threads=1):
+        """@compressor function returning a new compressor object"""
+        self.fileobj = fileobj
+        self.compressor = compressor
+        self.threads = threads
+        self.buf = []
+        self.buflen = 0
+        self.size = 0
+
+        if threads > 1:
+            self._queue = Queue.Queue(threads * 2)
+            self._results = Queue.Queue(threads * 2)
+            self._workers = []
+            for i in range(threads):
+                worker = threading.Thread(target=self._worker)
+                worker.start()
+                self._workers.append(worker)
+            self._writer = threading.Thread(target=self._write_results)
+            self._writer.start()
+            self._next = 0
+            self._error = None
+        else:
+            self._compressor = compressor()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            (index, data) = item
+            try:
+                compressor = self.compressor()
+                data = compressor.compress(data) + compressor.flush()
+            except Exception as e:
+                data = e
+            self._results.put((index, data))
+
+    def _write_results(self):
+        # Chunks come back in any order, they're written in the original one
+        pending = {}
+        written = 0
+        while True:
+            (index, data) = self._results.get()
+            if index is None:
+                return
+            pending[index] = data
+            while written in pending:
+                data = pending.pop(written)
+                written += 1
+                if self._error:
+                    continue
+                try:
+                    if isinstance(data, Exception):
+                        raise data
+                    self.fileobj.write(data)
+                except Exception as e:
+                    self._error = e
+
+    def _compress(self, data):
+        if self.threads > 1:
+            self._queue.put((self._next, data))
+            self._next += 1
+        else:
+            self.fileobj.write(self._compressor.compress(data))
+
+    def write(self, data):
+        self.size += len(data)
+        self.buf.append(data)
+        self.buflen += len(data)
+        if self.buflen >= CHUNK_SIZE:
+            data = "".join(self.buf)
+            while len(data) >= CHUNK_SIZE:
+                self._compress(data[:CHUNK_SIZE])
+                data = data[CHUNK_SIZE:]
+            self.buf = [data]
+            self.buflen = len(data)
+
+    def _stop(self):
+        for worker in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._results.put((None, None))
+        self._writer.join()
+
+    def abort(self):
+        """Stop compressing, without writing anything more."""
+        if self.threads > 1 and self._workers:
+            self._error = self._error or ArchivationError("Aborted.")
+            self._stop()
+            self._workers = []
+
+    def close(self):
+        if self.buflen or not self.size:
+            self._compress("".join(self.buf))
+        self.buf = []
+        self.buflen = 0
+
+        if self.threads > 1:
+            self._stop()
+            self._workers = []
+            if self._error:
+                raise ArchivationError("Compression failed: %s" % self._error)
+        else:
+            self.fileobj.write(self._compressor.flush())
+
+
+class StreamingArchiveWriter(ArchiveWriter):
+    """Writes the files straight into the compressed archive, one by one,
+    as they are added."""
+
+    def __init__(self, archive_obj, outfilename):
+        ArchiveWriter.__init__(self, archive_obj, outfilename)
+        self.size = 0
+        self.outfile = open(outfilename, 'wb')
+        self.stream = _CompressedStream(self.outfile,
+                                        archive_obj.new_compressor,
+                                        archive_obj.threads)
+        self.tar = None
+        if archive_obj.usetar:
+            self.tar = tarfile.open(fileobj=self.stream, mode="w|")
+
+    def add(self, filename):
+        """Add a complete file to the archive."""
+        if not self.tar and self.files:
+            self.abort()
+            raise ArchivationError("%s cannot archive multiple files "
+                                   "without tar." % self.archive_obj.name)
+        self.files.append(filename)
+
+        try:
+            if self.tar:
+                tarinfo = self.tar.gettarinfo(filename,
+                                              arcname=_arcname(filename))
+                self.size += tarinfo.size
+                if tarinfo.isreg():
+                    f = open(filename, 'rb')
+                    try:
+                        self.tar.addfile(tarinfo, f)
+                    finally:
+                        f.close()
+                else:
+                    self.tar.addfile(tarinfo)
+            else:
+                f = open(filename, 'rb')
+                try:
+                    while True:
+                        data = f.read(CHUNK_SIZE)
+                        if not data:
+                            break
+                        self.size += len(data)
+                        self.stream.write(data)
+                finally:
+                    f.close()
+        except (IOError, OSError, tarfile.TarError) as e:
+            self.abort()
+            raise ArchivationError("Cannot archive %s: %s" % (filename, e))
+
+    def abort(self):
+        """Give up on the archive."""
+        self.stream.abort()
+        if not self.outfile.closed:
+            self.outfile.close()
+
+    def close(self):
+        """Finish the archive and return its filename."""
+        if self.outfile.closed:
+            raise ArchivationError("Archive was not completed.")
+        try:
+            if self.tar:
+                self.tar.close()
+            self.stream.close()
+        finally:
+            # Also stops the compressor threads if closing failed
+            self.abort()
+
+        if self.size <= 0:
+            raise NoFilesArchivationError("No files to archive.")
+        return self.outfilename
+
+
+class StreamingArchive(ArchiveBaseClass):
+    """Base class for archives written in a single pass, with every file
+    going straight through the compressor into the output file, without
+    a temporary tar."""
+
+    name = ""
+    _compression = True
+
+    def __init__(self, usetar=True, threads=1, *args, **kwargs):
+        """@threads number of threads compressing chunks of the archive
+        at the same time"""
+        ArchiveBaseClass.__init__(self, args, kwargs)
+        self.usetar = usetar
+        self.threads = threads
+
+    @property
+    def file_ext(self):
+        """Return extension for output file."""
+        if self.usetar:
+            return "%s%s" % (self._tar_ext, self._ext)
+        return self._ext
+
+    def new_compressor(self):
+        """Return a new compressor object."""
+        raise NotImplementedError()
+
+    def open_archive(self, outfilename):
+        """Return an ArchiveWriter writing the archive as files are added."""
+        return StreamingArchiveWriter(self, outfilename)
+
+    def create_archive(self, outfilename, filelist):
+        """Create compressed archive containing files listed in filelist."""
+        if not filelist:
+            raise NoFilesArchivationError("No files to archive.")
+
+        writer = self.open_archive(outfilename)
+        for filename in filelist:
+            writer.add(filename)
+        return writer.close()
+
+
+class Bzip2StreamArchive(StreamingArchive):
+    """Class for bzip2 compression, in a single pass."""
+
+    name = "Bzip2"
+    _ext = ".bz2"
+    _mimetype = "application/x-bzip2"
+
+    def new_compressor(self):
+        return bz2.BZ2Compressor(9)
+
+
+class GzipStreamArchive(StreamingArchive):
+    """Class for gzip compression, in a single pass."""
+
+    name = "Gzip"
+    _ext = ".gz"
+    _mimetype = "application/x-gzip"
+
+    def new_compressor(self):
+        return _GzipMemberCompressor()
+
+
+class XzStreamArchive(StreamingArchive):
+    """Class for xz compression, in a single pass. Needs the lzma module."""
+
+    name = "Xz"
+    _ext = ".xz"
+    _mimetype = "application/x-xz"
+
+    def __init__(self, *args, **kwargs):
+        if lzma is None:
+            raise ArchivationError("xz compression is not available.")
+        StreamingArchive.__init__(self, *args, **kwargs)
+
+    def new_compressor(self):
+        return lzma.LZMACompressor()
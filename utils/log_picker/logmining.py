@@ -18,6 +18,7 @@ class LogMinerBaseClass(object):
     _description = "Description"
     _filename = "filename"
     _prefer_separate_file = True
+    _independent = False    # Can run concurrently with other miners
     
     def __init__(self, logfile=None, *args, **kwargs):
         """@logfile open file object. This open file object will be used for 
@@ -35,6 +36,11 @@ class LogMinerBaseClass(object):
         """Log description."""
         return cls._description
     
+    @classmethod
+    def is_independent(cls):
+        """True if the miner can run at the same time as any other."""
+        return cls._independent
+    
     def set_logfile(self, logfile):
         self.logfile = logfile
     
@@ -137,6 +143,7 @@ class FileSystemLogMiner(LogMinerBaseClass):
     _description = "Image of disc structure."
     _filename = "filesystem"
     _prefer_separate_file = True
+    _independent = True
 
     FSTREE_FORMAT = "%1s %6s%1s %s" # Format example: "d 1023.9K somedir"
     DADPOINT = 1                    # Number of Digits After the Decimal POINT
@@ -230,6 +237,7 @@ class DmSetupLsLogMiner(LogMinerBaseClass):
     _description = "Output from \"dmsetup ls --tree\"."
     _filename = "dmsetup-ls"
     _prefer_separate_file = True
+    _independent = True
 
     def _action(self):
         self._run_command("dmsetup ls --tree")
@@ -242,6 +250,7 @@ class DmSetupInfoLogMiner(LogMinerBaseClass):
     _description = "Output from \"dmsetup info -c\"."
     _filename = "dmsetup-info"
     _prefer_separate_file = True
+    _independent = True
 
     def _action(self):
         self._run_command("dmsetup info -c")